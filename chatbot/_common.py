@@ -0,0 +1,8 @@
+# Thêm thư mục common/ ở gốc repo vào sys.path để import các module dùng chung
+# (audio_io, http_client, voice_store, xtts_profile, singleflight, text_frontend, ...)
+import os
+import sys
+
+COMMON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common")
+if COMMON_DIR not in sys.path:
+    sys.path.append(COMMON_DIR)
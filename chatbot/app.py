@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 import os
 import tempfile
 import uuid
@@ -7,13 +7,15 @@ from dotenv import load_dotenv
 from datetime import datetime
 import json
 import logging  # Thêm logging để debug
+from concurrent.futures import ThreadPoolExecutor
 
 # Import các module
 from stt_v1 import SpeechToText
-# from tts_v1 import TextToSpeech  # Sử dụng file tts_v1.py (XTTS)
-from tts import TextToSpeech
+# Các backend TTS (ElevenLabs, XTTS, gTTS, Minimax, DupDub) được chọn qua biến môi trường TTS_BACKENDS
+from tts_router import build_router
 from llm import GeminiLLM
 from database import ChatDatabase
+from rate_limiter import limiter_stats
 
 # Cấu hình logging
 logging.basicConfig(level=logging.DEBUG)
@@ -37,13 +39,14 @@ os.makedirs(app.config['JS_FOLDER'], exist_ok=True)
 
 # Khởi tạo các module
 stt_module = SpeechToText(language="vi")
-# tts_module = TextToSpeech(
-#     model_path="model",  # Đảm bảo đường dẫn trỏ đến thư mục chứa mô hình XTTS
-# )
-tts_module = TextToSpeech(api_key = os.environ.get("ELEVEN_API_KEY"))
+# Ví dụ: TTS_BACKENDS=elevenlabs,minimax,gtts (thử theo độ trễ, tự chuyển backend khi lỗi)
+tts_module = build_router()
 llm_module = GeminiLLM(api_key=os.environ.get("GEMINI_API_KEY_1"))
 db = ChatDatabase()
 
+# Luồng tổng hợp giọng nói cho từng câu khi phản hồi đang được sinh (streaming)
+tts_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("TTS_STREAM_WORKERS", 4)))
+
 # Trang chủ
 @app.route('/')
 def index():
@@ -86,17 +89,14 @@ def process_audio():
         user_text = stt_module.transcribe(audio_path)
         logger.debug(f"Transcribed text: {user_text}")
         
-        # Lưu tin nhắn của người dùng vào database
+        # Lưu câu hỏi trước khi gọi Gemini để không mất khi truy vấn lỗi; lịch sử được đọc trước
+        # đó (như process_text_stream) để câu hỏi không bị gửi hai lần
+        turns = db.get_chat_turns(session_id)
         db.add_message(session_id, "user", user_text, audio_path)
         
-        # Lấy lịch sử hội thoại
-        conversation_history = db.format_conversation_history(session_id)
-        
-        # Truy vấn Gemini để lấy phản hồi
-        assistant_response = llm_module.get_response(user_text, conversation_history)
+        # Truy vấn Gemini trong phiên chat (lịch sử chỉ dùng khi phiên chưa có trong bộ nhớ)
+        assistant_response = llm_module.chat(session_id, user_text, load_history=lambda: turns)
         logger.debug(f"Assistant response: {assistant_response}")
-        
-        # Lưu tin nhắn của assistant vào database
         db.add_message(session_id, "assistant", assistant_response)
         
         # Tạo giọng nói từ phản hồi của assistant
@@ -104,32 +104,26 @@ def process_audio():
         output_filename = f"{uuid.uuid4()}.mp3"
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # Gọi text_to_speech với tham số phù hợp cho XTTS
+        # Tham số riêng của từng nhà cung cấp được cấu hình trong backend
         result = tts_module.text_to_speech(
             text=assistant_response,
             voice_name=voice_name,
-            output_path=output_path,
-            language="vi",  # Chỉ định tiếng Việt
-            temperature=0.3,  # Tham số XTTS
-            length_penalty=1.0,
-            repetition_penalty=10.0,
-            top_k=30,
-            top_p=0.85
+            output_path=output_path
         )
         
         if result is None:
             logger.error("TTS failed to generate audio")
             return jsonify({'error': 'Không thể tạo file audio'}), 500
         
-        logger.debug(f"Generated audio at: {output_path}")
+        logger.debug(f"Generated audio at: {result}")
         
-        # Trả về kết quả
+        # Trả về kết quả (đuôi file theo định dạng thật của backend: .mp3 hoặc .wav)
         return jsonify({
             'success': True,
             'session_id': session_id,
             'user_text': user_text,
             'assistant_response': assistant_response,
-            'audio_url': f"/static/outputs/{output_filename}"
+            'audio_url': f"/static/outputs/{os.path.basename(result)}"
         })
     
     except Exception as e:
@@ -155,63 +149,190 @@ def process_text():
         else:
             session_id = int(session_id)
         
-        # Lưu tin nhắn của người dùng vào database
+        # Lưu câu hỏi trước khi gọi Gemini để không mất khi truy vấn lỗi; lịch sử được đọc trước
+        # đó (như process_text_stream) để câu hỏi không bị gửi hai lần
+        turns = db.get_chat_turns(session_id)
         db.add_message(session_id, "user", user_text)
         
-        # Lấy lịch sử hội thoại
-        conversation_history = db.format_conversation_history(session_id)
-        
-        # Truy vấn Gemini để lấy phản hồi
-        assistant_response = llm_module.get_response(user_text, conversation_history)
+        # Truy vấn Gemini trong phiên chat (lịch sử chỉ dùng khi phiên chưa có trong bộ nhớ)
+        assistant_response = llm_module.chat(session_id, user_text, load_history=lambda: turns)
         logger.debug(f"Assistant response: {assistant_response}")
-        
-        # Lưu tin nhắn của assistant vào database
         db.add_message(session_id, "assistant", assistant_response)
         
         # Tạo giọng nói từ phản hồi của assistant
         output_filename = f"{uuid.uuid4()}.mp3"
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        # Gọi text_to_speech với tham số phù hợp cho XTTS
-        # result = tts_module.text_to_speech(
-        #     text=assistant_response,
-        #     voice_name=voice_name,
-        #     output_path=output_path,
-        #     # language="vi",  # Chỉ định tiếng Việt
-        #     temperature=0.3,
-        #     length_penalty=1.0,
-        #     repetition_penalty=10.0,
-        #     top_k=30,
-        #     top_p=0.85
-        # )
+        # Tham số riêng của từng nhà cung cấp được cấu hình trong backend
         result = tts_module.text_to_speech(
-            text = assistant_response, 
-            voice_name= voice_name,
-            output_path=output_path, 
-            model_id="eleven_flash_v2_5", 
-            speed=1.0, 
-            stability=0.5, 
-            similarity_boost=0.75
+            text=assistant_response,
+            voice_name=voice_name,
+            output_path=output_path
         )
         if result is None:
             logger.error("TTS failed to generate audio")
             return jsonify({'error': 'Không thể tạo file audio'}), 500
         
-        logger.debug(f"Generated audio at: {output_path}")
+        logger.debug(f"Generated audio at: {result}")
         
-        # Trả về kết quả
+        # Trả về kết quả (đuôi file theo định dạng thật của backend: .mp3 hoặc .wav)
         return jsonify({
             'success': True,
             'session_id': session_id,
             'user_text': user_text,
             'assistant_response': assistant_response,
-            'audio_url': f"/static/outputs/{output_filename}"
+            'audio_url': f"/static/outputs/{os.path.basename(result)}"
         })
     
     except Exception as e:
         logger.error(f"Error in process_text: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# API endpoint xử lý câu hỏi text dạng streaming: trả về từng dòng JSON (NDJSON) gồm các đoạn
+# text của phản hồi và link audio của từng câu ngay khi câu đó được tổng hợp xong
+@app.route('/api/process-text-stream', methods=['POST'])
+def process_text_stream():
+    data = request.json or {}
+    user_text = data.get('text')
+    session_id = data.get('session_id')
+    voice_name = data.get('voice', 'Seren')
+    
+    if not user_text:
+        return jsonify({'error': 'Không có nội dung text'}), 400
+    
+    if not session_id or session_id == 'new':
+        session_title = f"Hội thoại {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+        session_id = db.create_session(session_title)
+    else:
+        session_id = int(session_id)
+    
+    # Lịch sử được đọc khi tạo generator, trước khi lưu câu hỏi mới vào database
+    turns = db.get_chat_turns(session_id)
+    db.add_message(session_id, "user", user_text)
+    
+    audio_jobs = []
+    
+    def synthesize_sentence(sentence):
+        # Được gọi khi một câu hoàn chỉnh: tổng hợp ở luồng riêng trong lúc model viết tiếp
+        output_filename = f"{uuid.uuid4()}.mp3"
+        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        future = tts_executor.submit(tts_module.text_to_speech, text=sentence,
+                                     voice_name=voice_name, output_path=output_path)
+        audio_jobs.append((sentence, future))
+    
+    def audio_events(wait=False):
+        # Trả link audio theo đúng thứ tự câu (đuôi file theo định dạng thật của backend)
+        while audio_jobs and (wait or audio_jobs[0][1].done()):
+            sentence, future = audio_jobs.pop(0)
+            try:
+                result = future.result()
+            except Exception as e:
+                # Một câu lỗi không làm dừng cả phản hồi: báo lỗi cho câu đó rồi tiếp tục
+                logger.error(f"Error synthesizing sentence: {str(e)}", exc_info=True)
+                yield json.dumps({'type': 'error', 'sentence': sentence, 'error': str(e)},
+                                 ensure_ascii=False) + "\n"
+                continue
+            yield json.dumps({
+                'type': 'audio',
+                'sentence': sentence,
+                'audio_url': f"/static/outputs/{os.path.basename(result)}" if result else None
+            }, ensure_ascii=False) + "\n"
+    
+    def generate():
+        yield json.dumps({'type': 'session', 'session_id': session_id}) + "\n"
+        parts = []
+        try:
+            try:
+                chunks = llm_module.stream_chat(session_id, user_text, load_history=lambda: turns,
+                                                on_sentence=synthesize_sentence)
+                for text in chunks:
+                    parts.append(text)
+                    yield json.dumps({'type': 'text', 'text': text}, ensure_ascii=False) + "\n"
+                    yield from audio_events()
+            except Exception as e:
+                logger.error(f"Error in process_text_stream: {str(e)}", exc_info=True)
+                yield json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False) + "\n"
+            
+            yield from audio_events(wait=True)
+            yield json.dumps({'type': 'done', 'assistant_response': "".join(parts)}, ensure_ascii=False) + "\n"
+        finally:
+            # Lưu phần phản hồi đã sinh được cả khi lỗi giữa chừng hoặc client ngắt kết nối
+            if parts:
+                db.add_message(session_id, "assistant", "".join(parts))
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache'})
+
+# API endpoint streaming: chuyển tiếp audio từ ElevenLabs cho trình duyệt ngay khi nhận được.
+# Router chỉ trả về file hoàn chỉnh nên không stream được; khi ElevenLabs không có hoặc lỗi trước
+# khối audio đầu tiên, request được chuyển cho router (có fallback giữa các backend) và trả về cả file
+def _tts_via_router(text, voice_name):
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{uuid.uuid4()}.mp3")
+    result = tts_module.text_to_speech(text=text, voice_name=voice_name, output_path=output_path)
+    if result is None:
+        return jsonify({'error': 'Không thể tạo file audio'}), 502
+    mimetype = 'audio/wav' if result.endswith('.wav') else 'audio/mpeg'
+    response = send_file(os.path.abspath(result), mimetype=mimetype)
+    response.headers['X-Audio-Url'] = f"/static/outputs/{os.path.basename(result)}"
+    return response
+
+@app.route('/api/tts-stream', methods=['POST'])
+def tts_stream():
+    data = request.json or {}
+    text = data.get('text')
+    voice_name = data.get('voice', 'elli')
+    if not text:
+        return jsonify({'error': 'Không có nội dung text'}), 400
+    
+    elevenlabs = tts_module.get("elevenlabs")
+    if elevenlabs is None:
+        return _tts_via_router(text, voice_name)
+    
+    output_filename = f"{uuid.uuid4()}.mp3"
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    
+    try:
+        chunks = elevenlabs.tts.iter_speech(text, voice_name=voice_name)
+        # Lấy khối đầu tiên trước khi trả header để lỗi API vẫn trả về được mã lỗi HTTP
+        first_chunk = next(chunks)
+    except StopIteration:
+        logger.error("ElevenLabs stream returned no audio, falling back to the TTS router")
+        return _tts_via_router(text, voice_name)
+    except Exception as e:
+        logger.error(f"Error in tts_stream: {str(e)}, falling back to the TTS router", exc_info=True)
+        return _tts_via_router(text, voice_name)
+    
+    def generate():
+        # Đồng thời lưu file để có thể phát lại từ lịch sử
+        with open(output_path, 'wb') as f:
+            f.write(first_chunk)
+            yield first_chunk
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='audio/mpeg',
+        headers={
+            'X-Audio-Url': f"/static/outputs/{output_filename}",
+            'Cache-Control': 'no-cache',
+        },
+    )
+
+# API endpoint xem thống kê độ trễ / lỗi của các backend TTS
+@app.route('/api/tts/stats', methods=['GET'])
+def tts_stats():
+    return jsonify({
+        'backends': tts_module.stats(),
+        'order': [backend.name for backend in tts_module.rank()]
+    })
+
+# API endpoint xem thống kê hàng đợi giới hạn tốc độ (thời gian chờ, số lần bị từ chối / 429)
+@app.route('/api/limits', methods=['GET'])
+def limits():
+    return jsonify(limiter_stats())
+
 # API endpoint để lấy lịch sử chat
 @app.route('/api/session/<int:session_id>', methods=['GET'])
 def get_session(session_id):
@@ -231,6 +352,7 @@ def get_session(session_id):
 def delete_session(session_id):
     try:
         db.delete_session(session_id)
+        llm_module.reset_session(session_id)
         return jsonify({
             'success': True,
             'message': f'Đã xóa phiên chat {session_id}'
@@ -239,6 +361,14 @@ def delete_session(session_id):
         logger.error(f"Error in delete_session: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# API endpoint xem kích thước lịch sử gửi cho Gemini của một phiên chat
+@app.route('/api/session/<int:session_id>/llm-stats', methods=['GET'])
+def session_llm_stats(session_id):
+    stats = llm_module.session_stats(session_id)
+    if stats is None:
+        return jsonify({'error': 'Phiên chat chưa được nạp'}), 404
+    return jsonify(stats)
+
 # API endpoint để tạo phiên chat mới
 @app.route('/api/session', methods=['POST'])
 def create_session():
@@ -0,0 +1,508 @@
+import os
+import time
+import asyncio
+import argparse
+
+import aiohttp
+from google.api_core.exceptions import ResourceExhausted
+
+import _common  # noqa: F401 - thêm common/ vào sys.path
+import minimax_stream
+from llm import GeminiLLM
+from rate_limiter import get_limiter
+from voice_catalog import get_catalog
+
+# Mã lỗi được thử lại với thời gian chờ tăng dần (giống http_client)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Chu kỳ thử lại (giây) khi các chỗ gọi đồng thời dùng chung với limiter đồng bộ đang kín
+SLOT_POLL_INTERVAL = 0.05
+
+
+class AsyncProviderLimiter:
+    """
+    Phiên bản asyncio của rate_limiter.ProviderLimiter
+
+    Dùng chung token bucket và các chỗ gọi đồng thời (slots) với limiter đồng bộ của cùng
+    (provider, API key) nên tổng số request từ cả hai đường vẫn nằm trong hạn mức; chờ bằng
+    asyncio.sleep thay vì chặn luồng.
+    """
+
+    def __init__(self, provider, api_key, max_in_flight):
+        self.limiter = get_limiter(provider, api_key)
+        self.max_in_flight = max_in_flight
+        self._loop = None
+        self._local_slots = None
+
+    def _slots_for_loop(self):
+        # asyncio.Semaphore gắn với event loop đầu tiên dùng nó: tạo lại khi client được dùng
+        # trong loop khác (vd: mỗi lần run_bulk gọi asyncio.run)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._local_slots = asyncio.Semaphore(self.max_in_flight)
+        return self._local_slots
+
+    async def _acquire_shared_slot(self):
+        # Slot của limiter đồng bộ là threading.BoundedSemaphore: thử lấy không chặn, chưa có thì
+        # nhường event loop rồi thử lại
+        while not self.limiter._slots.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+    async def __aenter__(self):
+        local_slots = self._slots_for_loop()
+        await local_slots.acquire()
+        try:
+            await self._acquire_shared_slot()
+            try:
+                while True:
+                    delay = self.limiter.bucket.reserve()
+                    if delay == 0:
+                        break
+                    await asyncio.sleep(delay)
+            except BaseException:
+                self.limiter._slots.release()
+                raise
+        except BaseException:
+            local_slots.release()
+            raise
+        with self.limiter._lock:
+            self.limiter.calls += 1
+            self.limiter.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        with self.limiter._lock:
+            self.limiter.in_flight -= 1
+        self.limiter._slots.release()
+        self._local_slots.release()
+
+    def penalize(self, seconds):
+        self.limiter.penalize(seconds)
+
+
+class AsyncHTTPClient:
+    """
+    aiohttp session dùng chung: giữ kết nối keep-alive theo host, timeout và thử lại khi gặp 429/5xx
+
+    Session được tạo khi gọi lần đầu trong event loop đang chạy; gọi close() trước khi loop kết thúc.
+    """
+
+    def __init__(self, limit=200, limit_per_host=100, connect_timeout=5, read_timeout=60,
+                 retries=3, backoff_factor=0.5):
+        """
+        Args:
+            limit (int): Tổng số kết nối đồng thời tối đa
+            limit_per_host (int): Số kết nối đồng thời tối đa tới một host
+            connect_timeout (float): Thời gian chờ kết nối (giây)
+            read_timeout (float): Thời gian chờ giữa hai lần nhận dữ liệu (giây)
+            retries (int): Số lần thử lại tối đa
+            backoff_factor (float): Hệ số thời gian chờ giữa các lần thử lại
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def request(self, method, url, **kwargs):
+        """
+        Gửi request, thử lại khi lỗi kết nối hoặc gặp RETRY_STATUS
+
+        Returns:
+            aiohttp.ClientResponse: Phản hồi (người gọi đọc body rồi release / dùng async with)
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+                continue
+
+            if response.status not in RETRY_STATUS or attempt == self.retries:
+                return response
+            delay = self.backoff_factor * (2 ** attempt)
+            try:
+                delay = max(delay, float(response.headers.get("Retry-After", 0)))
+            except ValueError:
+                pass
+            response.release()
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_http = None
+
+
+def get_async_client():
+    """Trả về AsyncHTTPClient dùng chung"""
+    global _http
+    if _http is None:
+        _http = AsyncHTTPClient()
+    return _http
+
+
+class AsyncGeminiLLM(GeminiLLM):
+    """GeminiLLM với lời gọi generate_content_async, không giữ luồng trong lúc chờ phản hồi"""
+
+    def __init__(self, api_key=None, model_name="gemini-1.5-flash", max_in_flight=50):
+        """
+        Args:
+            api_key (str, optional): API key cho Gemini
+            model_name (str): Tên model Gemini
+            max_in_flight (int): Số request đồng thời tối đa
+        """
+        super().__init__(api_key=api_key, model_name=model_name)
+        self.async_limiter = AsyncProviderLimiter("gemini", self.api_key, max_in_flight)
+
+    async def get_response_async(self, user_query, conversation_history=""):
+        """
+        Lấy phản hồi từ model Gemini (async)
+
+        Args:
+            user_query (str): Câu hỏi của người dùng
+            conversation_history (str): Lịch sử hội thoại trước đó
+
+        Returns:
+            str: Câu trả lời từ model
+        """
+        prompt = self._build_prompt(user_query, conversation_history)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self.async_limiter:
+                        response = await self.model.generate_content_async(prompt)
+                    return response.text
+                except ResourceExhausted:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = 2.0 * (2 ** attempt)
+                    print(f"Gemini báo vượt hạn mức, thử lại sau {delay:.0f} giây")
+                    self.async_limiter.penalize(delay)
+        except Exception as e:
+            print(f"Lỗi khi truy vấn Gemini API: {str(e)}")
+            return f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
+
+
+def _ensure_dir(output_path):
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+
+class AsyncElevenLabsTTS:
+    """Client ElevenLabs async (cùng tham số với tts.TextToSpeech)"""
+
+    def __init__(self, api_key=None, max_in_flight=10, http=None):
+        """
+        Args:
+            api_key (str, optional): API key cho ElevenLabs
+            max_in_flight (int): Số request đồng thời tối đa (theo gói ElevenLabs)
+            http (AsyncHTTPClient, optional): Client HTTP (mặc định client dùng chung)
+        """
+        self.api_key = api_key or os.environ.get("ELEVEN_API_KEY")
+        if not self.api_key:
+            raise ValueError("Cần cung cấp ElevenLabs API key")
+        self.catalog = get_catalog()
+        self.http = http or get_async_client()
+        self.limiter = AsyncProviderLimiter("elevenlabs", self.api_key, max_in_flight)
+
+    def _build_request(self, text, voice_name, model_id, speed, stability, similarity_boost):
+        voice_id = self.catalog.resolve("elevenlabs", voice_name)
+        if voice_id is None:
+            raise ValueError(f"Không tìm thấy giọng: {voice_name}")
+        headers = {
+            "Accept": "audio/mpeg",
+            "Content-Type": "application/json",
+            "xi-api-key": self.api_key
+        }
+        data = {
+            "text": text,
+            "model_id": model_id,
+            "voice_settings": {
+                "speed": speed,
+                "stability": stability,
+                "similarity_boost": similarity_boost,
+                "style": 0.0,
+                "use_speaker_boost": True
+            }
+        }
+        return voice_id, headers, data
+
+    async def iter_speech(self, text, voice_name="elli", model_id="eleven_flash_v2_5", speed=1.0,
+                          stability=0.5, similarity_boost=0.75, chunk_size=4096):
+        """
+        Gọi endpoint streaming và trả về từng khối MP3 khi nhận được
+
+        Returns:
+            async generator: Các khối bytes MP3
+        """
+        voice_id, headers, data = self._build_request(text, voice_name, model_id, speed,
+                                                      stability, similarity_boost)
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
+        async with self.limiter:
+            response = await self.http.request("POST", url, json=data, headers=headers)
+            async with response:
+                if response.status != 200:
+                    if response.status == 429:
+                        self.limiter.penalize(5.0)
+                    body = await response.text()
+                    raise RuntimeError(f"ElevenLabs trả về lỗi {response.status}: {body[:200]}")
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+
+    async def text_to_speech(self, text, voice_name="elli", output_path="output.mp3", **kwargs):
+        """
+        Chuyển đổi văn bản thành giọng nói và lưu file
+
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        """
+        try:
+            _ensure_dir(output_path)
+            with open(output_path, "wb") as f:
+                async for chunk in self.iter_speech(text, voice_name=voice_name, **kwargs):
+                    f.write(chunk)
+            return output_path
+        except Exception as e:
+            print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
+            return None
+
+
+class AsyncMinimaxTTS:
+    """Client Minimax t2a_v2 async ở chế độ stream"""
+
+    def __init__(self, api_key=None, group_id=None, voice_id="Grinch", model="speech-02-hd",
+                 max_in_flight=10, http=None):
+        self.api_key = api_key or os.environ.get("api_minimax")
+        self.group_id = group_id or os.environ.get("group_id")
+        if not self.api_key or not self.group_id:
+            raise ValueError("Cần cung cấp Minimax API key và group_id")
+        self.voice_id = voice_id
+        self.model = model
+        self.http = http or get_async_client()
+        self.limiter = AsyncProviderLimiter("minimax", self.api_key, max_in_flight)
+
+    async def iter_speech(self, text, voice_id=None):
+        """
+        Trả về từng đoạn audio (đã giải mã hex) khi nhận được dòng SSE tương ứng
+
+        Returns:
+            async generator: Các khối bytes MP3
+        """
+        payload = {
+            "model": self.model,
+            "text": text,
+            "stream": True,
+            "subtitle_enable": False,
+            "voice_setting": {"voice_id": voice_id or self.voice_id, "speed": 1, "vol": 1, "pitch": 0},
+            "audio_setting": {"sample_rate": 32000, "bitrate": 128000, "format": "mp3", "channel": 1},
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        url = f"https://api.minimaxi.chat/v1/t2a_v2?GroupId={self.group_id}"
+        async with self.limiter:
+            response = await self.http.request("POST", url, json=payload, headers=headers)
+            async with response:
+                if response.status != 200:
+                    raise RuntimeError(f"Minimax trả về lỗi {response.status}")
+                # Dòng SSE có thể dài hơn giới hạn của readline (chứa audio hex), tự tách dòng
+                buffer = b""
+                async for data in response.content.iter_any():
+                    buffer += data
+                    *lines, buffer = buffer.split(b"\n")
+                    for line in lines:
+                        chunk = minimax_stream.parse_line(line)
+                        if chunk is None:
+                            return
+                        if chunk:
+                            yield chunk
+                if buffer.strip():
+                    chunk = minimax_stream.parse_line(buffer)
+                    if chunk:
+                        yield chunk
+
+    async def text_to_speech(self, text, voice_name=None, output_path="output.mp3"):
+        """
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        """
+        try:
+            _ensure_dir(output_path)
+            received = 0
+            with open(output_path, "wb") as f:
+                async for chunk in self.iter_speech(text, voice_id=voice_name):
+                    f.write(chunk)
+                    received += len(chunk)
+            if not received:
+                # Stream kết thúc mà không có audio: không để lại file rỗng như thể đã thành công
+                os.remove(output_path)
+                print("Minimax không trả về dữ liệu audio")
+                return None
+            return output_path
+        except Exception as e:
+            print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
+            return None
+
+
+class AsyncDupDubTTS:
+    """Client DupDub async: một lần gọi API cho nhiều câu, tải các file kết quả song song"""
+
+    url = "https://moyin-gateway.dupdub.com/tts/v1/playDemo/dubForSpeaker"
+
+    def __init__(self, api_key=None, speaker="uranus||||b4f0a08396ed164c2a7a9abfd1e4b02b",
+                 speed=0.85, max_in_flight=10, http=None):
+        self.api_key = api_key or os.environ.get("api_dupdub")
+        if not self.api_key:
+            raise ValueError("Cần cung cấp DupDub API key")
+        self.speaker = speaker
+        self.speed = speed
+        self.http = http or get_async_client()
+        self.limiter = AsyncProviderLimiter("dupdub", self.api_key, max_in_flight)
+
+    async def request_batch(self, text_list, speaker=None):
+        """
+        Returns:
+            list: Link file WAV của từng phần tử trong resList
+        """
+        payload = {
+            "speaker": speaker or self.speaker,
+            "speed": self.speed,
+            "pitch": 0,
+            "textList": text_list,
+            "source": "web",
+            "language": ""
+        }
+        headers = {"dupdub_token": self.api_key, "Content-Type": "application/json"}
+        async with self.limiter:
+            response = await self.http.request("POST", self.url, json=payload, headers=headers)
+            async with response:
+                if response.status != 200:
+                    raise RuntimeError(f"DupDub trả về lỗi {response.status}")
+                result = await response.json(content_type=None)
+        if result.get("code") != 200 or not (result.get("data") or {}).get("resList"):
+            raise RuntimeError(f"DupDub không trả về link audio: {result.get('msg')}")
+        return [item["result"]["ossFile"] for item in result["data"]["resList"]]
+
+    async def download(self, audio_url, output_path, chunk_size=65536):
+        response = await self.http.request("GET", audio_url)
+        async with response:
+            if response.status != 200:
+                raise RuntimeError(f"Không thể tải audio DupDub: {response.status}")
+            _ensure_dir(output_path)
+            with open(output_path, "wb") as f:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+        return output_path
+
+    async def synthesize_sentences(self, sentences, output_dir, speaker=None):
+        """
+        Tổng hợp nhiều câu trong một lần gọi API, tải các file song song
+
+        Returns:
+            list: Đường dẫn file WAV của từng câu (theo thứ tự)
+        """
+        audio_urls = await self.request_batch(list(sentences), speaker)
+        return await asyncio.gather(*[
+            self.download(audio_url, os.path.join(output_dir, f"part_{index:03d}.wav"))
+            for index, audio_url in enumerate(audio_urls)
+        ])
+
+    async def text_to_speech(self, text, voice_name=None, output_path="output.wav"):
+        """
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        """
+        try:
+            audio_urls = await self.request_batch([text], voice_name)
+            return await self.download(audio_urls[0], output_path)
+        except Exception as e:
+            print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
+            return None
+
+
+async def bulk_synthesize(client, items, concurrency=100):
+    """
+    Tổng hợp nhiều văn bản đồng thời trên một event loop
+
+    Args:
+        client: Client async có phương thức text_to_speech(text, voice_name, output_path)
+        items (list): Các tuple (text, voice_name, output_path)
+        concurrency (int): Số tác vụ chạy cùng lúc (hạn mức API vẫn do limiter của client quyết định)
+
+    Returns:
+        list: Kết quả theo đúng thứ tự items (đường dẫn file hoặc None nếu lỗi)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(text, voice_name, output_path):
+        async with semaphore:
+            return await client.text_to_speech(text, voice_name=voice_name, output_path=output_path)
+
+    return await asyncio.gather(*[run(*item) for item in items])
+
+
+def run_bulk(client_factory, items, concurrency=100):
+    """
+    Chạy bulk_synthesize từ code đồng bộ (script)
+
+    Args:
+        client_factory (callable): Hàm tạo client (gọi bên trong event loop)
+        items (list): Các tuple (text, voice_name, output_path)
+        concurrency (int): Số tác vụ chạy cùng lúc
+
+    Returns:
+        list: Kết quả theo thứ tự items
+    """
+    async def main():
+        client = client_factory()
+        try:
+            return await bulk_synthesize(client, items, concurrency)
+        finally:
+            await client.http.close()
+
+    return asyncio.run(main())
+
+
+CLIENTS = {
+    "elevenlabs": AsyncElevenLabsTTS,
+    "minimax": AsyncMinimaxTTS,
+    "dupdub": AsyncDupDubTTS,
+}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Tổng hợp hàng loạt: mỗi dòng của file đầu vào là một câu")
+    parser.add_argument("--input", required=True, help="File văn bản, mỗi dòng một câu")
+    parser.add_argument("--output-dir", default="audio_output/bulk", help="Thư mục lưu file audio")
+    parser.add_argument("--provider", default="elevenlabs", choices=list(CLIENTS), help="Nhà cung cấp TTS")
+    parser.add_argument("--voice", default=None, help="Tên giọng / voice_id")
+    parser.add_argument("--concurrency", type=int, default=100, help="Số tác vụ chạy cùng lúc")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    extension = "wav" if args.provider == "dupdub" else "mp3"
+    voice = args.voice or ("elli" if args.provider == "elevenlabs" else None)
+    items = [(line, voice, os.path.join(args.output_dir, f"{index:05d}.{extension}"))
+             for index, line in enumerate(lines)]
+
+    start = time.time()
+    results = run_bulk(CLIENTS[args.provider], items, args.concurrency)
+    succeeded = sum(1 for result in results if result)
+    print(f"Đã tạo {succeeded}/{len(items)} file sau {time.time() - start:.2f} giây")
@@ -166,6 +166,26 @@ class ChatDatabase:
         
         return formatted_history
     
+    def get_chat_turns(self, session_id):
+        """
+        Lấy lịch sử hội thoại dạng các lượt có vai trò (dùng cho phiên chat của Gemini)
+        
+        Args:
+            session_id (int): ID của phiên hội thoại
+            
+        Returns:
+            list: Các lượt {"role": "user" | "model", "parts": [nội dung]}, các tin nhắn liền nhau
+                cùng vai trò (vd: câu hỏi bị lỗi không có câu trả lời) được gộp thành một lượt
+        """
+        turns = []
+        for msg in self.get_session_history(session_id):
+            role = "user" if msg["role"] == "user" else "model"
+            if turns and turns[-1]["role"] == role:
+                turns[-1]["parts"][0] += f"\n{msg['content']}"
+            else:
+                turns.append({"role": role, "parts": [msg["content"]]})
+        return turns
+    
     def delete_session(self, session_id):
         """
         Xóa một phiên hội thoại và các tin nhắn của nó
@@ -1,15 +1,201 @@
 import google.generativeai as genai
 import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, closing
 from dotenv import load_dotenv
+from google.api_core.exceptions import ResourceExhausted
+from rate_limiter import get_limiter
+import _common  # noqa: F401 - thêm common/ vào sys.path
+import text_frontend
 load_dotenv()
+
+# Ranh giới câu khi đang stream: dấu câu + khoảng trắng (hoặc xuống dòng, hoặc "。") và đã có chữ
+# của câu sau, nên "3.5" hay dấu chấm ở cuối đoạn vừa nhận không bị coi là hết câu
+_STREAM_BOUNDARY = re.compile(r"(?<=[.!?…])\s+(?=\S)|\n+(?=\S)|(?<=。)\s*(?=\S)")
+_FALLBACK_SPLIT = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+# Ngân sách token (ước lượng) cho lịch sử gửi kèm mỗi lượt chat và số phiên giữ trong bộ nhớ
+CHAT_TOKEN_BUDGET = int(os.environ.get("GEMINI_CHAT_TOKEN_BUDGET", 4000))
+MAX_CHAT_SESSIONS = int(os.environ.get("GEMINI_MAX_CHAT_SESSIONS", 256))
+# Bản tóm tắt lịch sử được dùng tối đa 1/SUMMARY_BUDGET_RATIO ngân sách token
+SUMMARY_BUDGET_RATIO = 4
+
+def estimate_tokens(text):
+    """Ước lượng số token (tiếng Việt khoảng 3 ký tự / token) mà không cần gọi count_tokens"""
+    return len(text) // 3 + 1
+
+def merge_turns(turns):
+    """
+    Gộp các lượt liền nhau cùng vai trò (vd: tin nhắn người dùng không có câu trả lời do lỗi)
+
+    Gemini yêu cầu lịch sử xen kẽ user / model, và việc lược bỏ lịch sử theo cặp hỏi - đáp cũng
+    dựa vào điều đó.
+
+    Args:
+        turns (list): Các lượt {"role": ..., "parts": [nội dung]}
+
+    Returns:
+        list: Các lượt đã gộp (nội dung nối bằng xuống dòng)
+    """
+    merged = []
+    for turn in turns:
+        if merged and merged[-1]["role"] == turn["role"]:
+            merged[-1] = {"role": turn["role"], "parts": [f"{merged[-1]['parts'][0]}\n{turn['parts'][0]}"]}
+        else:
+            merged.append(turn)
+    return merged
+
+def split_sentences(text, lang_code="vi"):
+    """Tách câu bằng text_frontend, dùng regex khi không tách được (vd: thiếu underthesea)"""
+    try:
+        return text_frontend.split_sentences(text, lang_code)
+    except Exception:
+        return [part for part in _FALLBACK_SPLIT.split(text) if part.strip()]
+
+def truncate_to_tokens(text, max_tokens, lang_code="vi"):
+    """
+    Cắt văn bản về tối đa max_tokens (ước lượng), giữ trọn các câu đầu tiên
+
+    Args:
+        text (str): Văn bản cần cắt
+        max_tokens (int): Số token tối đa
+        lang_code (str): Mã ngôn ngữ dùng để tách câu
+
+    Returns:
+        str: Văn bản đã cắt
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept = ""
+    for sentence in split_sentences(text, lang_code):
+        candidate = f"{kept} {sentence.strip()}".strip()
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    if kept:
+        return kept
+    # Câu đầu tiên đã quá dài: cắt tại khoảng trắng cuối cùng trong giới hạn
+    max_chars = max(0, (max_tokens - 1) * 3)
+    return text[:max_chars].rsplit(" ", 1)[0]
+
+class ChatSession:
+    """Trạng thái một phiên chat: các lượt có vai trò và bản tóm tắt các lượt cũ đã bị lược bỏ"""
+    
+    def __init__(self, turns=None):
+        self.turns = merge_turns(turns or [])
+        self.summary = ""
+        self.lock = threading.Lock()
+        self.last_usage = None
+    
+    def tokens(self):
+        total = estimate_tokens(self.summary) if self.summary else 0
+        return total + sum(estimate_tokens(turn["parts"][0]) for turn in self.turns)
+    
+    def contents(self):
+        """Lịch sử gửi cho start_chat: bản tóm tắt (nếu có) rồi tới các lượt gần nhất"""
+        if not self.summary:
+            return merge_turns(self.turns)
+        return merge_turns([
+            {"role": "user", "parts": [f"Tóm tắt cuộc trò chuyện trước đó: {self.summary}"]},
+            {"role": "model", "parts": ["Vâng, tôi đã nắm được nội dung trước đó."]},
+        ] + self.turns)
+
+class LimitedStream:
+    """
+    Phản hồi stream của Gemini giữ một chỗ trong limiter cho đến khi được đọc hết hoặc bị đóng
+
+    send_message(..., stream=True) trả về ngay khi nhận được phần đầu, phần còn lại vẫn đang được
+    sinh: chỗ trong limiter chỉ được trả khi stream kết thúc để giới hạn số request đồng thời
+    áp dụng cả cho các lời gọi stream.
+    """
+    
+    def __init__(self, response, release):
+        self.response = response
+        self._release = release
+        self._release_lock = threading.Lock()
+    
+    def __iter__(self):
+        try:
+            yield from self.response
+        finally:
+            self.close()
+    
+    def close(self):
+        """Trả chỗ trong limiter (gọi nhiều lần cũng chỉ trả một lần)"""
+        with self._release_lock:
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+    
+    def __del__(self):
+        # Stream không được đọc hết và không được đóng (vd: client ngắt kết nối)
+        self.close()
+
+class SentenceStream:
+    """
+    Gom các token đang được sinh thành câu hoàn chỉnh và gọi callback cho từng câu
+
+    Một câu chỉ được coi là xong khi đã có chữ của câu sau (tránh cắt "3." trong "3.5"), câu cuối
+    được trả khi gọi flush(). Mỗi lần feed chỉ quét phần text mới sau ranh giới câu cuối cùng (bằng
+    regex, không qua text_frontend) nên tổng chi phí tuyến tính theo độ dài câu trả lời.
+    """
+    
+    def __init__(self, on_sentence, lang_code="vi", min_chars=20):
+        """
+        Args:
+            on_sentence (callable): Hàm nhận từng câu hoàn chỉnh
+            lang_code (str): Mã ngôn ngữ (giữ để tương thích, ranh giới câu dùng chung cho mọi ngôn ngữ)
+            min_chars (int): Câu ngắn hơn được gộp với câu sau (tránh gửi TTS các mẩu quá ngắn)
+        """
+        self.on_sentence = on_sentence
+        self.lang_code = lang_code
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.pending = ""
+        self._scan_from = 0
+    
+    def _emit(self, sentence):
+        sentence = f"{self.pending} {sentence}".strip() if self.pending else sentence.strip()
+        if len(sentence) < self.min_chars:
+            self.pending = sentence
+            return
+        self.pending = ""
+        self.on_sentence(sentence)
+    
+    def feed(self, text):
+        """Thêm một đoạn text mới nhận được"""
+        self.buffer += text
+        start = 0
+        # Khoảng trắng ở cuối lần trước có thể là đầu của ranh giới nên quét lại từ đó
+        for match in _STREAM_BOUNDARY.finditer(self.buffer, self._scan_from):
+            self._emit(self.buffer[start:match.start()])
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        self._scan_from = len(self.buffer.rstrip())
+    
+    def flush(self):
+        """Trả nốt phần còn lại khi model đã sinh xong"""
+        rest = f"{self.pending} {self.buffer}".strip()
+        self.pending = ""
+        self.buffer = ""
+        self._scan_from = 0
+        if rest:
+            self.on_sentence(rest)
+
 class GeminiLLM:
-    def __init__(self, api_key=None, model_name="gemini-1.5-flash"):
+    def __init__(self, api_key=None, model_name="gemini-1.5-flash", token_budget=CHAT_TOKEN_BUDGET,
+                 summarize_history=True):
         """
         Khởi tạo module LLM sử dụng Gemini API
         
         Args:
             api_key (str, optional): API key cho Gemini
             model_name (str): Tên model Gemini ("gemini-1.5-pro", "gemini-1.5-flash", etc.)
+            token_budget (int): Số token (ước lượng) tối đa của lịch sử gửi kèm mỗi lượt chat
+            summarize_history (bool): Tóm tắt các lượt cũ vượt ngân sách thay vì bỏ hẳn
         """
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
@@ -19,6 +205,10 @@ class GeminiLLM:
         self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
         
+        # Giới hạn tốc độ gọi theo API key để không vượt hạn mức (tránh lỗi 429)
+        self.limiter = get_limiter("gemini", self.api_key)
+        self.max_retries = 2
+        
         # System prompt mặc định
         self.system_prompt = """
         Bạn là một trợ lý gia sư thân thiện, chuyên môn trong việc giúp học sinh các cấp học từ tiểu học đến trung học phổ thông.
@@ -27,6 +217,13 @@ class GeminiLLM:
         Khi giải thích các khái niệm khó, hãy sử dụng ví dụ thực tế và liên hệ với cuộc sống hàng ngày.
         Khi trả lời, hãy giữ câu trả lời ngắn gọn, dễ hiểu và súc tích (tối đa 3-4 câu).
         """
+        
+        # Chế độ chat: system prompt đặt một lần qua system_instruction, lịch sử giữ theo từng phiên
+        self.token_budget = token_budget
+        self.summarize_history = summarize_history
+        self.chat_model = genai.GenerativeModel(model_name, system_instruction=self.system_prompt)
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
     
     def set_system_prompt(self, new_prompt):
         """
@@ -36,6 +233,18 @@ class GeminiLLM:
             new_prompt (str): System prompt mới
         """
         self.system_prompt = new_prompt
+        self.chat_model = genai.GenerativeModel(self.model_name, system_instruction=new_prompt)
+    
+    def _build_prompt(self, user_query, conversation_history=""):
+        """Tạo nội dung prompt từ system prompt, lịch sử và câu hỏi"""
+        return f"""
+            {self.system_prompt}
+            
+            Lịch sử trò chuyện:
+            {conversation_history}
+            
+            Câu hỏi của học sinh: {user_query}
+            """
     
     def get_response(self, user_query, conversation_history=""):
         """
@@ -49,18 +258,224 @@ class GeminiLLM:
             str: Câu trả lời từ model
         """
         try:
-            # Tạo nội dung cho prompt
-            conversation_context = f"""
-            {self.system_prompt}
+            response = self._generate(self._build_prompt(user_query, conversation_history))
+            return response.text
+        except Exception as e:
+            print(f"Lỗi khi truy vấn Gemini API: {str(e)}")
+            return f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
+    
+    def stream_response(self, user_query, conversation_history="", on_sentence=None):
+        """
+        Lấy phản hồi từ model Gemini theo từng đoạn ngay khi được sinh ra
+        
+        Args:
+            user_query (str): Câu hỏi của người dùng
+            conversation_history (str): Lịch sử hội thoại trước đó
+            on_sentence (callable, optional): Hàm được gọi với mỗi câu hoàn chỉnh (ví dụ để
+                gửi TTS câu đầu trong khi model vẫn đang viết các câu sau)
             
-            Lịch sử trò chuyện:
-            {conversation_history}
+        Returns:
+            generator: Các đoạn text theo thứ tự nhận được
+        """
+        splitter = SentenceStream(on_sentence) if on_sentence else None
+        try:
+            with closing(self._generate(self._build_prompt(user_query, conversation_history), stream=True)) as response:
+                for chunk in response:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if splitter:
+                        splitter.feed(text)
+                    yield text
+        except Exception as e:
+            print(f"Lỗi khi truy vấn Gemini API: {str(e)}")
+            message = f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
+            if splitter:
+                splitter.feed(message)
+            yield message
+        if splitter:
+            splitter.flush()
+    
+    def _get_session(self, session_id, load_history=None):
+        """Lấy phiên chat trong bộ nhớ, nạp từ lịch sử (nếu có) khi chưa có"""
+        with self._sessions_lock:
+            state = self.sessions.get(session_id)
+            if state is not None:
+                self.sessions.move_to_end(session_id)
+                return state
+        
+        # Nạp ngoài khóa chung để truy vấn database không chặn các phiên khác
+        state = ChatSession(load_history() if load_history else None)
+        with self._sessions_lock:
+            state = self.sessions.setdefault(session_id, state)
+            while len(self.sessions) > MAX_CHAT_SESSIONS:
+                self.sessions.popitem(last=False)
+        return state
+    
+    def reset_session(self, session_id):
+        """Xóa trạng thái của một phiên chat khỏi bộ nhớ"""
+        with self._sessions_lock:
+            self.sessions.pop(session_id, None)
+    
+    def _fit_budget(self, state):
+        """
+        Giữ lịch sử trong ngân sách token: khi vượt ngân sách, bỏ các lượt cũ nhất (theo cặp hỏi -
+        đáp) cho đến còn một nửa ngân sách và gộp chúng vào bản tóm tắt. Nhờ vậy việc tóm tắt chỉ
+        diễn ra thỉnh thoảng và phần đầu lịch sử giữ nguyên (được dùng lại) giữa các lượt.
+        """
+        if state.tokens() <= self.token_budget:
+            return
+        dropped = []
+        while state.tokens() > self.token_budget // 2 and len(state.turns) > 2:
+            dropped.extend(state.turns[:2])
+            del state.turns[:2]
+        if not dropped:
+            return
+        print(f"Lược bỏ {len(dropped)} lượt cũ khỏi lịch sử chat")
+        if self.summarize_history:
+            # Bản tóm tắt cũng phải nằm trong ngân sách: yêu cầu model viết ngắn, nếu vẫn dài thì
+            # cắt tại ranh giới câu
+            max_tokens = self.token_budget // SUMMARY_BUDGET_RATIO
+            summary = self._summarize(state.summary, dropped, max_tokens)
+            state.summary = truncate_to_tokens(summary, max_tokens)
+    
+    def _summarize(self, previous_summary, turns, max_tokens):
+        """Tóm tắt các lượt bị lược bỏ (cùng bản tóm tắt trước đó) thành vài câu"""
+        dialogue = "\n".join(
+            f"{'Học sinh' if turn['role'] == 'user' else 'Trợ lý'}: {turn['parts'][0]}" for turn in turns
+        )
+        prompt = f"""
+            Tóm tắt ngắn gọn (tối đa 5 câu, không quá {max_tokens * 3 // 5} từ) nội dung cuộc trò chuyện giữa học sinh và trợ lý gia sư dưới đây,
+            giữ lại các thông tin về học sinh và các kiến thức đã được giải thích.
             
-            Câu hỏi của học sinh: {user_query}
+            Tóm tắt trước đó:
+            {previous_summary}
+            
+            Hội thoại:
+            {dialogue}
             """
+        try:
+            return self._generate(prompt).text.strip()
+        except Exception as e:
+            print(f"Lỗi khi tóm tắt lịch sử chat: {str(e)}")
+            return previous_summary
+    
+    def chat(self, session_id, user_query, load_history=None):
+        """
+        Trả lời trong một phiên chat: chỉ gửi câu hỏi mới cùng các lượt đã có cấu trúc (không nối
+        chuỗi system prompt + toàn bộ lịch sử như get_response)
+        
+        Args:
+            session_id: ID phiên hội thoại
+            user_query (str): Câu hỏi của người dùng
+            load_history (callable, optional): Hàm trả về các lượt đã có (ví dụ
+                ChatDatabase.get_chat_turns), chỉ được gọi khi phiên chưa có trong bộ nhớ
             
-            response = self.model.generate_content(conversation_context)
-            return response.text
+        Returns:
+            str: Câu trả lời từ model
+        """
+        state = self._get_session(session_id, load_history)
+        with state.lock:
+            try:
+                self._fit_budget(state)
+                chat = self.chat_model.start_chat(history=state.contents())
+                response = self._call(chat.send_message, user_query)
+                text = response.text
+            except Exception as e:
+                print(f"Lỗi khi truy vấn Gemini API: {str(e)}")
+                return f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
+            state.last_usage = getattr(response, "usage_metadata", None)
+            state.turns.append({"role": "user", "parts": [user_query]})
+            state.turns.append({"role": "model", "parts": [text]})
+            return text
+    
+    def stream_chat(self, session_id, user_query, load_history=None, on_sentence=None):
+        """
+        Như chat nhưng trả về từng đoạn text ngay khi được sinh ra (xem stream_response)
+        
+        Returns:
+            generator: Các đoạn text theo thứ tự nhận được
+        """
+        state = self._get_session(session_id, load_history)
+        splitter = SentenceStream(on_sentence) if on_sentence else None
+        parts = []
+        try:
+            # Chỉ giữ khóa của phiên khi đọc / cập nhật lịch sử, không giữ qua yield: client ngắt kết
+            # nối giữa chừng (generator không được đóng) cũng không làm treo các request sau của phiên
+            with state.lock:
+                self._fit_budget(state)
+                history = state.contents()
+            chat = self.chat_model.start_chat(history=history)
+            with closing(self._call(chat.send_message, user_query, stream=True)) as response:
+                for chunk in response:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    parts.append(text)
+                    if splitter:
+                        splitter.feed(text)
+                    yield text
         except Exception as e:
             print(f"Lỗi khi truy vấn Gemini API: {str(e)}")
-            return f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
\ No newline at end of file
+            message = f"Xin lỗi, tôi đang gặp vấn đề kỹ thuật: {str(e)}"
+            if splitter:
+                splitter.feed(message)
+            yield message
+            parts = []
+        if parts:
+            # Hai lượt được thêm cùng lúc để lịch sử luôn xen kẽ hỏi - đáp
+            with state.lock:
+                state.turns.append({"role": "user", "parts": [user_query]})
+                state.turns.append({"role": "model", "parts": ["".join(parts)]})
+        if splitter:
+            splitter.flush()
+    
+    def session_stats(self, session_id):
+        """Số lượt, token ước lượng của lịch sử và token thực tế của lượt gần nhất"""
+        with self._sessions_lock:
+            state = self.sessions.get(session_id)
+        if state is None:
+            return None
+        usage = state.last_usage
+        return {
+            "turns": len(state.turns),
+            "summarized": bool(state.summary),
+            "history_tokens_estimate": state.tokens(),
+            "last_prompt_tokens": getattr(usage, "prompt_token_count", None),
+        }
+    
+    def _generate(self, contents, **kwargs):
+        """
+        Gọi generate_content qua limiter (xem _call)
+        
+        Returns:
+            GenerateContentResponse: Phản hồi từ Gemini
+        """
+        return self._call(self.model.generate_content, contents, **kwargs)
+    
+    def _call(self, fn, *args, **kwargs):
+        """
+        Gọi API Gemini qua limiter; khi vẫn bị 429 thì tạm dừng limiter và thử lại
+        
+        Args:
+            fn (callable): generate_content hoặc ChatSession.send_message
+            *args, **kwargs: Tham số của fn
+            
+        Returns:
+            GenerateContentResponse: Phản hồi từ Gemini (LimitedStream nếu stream=True)
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with ExitStack() as stack:
+                    stack.enter_context(self.limiter.acquire())
+                    response = fn(*args, **kwargs)
+                    if kwargs.get("stream"):
+                        # Giữ chỗ trong limiter cho đến khi stream được đọc hết hoặc bị đóng
+                        return LimitedStream(response, stack.pop_all().close)
+                    return response
+            except ResourceExhausted:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2.0 * (2 ** attempt)
+                print(f"Gemini báo vượt hạn mức, thử lại sau {delay:.0f} giây")
+                self.limiter.penalize(delay)
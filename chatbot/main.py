@@ -2,7 +2,6 @@ import sounddevice as sd
 import numpy as np
 import scipy.io.wavfile as wavfile
 from faster_whisper import WhisperModel
-import requests
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -11,6 +10,9 @@ import google.generativeai as genai
 import pygame
 from rich.console import Console
 from rich.panel import Panel
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from http_client import get_client
+from voice_catalog import get_catalog
 
 # Khởi tạo console để hiển thị đẹp hơn
 console = Console()
@@ -30,20 +32,9 @@ ELEVEN_API_KEY = os.getenv("api_text2speech")
 if not ELEVEN_API_KEY:
     raise ValueError("Bạn cần cung cấp api_text2speech trong file .env")
 
-# IDs giọng từ ElevenLabs
-VOICE_IDS = {
-    "callum": "N2lVS1w4EtoT3dr4eOWO",
-    "alice": "Xb7hH8MSUJpSbSDYk0k2",
-    "aria": "9BWtsMINqrJLrRacOk9x",
-    "rachel": "21m00Tcm4TlvDq8ikWAM",
-    "Bill": "pqHfZKP75CvOlQylNhV4",
-    "Brian": "nPczCjzI2devNBz1zQrb",
-    "Domi": "AZnzlk1XvdvUeBnXmlld",
-    "Elli": "MF3mGyEYCl7XYWbV9V6O",
-    "Nicole": "MF3mGyEYCl7XYWbV9V6O",
-    "Harry": "SOYHLrjzK2X1ezoPC6cr",
-    "Ethan": "g5CIjZEefAph4nQFvHAz"
-}
+# Danh sách giọng ElevenLabs (cache trên đĩa, làm mới ở nền)
+voice_catalog = get_catalog()
+VOICE_NAME = "Elli"  # Thay đổi thành giọng mong muốn
 
 # Cấu hình model Whisper và Gemini
 WHISPER_MODEL = "base"  # Có thể thay đổi thành "base", "small", "medium", "large" tùy nguồn lực
@@ -130,7 +121,8 @@ def text_to_speech_elevenlabs(text, voice_id, api_key, output_path="output.mp3")
     }
     
     try:
-        response = requests.post(url, json=data, headers=headers)
+        # Dùng lại kết nối keep-alive giữa các lượt hội thoại
+        response = get_client().post(url, json=data, headers=headers, provider="elevenlabs")
         
         if response.status_code == 200:
             # Đảm bảo thư mục tồn tại
@@ -173,7 +165,9 @@ def main():
     os.makedirs("audio_output", exist_ok=True)
     
     # Chọn giọng
-    selected_voice = VOICE_IDS["Elli"]  # Thay đổi thành giọng mong muốn
+    selected_voice = voice_catalog.resolve("elevenlabs", VOICE_NAME)
+    if selected_voice is None:
+        raise ValueError(f"Không tìm thấy giọng: {VOICE_NAME}")
     
     # Khởi tạo để lưu lịch sử trò chuyện
     conversation_history = ""
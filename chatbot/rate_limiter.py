@@ -0,0 +1,213 @@
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Mặc định theo hạn mức thấp nhất của các gói thường dùng, ghi đè bằng biến môi trường
+# <PROVIDER>_RPM, <PROVIDER>_BURST, <PROVIDER>_MAX_IN_FLIGHT (ví dụ GEMINI_RPM=60)
+DEFAULT_LIMITS = {
+    "gemini": {"rpm": 15, "burst": 3, "max_in_flight": 4},
+    "elevenlabs": {"rpm": 120, "burst": 5, "max_in_flight": 3},
+}
+FALLBACK_LIMITS = {"rpm": 60, "burst": 5, "max_in_flight": 4}
+
+# Thời gian tối đa một lời gọi được xếp hàng chờ trước khi bị từ chối (giây)
+MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 15))
+
+
+class RateLimitExceeded(Exception):
+    """Đã chờ quá MAX_WAIT mà vẫn chưa tới lượt gọi API"""
+
+
+class TokenBucket:
+    """Token bucket: nạp rate token mỗi giây, chứa tối đa capacity token"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        Lấy một token
+
+        Returns:
+            float: 0 nếu lấy được token, ngược lại là số giây cần chờ trước khi thử lại
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def block(self, seconds):
+        """Không cấp token trong seconds giây (khi API trả 429) và xả hết token đang có"""
+        with self._lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0
+            self.updated = self.blocked_until
+
+
+class ProviderLimiter:
+    """
+    Giới hạn tốc độ và số lời gọi đồng thời tới một API (theo nhà cung cấp + API key)
+
+    Lời gọi vượt hạn mức được xếp hàng chờ (tối đa max_wait giây) thay vì gửi đi rồi nhận 429.
+    """
+
+    def __init__(self, name, rpm, burst, max_in_flight, max_wait=MAX_WAIT, window=200):
+        """
+        Args:
+            name (str): Tên dùng trong thống kê
+            rpm (float): Số request tối đa mỗi phút
+            burst (int): Số request được gửi dồn liền nhau
+            max_in_flight (int): Số request đang chạy đồng thời tối đa
+            max_wait (float): Thời gian chờ tối đa trong hàng đợi (giây)
+            window (int): Số lần chờ gần nhất được giữ để tính thống kê
+        """
+        self.name = name
+        self.bucket = TokenBucket(rpm / 60.0, burst)
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    @contextmanager
+    def acquire(self):
+        """
+        Chờ tới lượt gọi API, giữ một chỗ trong số lời gọi đồng thời cho đến khi ra khỏi khối with
+
+        Raises:
+            RateLimitExceeded: Chờ quá max_wait giây
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._lock:
+            self.waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.max_wait):
+                self._reject(start)
+            try:
+                while True:
+                    delay = self.bucket.reserve()
+                    if delay == 0:
+                        break
+                    if time.monotonic() + delay > deadline:
+                        self._reject(start)
+                    time.sleep(delay)
+            except BaseException:
+                self._slots.release()
+                raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        with self._lock:
+            self._waits.append(time.monotonic() - start)
+            self.calls += 1
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _reject(self, start):
+        with self._lock:
+            self.rejected += 1
+        raise RateLimitExceeded(
+            f"{self.name}: đã chờ {time.monotonic() - start:.1f} giây nhưng vẫn vượt hạn mức"
+        )
+
+    def penalize(self, seconds):
+        """
+        Báo API vừa trả 429: tạm dừng cấp lượt gọi mới
+
+        Args:
+            seconds (float): Thời gian tạm dừng (giá trị Retry-After nếu có)
+        """
+        with self._lock:
+            self.throttled += 1
+        self.bucket.block(seconds)
+
+    def stats(self):
+        """Thống kê hàng đợi: số lời gọi, bị từ chối, bị 429 và thời gian chờ (giây)"""
+        with self._lock:
+            waits = sorted(self._waits)
+            result = {
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "throttled": self.throttled,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+            }
+        if waits:
+            result.update({
+                "wait_avg": sum(waits) / len(waits),
+                "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+                "wait_max": waits[-1],
+            })
+        return result
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limits_for(provider):
+    limits = dict(DEFAULT_LIMITS.get(provider, FALLBACK_LIMITS))
+    prefix = provider.upper().replace("-", "_")
+    limits["rpm"] = float(os.environ.get(f"{prefix}_RPM", limits["rpm"]))
+    limits["burst"] = int(os.environ.get(f"{prefix}_BURST", limits["burst"]))
+    limits["max_in_flight"] = int(os.environ.get(f"{prefix}_MAX_IN_FLIGHT", limits["max_in_flight"]))
+    return limits
+
+
+def get_limiter(provider, api_key=None):
+    """
+    Trả về limiter dùng chung cho một nhà cung cấp và API key (hạn mức tính theo từng key)
+
+    Args:
+        provider (str): Tên nhà cung cấp ("gemini", "elevenlabs", ...)
+        api_key (str, optional): API key (chỉ dùng hash để phân biệt, không lưu key)
+
+    Returns:
+        ProviderLimiter: Limiter của cặp (provider, key)
+    """
+    name = provider
+    if api_key:
+        name = f"{provider}:{hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:8]}"
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = ProviderLimiter(name, **_limits_for(provider))
+            _limiters[name] = limiter
+    return limiter
+
+
+def limiter_stats():
+    """Thống kê của mọi limiter đã tạo"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -1,7 +1,11 @@
 from faster_whisper import WhisperModel
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio, TARGET_SAMPLE_RATE
 
 class SpeechToText:
-    def __init__(self, model_size="tiny", device="cpu", compute_type="int8", language="vi"):
+    def __init__(self, model_size="tiny", device="cpu", compute_type="int8", language="vi",
+                 cascade_model_size=None, logprob_threshold=-0.6, no_speech_threshold=0.5,
+                 compression_ratio_threshold=2.4, cascade_padding=0.2):
         """
         Khởi tạo module Speech to Text với Whisper
         
@@ -10,10 +14,73 @@ class SpeechToText:
             device (str): Thiết bị tính toán ("cpu" hoặc "cuda")
             compute_type (str): Kiểu tính toán ("int8", "float16", "float32")
             language (str): Mã ngôn ngữ mặc định ("vi" cho Tiếng Việt)
+            cascade_model_size (str, optional): Model lớn hơn để giải mã lại các đoạn có độ tin cậy thấp
+                (None = không dùng cascade)
+            logprob_threshold (float): Đoạn có avg_logprob thấp hơn ngưỡng này sẽ được giải mã lại
+            no_speech_threshold (float): Đoạn có no_speech_prob cao hơn ngưỡng này và avg_logprob thấp
+                được coi là khoảng lặng và bị bỏ
+            compression_ratio_threshold (float): Đoạn có compression_ratio cao hơn (lặp từ) sẽ được giải mã lại
+            cascade_padding (float): Số giây thêm vào hai đầu đoạn khi giải mã lại
         """
         self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
         self.language = language
     
+        # Cascade: chỉ các đoạn kém tin cậy mới được chuyển sang model lớn
+        self.cascade_model = None
+        if cascade_model_size:
+            self.cascade_model = WhisperModel(cascade_model_size, device=device, compute_type=compute_type)
+        self.logprob_threshold = logprob_threshold
+        self.no_speech_threshold = no_speech_threshold
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.cascade_padding = cascade_padding
+
+        # Thống kê của lần gọi gần nhất và cộng dồn
+        self.last_stats = {}
+        self.total_stats = {"segments": 0, "escalated": 0, "audio_seconds": 0.0, "escalated_seconds": 0.0}
+
+    def _classify(self, segment):
+        """
+        Phân loại một đoạn theo độ tin cậy
+
+        Giống cách Whisper xử lý, no_speech_prob chỉ được tin khi avg_logprob cũng thấp: khi đó
+        đoạn gần như chắc chắn là khoảng lặng bị giải mã nhầm và bị bỏ (model lớn cũng chỉ bịa thêm
+        chữ). no_speech_prob cao nhưng model giải mã tự tin thì vẫn giữ nguyên.
+
+        Returns:
+            str: "silence" (bỏ đoạn), "escalate" (giải mã lại bằng model lớn) hoặc "keep"
+        """
+        low_logprob = segment.avg_logprob < self.logprob_threshold
+        if low_logprob and segment.no_speech_prob > self.no_speech_threshold:
+            return "silence"
+        if low_logprob or segment.compression_ratio > self.compression_ratio_threshold:
+            return "escalate"
+        return "keep"
+
+    def _redecode(self, audio, segments, first, last):
+        """
+        Giải mã lại một dải đoạn liền nhau segments[first:last + 1] bằng model lớn (một lần gọi)
+
+        Phần đệm cascade_padding không vượt quá đoạn đứng trước / sau dải, để văn bản mới không
+        lặp lại chữ của các đoạn được giữ nguyên.
+
+        Returns:
+            str: Văn bản mới thay cho toàn bộ dải
+        """
+        lower = segments[first - 1].end if first > 0 else 0.0
+        upper = segments[last + 1].start if last + 1 < len(segments) else len(audio) / TARGET_SAMPLE_RATE
+        start_time = max(lower, segments[first].start - self.cascade_padding)
+        end_time = min(upper, segments[last].end + self.cascade_padding)
+        clip = audio[int(start_time * TARGET_SAMPLE_RATE):int(end_time * TARGET_SAMPLE_RATE)]
+        if len(clip) == 0:
+            return " ".join(segment.text.strip() for segment in segments[first:last + 1])
+
+        redecoded, _ = self.cascade_model.transcribe(
+            clip,
+            language=self.language,
+            condition_on_previous_text=False,
+        )
+        return " ".join(s.text.strip() for s in redecoded)
+
     def transcribe(self, audio_file):
         """
         Chuyển đổi audio thành văn bản
@@ -24,10 +91,64 @@ class SpeechToText:
         Returns:
             str: Văn bản được chuyển đổi
         """
-        segments, info = self.model.transcribe(audio_file, language=self.language)
-        
-        full_text = ""
-        for segment in segments:
-            full_text += segment.text + " "
-        
-        return full_text.strip()
\ No newline at end of file
+        # File tải lên chỉ dùng một lần nên không cần cache trên đĩa
+        audio = load_audio(audio_file, use_cache=False)
+        segments, info = self.model.transcribe(audio, language=self.language)
+
+        if self.cascade_model is None:
+            texts = [segment.text.strip() for segment in segments]
+            segment_count = len(texts)
+            escalated = 0
+            escalated_seconds = 0.0
+        else:
+            segments = list(segments)
+            segment_count = len(segments)
+            labels = [self._classify(segment) for segment in segments]
+            texts = ["" if label == "silence" else segment.text.strip()
+                     for segment, label in zip(segments, labels)]
+
+            # Các đoạn cần giải mã lại nằm liền nhau được gộp thành một dải và giải mã một lần
+            escalated = 0
+            escalated_seconds = 0.0
+            i = 0
+            while i < segment_count:
+                if labels[i] != "escalate":
+                    i += 1
+                    continue
+                j = i
+                while j + 1 < segment_count and labels[j + 1] == "escalate":
+                    j += 1
+                texts[i] = self._redecode(audio, segments, i, j)
+                for k in range(i + 1, j + 1):
+                    texts[k] = ""
+                escalated += j - i + 1
+                escalated_seconds += segments[j].end - segments[i].start
+                i = j + 1
+
+        audio_seconds = len(audio) / TARGET_SAMPLE_RATE
+        self.last_stats = {
+            "segments": segment_count,
+            "escalated": escalated,
+            "escalated_ratio": escalated / segment_count if segment_count else 0.0,
+            "escalated_audio_ratio": escalated_seconds / audio_seconds if audio_seconds else 0.0,
+        }
+        self.total_stats["segments"] += segment_count
+        self.total_stats["escalated"] += escalated
+        self.total_stats["audio_seconds"] += audio_seconds
+        self.total_stats["escalated_seconds"] += escalated_seconds
+
+        return " ".join(text for text in texts if text)
+
+    def get_cascade_stats(self):
+        """
+        Lấy thống kê cascade cộng dồn
+
+        Returns:
+            dict: Số đoạn, số đoạn được giải mã lại và tỷ lệ tương ứng
+        """
+        stats = dict(self.total_stats)
+        stats["escalated_ratio"] = stats["escalated"] / stats["segments"] if stats["segments"] else 0.0
+        stats["escalated_audio_ratio"] = (
+            stats["escalated_seconds"] / stats["audio_seconds"] if stats["audio_seconds"] else 0.0
+        )
+        return stats
@@ -1,7 +1,8 @@
 import speech_recognition as sr
+import io
 import os
-from pydub import AudioSegment
-import tempfile
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio, wav_bytes
 
 class SpeechToText:
     def __init__(self, model_size=None, device=None, compute_type=None, language="vi"):
@@ -25,22 +26,16 @@ class SpeechToText:
             audio_file (str): Đường dẫn đến file âm thanh
             
         Returns:
-            str: Đường dẫn đến file WAV (file gốc hoặc file tạm nếu cần chuyển đổi)
+            str | io.BytesIO: Đường dẫn file gốc nếu đã là WAV chuẩn, ngược lại là WAV 16kHz mono trong bộ nhớ
         """
         # Kiểm tra đuôi file
         file_ext = os.path.splitext(audio_file)[1].lower()
         
-        # Nếu không phải WAV hoặc là WAV không chuẩn, chuyển đổi
+        # Nếu không phải WAV hoặc là WAV không chuẩn, chuyển đổi trong bộ nhớ (không tạo file tạm)
         if file_ext != '.wav' or self._check_wav_format(audio_file) is False:
             try:
-                # Tạo tên file tạm thời
-                temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False).name
-                
-                # Chuyển đổi sang WAV
-                sound = AudioSegment.from_file(audio_file)
-                sound.export(temp_wav, format="wav", parameters=["-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1"])
-                
-                return temp_wav
+                audio = load_audio(audio_file, use_cache=False)
+                return io.BytesIO(wav_bytes(audio))
             except Exception as e:
                 print(f"Lỗi khi chuyển đổi file âm thanh: {e}")
                 # Nếu chuyển đổi thất bại, vẫn trả về file gốc
@@ -78,7 +73,6 @@ class SpeechToText:
             str: Văn bản được chuyển đổi
         """
         converted_file = self.convert_to_wav(audio_file)
-        temp_file_created = converted_file != audio_file
         
         try:
             with sr.AudioFile(converted_file) as source:
@@ -97,11 +91,4 @@ class SpeechToText:
         except sr.RequestError as e:
             return f"Lỗi khi kết nối đến dịch vụ Google Speech Recognition: {e}"
         except Exception as e:
-            return f"Lỗi khi xử lý âm thanh: {e}"
-        finally:
-            # Xóa file tạm nếu đã tạo
-            if temp_file_created and os.path.exists(converted_file):
-                try:
-                    os.remove(converted_file)
-                except:
-                    pass
\ No newline at end of file
+            return f"Lỗi khi xử lý âm thanh: {e}"
\ No newline at end of file
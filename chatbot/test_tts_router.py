@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+pytest.importorskip("torch")
+pytest.importorskip("unidecode")
+
+import _common  # noqa: F401 - thêm common/ vào sys.path
+import text_frontend
+import tts_v1
+from tts_router import TTSRouter, XttsBackend
+
+
+class FakeModel:
+    """Model XTTS giả: mỗi câu sinh 0.1 giây im lặng ở 24kHz"""
+
+    def inference(self, text, language, gpt_cond_latent, speaker_embedding, **kwargs):
+        return {"wav": np.zeros(2400, dtype=np.float32)}
+
+
+class FakeVoiceStore:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def precompute(self, paths):
+        return 0
+
+    def get_latents(self, voice_path):
+        return None, None
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    # Giọng mẫu mặc định trong thư mục model (các giọng trong tts_v1.voices không có khi test)
+    sf.write(str(tmp_path / "vi_sample.wav"), np.zeros(2400, dtype=np.float32), 24000)
+    monkeypatch.setattr(tts_v1.TextToSpeech, "_load_model", lambda self: setattr(self, "model", FakeModel()))
+    monkeypatch.setattr(tts_v1.TextToSpeech, "_warmup", lambda self: None)
+    monkeypatch.setattr(tts_v1, "VoiceLatentStore", FakeVoiceStore)
+    monkeypatch.setattr(text_frontend, "prepare", lambda paragraph, lang_code, normalize: (paragraph,))
+    backend = XttsBackend(model_path=str(tmp_path))
+    return TTSRouter([backend], hedge=False)
+
+
+def test_router_xtts_writes_wav(router, tmp_path):
+    result = router.text_to_speech("Xin chào các bạn", "seren", str(tmp_path / "out" / "reply.mp3"))
+
+    assert result == str(tmp_path / "out" / "reply.wav")
+    assert sf.info(result).format == "WAV"
+    assert sf.info(result).frames == 2400
+    assert not [name for name in os.listdir(tmp_path / "out") if ".part" in name]
+    assert router.stats()["xtts"]["error_rate"] == 0.0
+
+
+def test_router_empty_text_returns_none(router, tmp_path, monkeypatch):
+    assert router.text_to_speech("   ", "seren", str(tmp_path / "empty.mp3")) is None
+
+    # Văn bản không còn câu nào sau khi tách: backend không ghi file, router coi là lỗi
+    monkeypatch.setattr(text_frontend, "prepare", lambda paragraph, lang_code, normalize: ())
+    assert router.text_to_speech("...", "seren", str(tmp_path / "dots.mp3")) is None
+    assert not os.path.exists(tmp_path / "dots.wav")
@@ -1,7 +1,10 @@
-import requests
 import os
 import json
 import time
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from http_client import get_client
+from rate_limiter import get_limiter
+from voice_catalog import get_catalog
 
 class TextToSpeech:
     def __init__(self, api_key=None):
@@ -15,20 +18,19 @@ class TextToSpeech:
         if not self.api_key:
             raise ValueError("Cần cung cấp ElevenLabs API key")
         
-        # IDs giọng từ ElevenLabs
-        self.voices = {
-            "callum": "N2lVS1w4EtoT3dr4eOWO",
-            "alice": "Xb7hH8MSUJpSbSDYk0k2",
-            "aria": "9BWtsMINqrJLrRacOk9x",
-            "rachel": "21m00Tcm4TlvDq8ikWAM",
-            "bill": "pqHfZKP75CvOlQylNhV4",
-            "brian": "nPczCjzI2devNBz1zQrb",
-            "domi": "AZnzlk1XvdvUeBnXmlld",
-            "elli": "MF3mGyEYCl7XYWbV9V6O",
-            "nicole": "MF3mGyEYCl7XYWbV9V6O",
-            "harry": "SOYHLrjzK2X1ezoPC6cr",
-            "ethan": "g5CIjZEefAph4nQFvHAz"
-        }
+        # Danh sách giọng ElevenLabs: cache trên đĩa, làm mới ở nền, tra cứu từ bộ nhớ
+        self.catalog = get_catalog()
+        
+        # Kết nối keep-alive dùng chung, có timeout và tự thử lại khi gặp 429/5xx
+        self.http = get_client()
+        
+        # Giới hạn tốc độ và số request đồng thời theo hạn mức của API key
+        self.limiter = get_limiter("elevenlabs", self.api_key)
+    
+    @property
+    def voices(self):
+        """Dictionary tên giọng -> ID (từ catalog trong bộ nhớ)"""
+        return self.catalog.voices("elevenlabs")
     
     def get_available_voices(self):
         """
@@ -39,29 +41,17 @@ class TextToSpeech:
         """
         return self.voices
     
-    def text_to_speech(self, text, voice_name="elli", output_path="output.mp3", 
-                       model_id="eleven_flash_v2_5", speed=1.0, stability=0.5, 
-                       similarity_boost=0.75):
+    def _build_request(self, text, voice_name, model_id, speed, stability, similarity_boost):
         """
-        Chuyển đổi văn bản thành giọng nói sử dụng ElevenLabs API
+        Tạo headers và body cho request ElevenLabs
         
-        Args:
-            text (str): Văn bản cần chuyển đổi
-            voice_name (str): Tên giọng (key trong dict voices)
-            output_path (str): Đường dẫn lưu file audio
-            model_id (str): ID model ElevenLabs
-            speed (float): Tốc độ nói (0.5-2.0)
-            stability (float): Độ ổn định (0.0-1.0)
-            similarity_boost (float): Tăng độ tương đồng (0.0-1.0)
-            
         Returns:
-            str: Đường dẫn đến file audio hoặc None nếu lỗi
+            tuple: (voice_id, headers, data)
         """
         if voice_name.lower() not in self.voices:
             raise ValueError(f"Không tìm thấy giọng: {voice_name}. Giọng có sẵn: {list(self.voices.keys())}")
         
         voice_id = self.voices[voice_name.lower()]
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
         
         headers = {
             "Accept": "audio/mpeg",
@@ -80,25 +70,163 @@ class TextToSpeech:
                 "use_speaker_boost": True
             }
         }
+        return voice_id, headers, data
+    
+    def text_to_speech(self, text, voice_name="elli", output_path="output.mp3", 
+                       model_id="eleven_flash_v2_5", speed=1.0, stability=0.5, 
+                       similarity_boost=0.75):
+        """
+        Chuyển đổi văn bản thành giọng nói sử dụng ElevenLabs API
+        
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            voice_name (str): Tên giọng (key trong dict voices)
+            output_path (str): Đường dẫn lưu file audio
+            model_id (str): ID model ElevenLabs
+            speed (float): Tốc độ nói (0.5-2.0)
+            stability (float): Độ ổn định (0.0-1.0)
+            similarity_boost (float): Tăng độ tương đồng (0.0-1.0)
+            
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        """
+        voice_id, headers, data = self._build_request(text, voice_name, model_id, speed,
+                                                      stability, similarity_boost)
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        
+        # Request trùng nhau được gộp ở TTSRouter.text_to_speech (áp dụng cho mọi backend)
+        audio = self._fetch_audio(url, data, headers)
+        if audio is None:
+            return None
         
         try:
-            response = requests.post(url, json=data, headers=headers)
+            # Đảm bảo thư mục tồn tại
+            output_dir = os.path.dirname(output_path)
+            if output_dir and not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+                
+            # Lưu file audio
+            with open(output_path, 'wb') as f:
+                f.write(audio)
+            
+            return output_path
+        except Exception as e:
+            print(f"Lỗi khi lưu file audio: {str(e)}")
+            return None
+    
+    def _fetch_audio(self, url, data, headers):
+        """
+        Gọi ElevenLabs API và trả về dữ liệu audio
+        
+        Returns:
+            bytes: Dữ liệu MP3 hoặc None nếu lỗi
+        """
+        try:
+            with self.limiter.acquire():
+                response = self.http.post(url, json=data, headers=headers, provider="elevenlabs")
+            self._check_throttled(response)
             
             if response.status_code == 200:
-                # Đảm bảo thư mục tồn tại
-                output_dir = os.path.dirname(output_path)
-                if output_dir and not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
-                    
-                # Lưu file audio
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                
-                return output_path
+                return response.content
             else:
                 print(f"Lỗi: {response.status_code}")
                 print(response.text)
                 return None
         except Exception as e:
             print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+    
+    def iter_speech(self, text, voice_name="elli", model_id="eleven_flash_v2_5", speed=1.0,
+                    stability=0.5, similarity_boost=0.75, chunk_size=4096, optimize_streaming_latency=None):
+        """
+        Gọi endpoint streaming của ElevenLabs và trả về dữ liệu MP3 theo từng khối khi đang tải
+        
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            voice_name (str): Tên giọng (key trong dict voices)
+            model_id (str): ID model ElevenLabs
+            speed, stability, similarity_boost (float): Tham số giọng nói
+            chunk_size (int): Kích thước mỗi khối đọc từ phản hồi (byte)
+            optimize_streaming_latency (int, optional): Mức tối ưu độ trễ của ElevenLabs (0-4)
+            
+        Returns:
+            generator: Các khối bytes MP3
+            
+        Raises:
+            RuntimeError: Khi API trả về lỗi (trước khi có khối dữ liệu nào)
+        """
+        voice_id, headers, data = self._build_request(text, voice_name, model_id, speed,
+                                                      stability, similarity_boost)
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
+        params = {}
+        if optimize_streaming_latency is not None:
+            params["optimize_streaming_latency"] = optimize_streaming_latency
+        
+        # Giữ chỗ trong số request đồng thời cho đến khi tải xong toàn bộ audio
+        with self.limiter.acquire():
+            response = self.http.post(url, json=data, headers=headers, params=params,
+                                      stream=True, provider="elevenlabs-stream")
+            try:
+                self._check_throttled(response)
+                if response.status_code != 200:
+                    raise RuntimeError(f"ElevenLabs trả về lỗi {response.status_code}: {response.text[:200]}")
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        yield chunk
+            finally:
+                response.close()
+    
+    def _check_throttled(self, response):
+        """Vẫn nhận 429 sau khi đã thử lại: tạm dừng limiter theo Retry-After"""
+        if response.status_code == 429:
+            try:
+                delay = float(response.headers.get("Retry-After", 5))
+            except ValueError:
+                delay = 5.0
+            self.limiter.penalize(delay)
+    
+    def text_to_speech_stream(self, text, sink, voice_name="elli", output_path=None, **kwargs):
+        """
+        Chuyển đổi văn bản thành giọng nói và chuyển tiếp từng khối audio cho sink ngay khi nhận được
+        
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            sink: Hàm nhận bytes hoặc đối tượng có phương thức write (HTTP response, file, trình phát)
+            voice_name (str): Tên giọng (key trong dict voices)
+            output_path (str, optional): Đồng thời lưu toàn bộ audio ra file này
+            **kwargs: Tham số khác của iter_speech
+            
+        Returns:
+            dict: Thống kê (first_chunk_time, total_time, bytes) hoặc None nếu lỗi
+        """
+        write = sink if callable(sink) else sink.write
+        start_time = time.time()
+        first_chunk_time = None
+        total_bytes = 0
+        out = None
+        try:
+            if output_path:
+                output_dir = os.path.dirname(output_path)
+                if output_dir:
+                    os.makedirs(output_dir, exist_ok=True)
+                out = open(output_path, 'wb')
+            
+            for chunk in self.iter_speech(text, voice_name=voice_name, **kwargs):
+                if first_chunk_time is None:
+                    first_chunk_time = time.time() - start_time
+                write(chunk)
+                if out is not None:
+                    out.write(chunk)
+                total_bytes += len(chunk)
+            
+            return {
+                "first_chunk_time": first_chunk_time,
+                "total_time": time.time() - start_time,
+                "bytes": total_bytes,
+            }
+        except Exception as e:
+            print(f"Lỗi khi streaming text to speech: {str(e)}")
+            return None
+        finally:
+            if out is not None:
+                out.close()
\ No newline at end of file
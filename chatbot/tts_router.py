@@ -0,0 +1,524 @@
+import os
+import io
+import time
+import wave
+import random
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import _common  # noqa: F401 - thêm common/ vào sys.path
+import dupdub_tts
+import minimax_tts
+from singleflight import SingleFlight, make_key
+from voice_catalog import get_catalog
+
+
+class TTSBackend:
+    """
+    Giao diện chung của một nhà cung cấp TTS
+
+    Lớp con cài đặt synthesize: ghi audio ra output_path và trả về đường dẫn, hoặc raise khi lỗi
+    (router cần ngoại lệ để tính tỷ lệ lỗi, không dùng giá trị None như các module cũ).
+    params chứa các tham số ảnh hưởng đến audio tạo ra (dùng làm khóa gộp request trùng nhau),
+    audio_format là định dạng file synthesize ghi ra ("mp3" hoặc "wav").
+    """
+
+    name = "backend"
+    params = {}
+    audio_format = "mp3"
+
+    def synthesize(self, text, voice_name, output_path):
+        raise NotImplementedError
+
+    def get_available_voices(self):
+        return {}
+
+
+class ElevenLabsBackend(TTSBackend):
+    """ElevenLabs qua module tts.TextToSpeech"""
+
+    name = "elevenlabs"
+
+    def __init__(self, api_key=None, default_voice="elli", model_id="eleven_flash_v2_5",
+                 speed=1.0, stability=0.5, similarity_boost=0.75):
+        from tts import TextToSpeech
+        self.tts = TextToSpeech(api_key=api_key)
+        self.default_voice = default_voice
+        self.params = dict(model_id=model_id, speed=speed, stability=stability,
+                           similarity_boost=similarity_boost)
+
+    def synthesize(self, text, voice_name, output_path):
+        if not voice_name or voice_name.lower() not in self.tts.voices:
+            voice_name = self.default_voice
+        result = self.tts.text_to_speech(text=text, voice_name=voice_name,
+                                         output_path=output_path, **self.params)
+        if result is None:
+            raise RuntimeError("ElevenLabs không trả về audio")
+        return result
+
+    def get_available_voices(self):
+        return self.tts.get_available_voices()
+
+
+class XttsBackend(TTSBackend):
+    """Model XTTS chạy cục bộ qua module tts_v1.TextToSpeech (ghi file WAV)"""
+
+    name = "xtts"
+    audio_format = "wav"
+
+    def __init__(self, model_path="model", default_voice="seren", **params):
+        from tts_v1 import TextToSpeech
+        self.tts = TextToSpeech(model_path=model_path)
+        self.default_voice = default_voice
+        self.params = dict(temperature=0.3, length_penalty=1.0, repetition_penalty=10.0,
+                           top_k=30, top_p=0.85)
+        self.params.update(params)
+        # Một model dùng chung cho mọi luồng (executor của router, app.py): mỗi lúc chỉ một lần
+        # inference, vì model XTTS không an toàn khi gọi đồng thời và chạy song song cũng không nhanh hơn
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, voice_name, output_path):
+        if not voice_name or voice_name.lower() not in self.tts.voices:
+            voice_name = self.default_voice
+        with self._lock:
+            result = self.tts.text_to_speech(text=text, language="vietnamese", voice_name=voice_name.lower(),
+                                             output_path=output_path, **self.params)
+        if result is None:
+            raise RuntimeError("XTTS không tạo được audio")
+        return result
+
+    def get_available_voices(self):
+        return self.tts.get_available_voices()
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS (gTTS), chỉ có một giọng cho mỗi ngôn ngữ"""
+
+    name = "gtts"
+
+    def __init__(self, language="vi"):
+        self.language = language
+        self.params = {"language": language}
+
+    def synthesize(self, text, voice_name, output_path):
+        from gtts import gTTS
+        gTTS(text=text, lang=self.language, slow=False).save(output_path)
+        return output_path
+
+    def get_available_voices(self):
+        return {"gtts": self.language}
+
+
+class MinimaxBackend(TTSBackend):
+    """Minimax t2a_v2 ở chế độ stream qua module dùng chung minimax_tts"""
+
+    name = "minimax"
+
+    def __init__(self, api_key=None, group_id=None, voice_id="Grinch", model="speech-02-hd"):
+        self.api_key = api_key or os.environ.get("api_minimax")
+        self.group_id = group_id or os.environ.get("group_id")
+        if not self.api_key or not self.group_id:
+            raise ValueError("Cần cung cấp Minimax API key và group_id")
+        self.voice_id = voice_id
+        self.model = model
+        self.params = {"voice_id": voice_id, "model": model}
+
+    def synthesize(self, text, voice_name, output_path):
+        return minimax_tts.synthesize_minimax(text, self.api_key, self.group_id, output_path,
+                                              voice_id=self.voice_id, model=self.model)
+
+    def get_available_voices(self):
+        return {self.voice_id: self.voice_id}
+
+
+class DupDubBackend(TTSBackend):
+    """
+    DupDub qua module dùng chung dupdub_tts: tách câu, gộp lô, tải các file song song rồi ghép WAV
+
+    Giọng được tra trong voice catalog theo voice_name, không có thì dùng speaker mặc định.
+    """
+
+    name = "dupdub"
+    audio_format = "wav"
+
+    def __init__(self, api_key=None, speaker="uranus||||b4f0a08396ed164c2a7a9abfd1e4b02b", speed=0.85):
+        self.api_key = api_key or os.environ.get("api_dupdub")
+        if not self.api_key:
+            raise ValueError("Cần cung cấp DupDub API key")
+        self.speaker = speaker
+        self.speed = speed
+        self.params = {"speaker": speaker, "speed": speed}
+        self.catalog = get_catalog()
+
+    def synthesize(self, text, voice_name, output_path):
+        speaker = self.catalog.resolve("dupdub", voice_name) or self.speaker
+        return dupdub_tts.synthesize_dupdub(text, self.api_key, speaker, output_path=output_path,
+                                            speed=self.speed)
+
+    def get_available_voices(self):
+        voices = dict(self.catalog.voices("dupdub"))
+        voices.setdefault("dupdub", self.speaker)
+        return voices
+
+
+class StubBackend(TTSBackend):
+    """
+    Backend giả lập để chạy thử router khi không có mạng: ghi WAV im lặng sau một độ trễ ngẫu nhiên
+    """
+
+    audio_format = "wav"
+
+    def __init__(self, name="stub", latency=0.2, jitter=0.1, fail_rate=0.0, sample_rate=16000):
+        """
+        Args:
+            name (str): Tên backend
+            latency (float): Độ trễ trung bình (giây)
+            jitter (float): Độ lệch ngẫu nhiên tối đa của độ trễ (giây)
+            fail_rate (float): Xác suất raise lỗi (0.0-1.0)
+            sample_rate (int): Tần số lấy mẫu của file WAV
+        """
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.sample_rate = sample_rate
+
+    def synthesize(self, text, voice_name, output_path):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.name}: lỗi giả lập")
+        # Khoảng 60ms cho mỗi ký tự, giống độ dài câu nói thật
+        num_samples = int(self.sample_rate * 0.06 * len(text))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(b"\x00\x00" * num_samples)
+        with open(output_path, "wb") as f:
+            f.write(buffer.getvalue())
+        return output_path
+
+    def get_available_voices(self):
+        return {self.name: self.name}
+
+
+class BackendStats:
+    """Thống kê trượt về độ trễ và lỗi của một backend"""
+
+    def __init__(self, window=50):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = thành công
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, latency, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_errors = 0
+        else:
+            self.consecutive_errors += 1
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def snapshot(self):
+        return {
+            "samples": len(self.latencies),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": round(self.error_rate(), 3),
+            "consecutive_errors": self.consecutive_errors,
+            "in_cooldown": self.cooldown_until > time.time(),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+class TTSRouter:
+    """
+    Chọn nhà cung cấp TTS theo độ trễ và tỷ lệ lỗi thực tế
+
+    - Mỗi request được gửi tới backend khỏe có độ trễ trung vị thấp nhất (backend chưa có dữ liệu
+      được ưu tiên thử để có thống kê).
+    - Nếu request chưa xong sau p95 của backend đó, gửi thêm một request dự phòng (hedge) tới
+      backend tiếp theo và dùng kết quả về trước.
+    - Backend lỗi thì tự chuyển sang backend kế tiếp; lỗi liên tiếp nhiều lần (hoặc tỷ lệ lỗi trượt
+      quá cao) thì tạm ngưng backend đó trong một khoảng thời gian, sau đó thử lại.
+
+    Có cùng phương thức text_to_speech / get_available_voices với tts.TextToSpeech để app.py dùng thay thế.
+    """
+
+    def __init__(self, backends, hedge=True, min_samples=5, max_error_rate=0.5,
+                 failure_threshold=3, cooldown=30.0, window=50, max_workers=8):
+        """
+        Args:
+            backends (list): Các TTSBackend, theo thứ tự ưu tiên khi chưa có thống kê
+            hedge (bool): Có gửi request dự phòng khi backend chính chậm hơn p95 hay không
+            min_samples (int): Số mẫu tối thiểu trước khi dùng p95 để hedge
+            max_error_rate (float): Tỷ lệ lỗi trượt tối đa trước khi tạm ngưng backend
+            failure_threshold (int): Số lỗi liên tiếp trước khi tạm ngưng backend
+            cooldown (float): Thời gian tạm ngưng (giây)
+            window (int): Số lần gọi gần nhất được giữ để tính thống kê
+            max_workers (int): Số luồng gọi backend đồng thời
+        """
+        if not backends:
+            raise ValueError("Cần ít nhất một backend TTS")
+        self.backends = list(backends)
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._stats = {backend.name: BackendStats(window) for backend in self.backends}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-router")
+        # Gộp các request giống hệt nhau đang chạy đồng thời (cùng văn bản, giọng, tham số backend)
+        self.single_flight = SingleFlight()
+        self._backend_params = [(backend.name, backend.params) for backend in self.backends]
+
+    def get(self, name):
+        """Trả về backend theo tên hoặc None"""
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+
+    def get_available_voices(self):
+        """Hợp danh sách giọng của mọi backend (backend đứng trước được ưu tiên khi trùng tên)"""
+        voices = {}
+        for backend in reversed(self.backends):
+            voices.update(backend.get_available_voices())
+        return voices
+
+    def _is_healthy(self, stats, now):
+        # Hết thời gian tạm ngưng thì backend được thử lại; lỗi tiếp sẽ bị tạm ngưng ngay
+        return stats.cooldown_until <= now
+
+    def rank(self):
+        """
+        Sắp xếp backend theo thứ tự sẽ thử
+
+        Returns:
+            list: Backend khỏe theo độ trễ trung vị tăng dần, sau đó là các backend không khỏe
+                (vẫn được thử khi mọi backend khỏe đều lỗi)
+        """
+        now = time.time()
+        with self._lock:
+            order = {backend.name: index for index, backend in enumerate(self.backends)}
+            healthy, unhealthy = [], []
+            for backend in self.backends:
+                stats = self._stats[backend.name]
+                target = healthy if self._is_healthy(stats, now) else unhealthy
+                p50 = stats.percentile(0.5)
+                if p50 is None:
+                    # Chưa gọi lần nào: thử trước để có thống kê; chỉ toàn lỗi: xếp cuối
+                    p50 = float("inf") if stats.outcomes else 0.0
+                target.append((p50, order[backend.name], backend))
+        return [item[2] for item in sorted(healthy, key=lambda x: x[:2])] + \
+               [item[2] for item in sorted(unhealthy, key=lambda x: x[:2])]
+
+    def _record(self, name, latency, ok):
+        with self._lock:
+            stats = self._stats[name]
+            stats.record(latency, ok)
+            too_many_errors = (len(stats.outcomes) >= self.min_samples
+                               and stats.error_rate() > self.max_error_rate)
+            if not ok and (stats.consecutive_errors >= self.failure_threshold or too_many_errors):
+                stats.cooldown_until = time.time() + self.cooldown
+                print(f"Tạm ngưng backend TTS {name} trong {self.cooldown:.0f} giây")
+
+    def _hedge_delay(self, name):
+        with self._lock:
+            stats = self._stats[name]
+            if len(stats.latencies) < self.min_samples:
+                return None
+            return stats.percentile(0.95)
+
+    def _run(self, backend, text, voice_name, output_path):
+        """Gọi một backend, ghi thống kê và trả về (backend, đường dẫn file)"""
+        start = time.time()
+        try:
+            result = backend.synthesize(text, voice_name, output_path)
+            if not result or not os.path.exists(result):
+                raise RuntimeError(f"{backend.name} không tạo ra file audio")
+        except Exception:
+            self._record(backend.name, time.time() - start, ok=False)
+            raise
+        self._record(backend.name, time.time() - start, ok=True)
+        return backend, result
+
+    def _submit(self, backend, text, voice_name, output_path, attempt):
+        # Mỗi lần gọi ghi ra file riêng để request dự phòng không ghi đè lên nhau; giữ đuôi định dạng
+        # thật ở cuối vì một số thư viện (soundfile, ...) chọn định dạng theo đuôi file
+        part_path = f"{os.path.splitext(output_path)[0]}.{backend.name}.{attempt}.part.{backend.audio_format}"
+        future = self._executor.submit(self._run, backend, text, voice_name, part_path)
+        future.part_path = part_path
+        return future
+
+    def text_to_speech(self, text, voice_name=None, output_path="output.mp3"):
+        """
+        Chuyển văn bản thành giọng nói bằng backend tốt nhất hiện tại
+
+        Các request trùng văn bản, giọng và tham số backend đến trong lúc một request đang chạy
+        chỉ chờ kết quả của request đó rồi sao chép file sang output_path của mình.
+
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            voice_name (str, optional): Tên giọng (backend không có giọng này dùng giọng mặc định)
+            output_path (str): Đường dẫn lưu file audio; phần đuôi được thay theo định dạng thật
+                của backend tạo ra audio (vd: output.mp3 thành output.wav khi dùng XTTS)
+
+        Returns:
+            str: Đường dẫn thật của file audio hoặc None nếu mọi backend đều lỗi
+        """
+        key = make_key(text, (voice_name or "").strip().lower(), self._backend_params)
+        result, shared = self.single_flight.do(key, self._synthesize, text, voice_name, output_path)
+        if not shared or result is None:
+            return result
+
+        print("Dùng chung kết quả TTS với request đang chạy")
+        target_path = os.path.splitext(output_path)[0] + os.path.splitext(result)[1]
+        try:
+            shutil.copyfile(result, target_path)
+        except OSError as e:
+            print(f"Lỗi khi sao chép file audio: {str(e)}")
+            return None
+        return target_path
+
+    def _synthesize(self, text, voice_name, output_path):
+        """Gọi backend theo thứ tự rank(), có hedge và chuyển backend khi lỗi"""
+        if not text or not text.strip():
+            print("Không có văn bản để chuyển thành giọng nói")
+            return None
+
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        candidates = self.rank()
+        pending = set()
+        attempt = 0
+        winner = None
+        hedged = False
+
+        def launch():
+            nonlocal attempt
+            backend = candidates.pop(0)
+            attempt += 1
+            future = self._submit(backend, text, voice_name, output_path, attempt)
+            pending.add(future)
+            return backend
+
+        final_path = None
+        primary = launch()
+        hedge_delay = self._hedge_delay(primary.name) if self.hedge else None
+
+        while pending and winner is None:
+            timeout = hedge_delay if (hedge_delay is not None and candidates) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            hedge_delay = None
+
+            if not done:
+                # Backend chính chậm hơn p95: gửi thêm request dự phòng
+                with self._lock:
+                    self._stats[primary.name].hedged += 1
+                hedge_backend = launch()
+                hedged = True
+                print(f"TTS {primary.name} chậm, gửi thêm request tới {hedge_backend.name}")
+                continue
+
+            for future in done:
+                pending.discard(future)
+                try:
+                    backend, part_path = future.result()
+                except Exception as e:
+                    print(f"Lỗi backend TTS: {str(e)}")
+                    continue
+                winner = backend
+                final_path = f"{os.path.splitext(output_path)[0]}.{backend.audio_format}"
+                os.replace(part_path, final_path)
+                break
+
+            if winner is None and not pending and candidates:
+                # Mọi request đang chạy đều lỗi: chuyển sang backend kế tiếp
+                launch()
+
+        # Request còn lại (bên thua khi hedge) tiếp tục chạy để lấy thống kê, file tạm bị xóa khi xong
+        for future in pending:
+            future.add_done_callback(_remove_part)
+
+        if winner is None:
+            print("Tất cả backend TTS đều lỗi")
+            return None
+        if hedged and winner is not primary:
+            with self._lock:
+                self._stats[winner.name].hedge_wins += 1
+        return final_path
+
+    def stats(self):
+        """Thống kê của từng backend (độ trễ p50/p95, tỷ lệ lỗi, số lần hedge)"""
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+
+def _remove_part(future):
+    try:
+        os.remove(future.part_path)
+    except OSError:
+        pass
+
+
+# Hàm tạo backend theo tên dùng trong biến môi trường TTS_BACKENDS
+BACKEND_FACTORIES = {
+    "elevenlabs": lambda: ElevenLabsBackend(api_key=os.environ.get("ELEVEN_API_KEY")),
+    "xtts": lambda: XttsBackend(model_path=os.environ.get("XTTS_MODEL_PATH", "model")),
+    "gtts": GTTSBackend,
+    "minimax": MinimaxBackend,
+    "dupdub": DupDubBackend,
+    "stub": StubBackend,
+    "stub-slow": lambda: StubBackend(name="stub-slow", latency=1.0, jitter=0.8),
+    "stub-flaky": lambda: StubBackend(name="stub-flaky", latency=0.3, fail_rate=0.3),
+}
+
+
+def build_router(names=None, **kwargs):
+    """
+    Tạo router từ danh sách tên backend
+
+    Args:
+        names (str hoặc list, optional): Tên các backend, cách nhau bởi dấu phẩy
+            (mặc định biến môi trường TTS_BACKENDS, hoặc "elevenlabs")
+        **kwargs: Tham số của TTSRouter
+
+    Returns:
+        TTSRouter: Router với các backend khởi tạo được (backend lỗi khi khởi tạo bị bỏ qua)
+    """
+    names = names or os.environ.get("TTS_BACKENDS", "elevenlabs")
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+
+    backends = []
+    for name in names:
+        factory = BACKEND_FACTORIES.get(name)
+        if factory is None:
+            print(f"Không có backend TTS {name}. Backend có sẵn: {list(BACKEND_FACTORIES)}")
+            continue
+        try:
+            backends.append(factory())
+        except Exception as e:
+            print(f"Không thể khởi tạo backend TTS {name}: {str(e)}")
+    return TTSRouter(backends, **kwargs)
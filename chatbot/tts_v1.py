@@ -1,31 +1,43 @@
 import os
+import queue
 import string
+import threading
+import numpy as np
+import soundfile as sf
 import torch
-import torchaudio
 from datetime import datetime
 from tqdm import tqdm
-from underthesea import sent_tokenize
 from unidecode import unidecode
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from voice_store import VoiceLatentStore, model_version
+import text_frontend
+import xtts_profile
 
 try:
-    from vinorm import TTSnorm
     from TTS.tts.configs.xtts_config import XttsConfig
     from TTS.tts.models.xtts import Xtts
 except:
     print("Không thể import một số thư viện cần thiết")
 
 class TextToSpeech:
-    def __init__(self, model_path="model", device=None):
+    def __init__(self, model_path="model", device=None, voice_cache_dir="voice_cache", voices_dir="voices",
+                 profile=None, warmup=True):
         """
         Khởi tạo module Text to Speech với XTTS
         
         Args:
             model_path (str): Đường dẫn đến thư mục chứa model
             device (str, optional): Thiết bị để chạy model ("cuda" hoặc "cpu")
+            voice_cache_dir (str): Thư mục lưu conditioning latents của các giọng mẫu
+            voices_dir (str): Thư mục giọng mẫu được tính latents sẵn khi khởi động
+            profile (str, optional): Cấu hình inference trên CPU (xem xtts_profile.PROFILES),
+                mặc định lấy từ biến môi trường XTTS_PROFILE
+            warmup (bool): Chạy một lần tổng hợp khi khởi động để request đầu tiên không bị chậm
         """
         self.model_path = model_path
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
+        self.profile_name = profile
         self.language_code_map = {
             "vietnamese": "vi",
             "english": "en",
@@ -57,6 +69,14 @@ class TextToSpeech:
         
         # Tự động load model
         self._load_model()
+        
+        # Latents của giọng mẫu được tính một lần, lưu trong bộ nhớ và trên đĩa
+        self.voice_store = VoiceLatentStore(self.model, model_version(self.model_path), cache_dir=voice_cache_dir)
+        ready = self.voice_store.precompute(list(self.voices.values()) + [voices_dir])
+        print(f"Đã chuẩn bị latents cho {ready} giọng mẫu")
+        
+        if warmup:
+            self._warmup()
     
     def _clear_gpu_cache(self):
         """Xóa bộ nhớ cache GPU nếu đang sử dụng CUDA"""
@@ -86,12 +106,27 @@ class TextToSpeech:
             
             if self.device == "cuda":
                 self.model.cuda()
+            
+            # Lượng tử hóa / số luồng / biên dịch theo cấu hình đã chọn
+            self.profile = xtts_profile.apply_profile(self.model, self.profile_name, self.device)
                 
             print("Đã nạp mô hình thành công!")
         except Exception as e:
             print(f"Lỗi khi nạp mô hình XTTS: {str(e)}")
             raise
     
+    def _warmup(self):
+        """Chạy thử một câu với giọng mặc định để khởi tạo kernel và bộ nhớ trước request đầu tiên"""
+        voice_path = self.voices.get("vi_female")
+        if not voice_path or not os.path.exists(voice_path):
+            print("Bỏ qua warm-up: không tìm thấy giọng mẫu mặc định")
+            return
+        try:
+            gpt_cond_latent, speaker_embedding = self.voice_store.get_latents(voice_path)
+            xtts_profile.warmup(self.model, gpt_cond_latent, speaker_embedding)
+        except Exception as e:
+            print(f"Lỗi khi warm-up XTTS: {e}")
+    
     def get_available_voices(self):
         """
         Lấy danh sách giọng nói có sẵn
@@ -149,43 +184,102 @@ class TextToSpeech:
             return 13000 * word_count + 2000 * num_punct
         return -1
     
-    def _normalize_vietnamese_text(self, text):
+    def _group_sentences(self, sentences, max_chars):
         """
-        Chuẩn hóa văn bản tiếng Việt
+        Gộp các câu ngắn liền nhau vào một lần inference
         
         Args:
-            text (str): Văn bản cần chuẩn hóa
+            sentences (list): Danh sách câu
+            max_chars (int): Độ dài tối đa (ký tự) của một nhóm câu
             
         Returns:
-            str: Văn bản đã chuẩn hóa
+            generator: Các đoạn văn bản, mỗi đoạn ứng với một lần gọi model
         """
+        group = ""
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if group and len(group) + 1 + len(sentence) <= max_chars:
+                group = f"{group} {sentence}"
+            else:
+                if group:
+                    yield group
+                group = sentence
+        if group:
+            yield group
+    
+    def _iter_text_units(self, text, lang_code, normalize_text=True, batch_max_chars=0):
+        """
+        Chuẩn hóa và tách câu theo từng đoạn văn, để câu đầu tiên sẵn sàng cho inference sớm nhất
+        
+        Args:
+            text (str): Văn bản đầu vào
+            lang_code (str): Mã ngôn ngữ
+            normalize_text (bool): Có chuẩn hóa văn bản tiếng Việt hay không
+            batch_max_chars (int): Gộp câu ngắn đến tối đa số ký tự này (0 = không gộp)
+            
+        Returns:
+            generator: Các đoạn văn bản đưa vào model
+        """
+        for paragraph in text.splitlines():
+            if not paragraph.strip():
+                continue
+            # Kết quả chuẩn hóa + tách câu được cache theo đoạn văn
+            sentences = text_frontend.prepare(paragraph, lang_code, normalize_text)
+            if batch_max_chars > 0:
+                yield from self._group_sentences(sentences, batch_max_chars)
+            else:
+                yield from sentences
+    
+    def _write_chunks(self, audio_queue, output_path, lang_code, output_chunks, errors):
+        """
+        Luồng ghi: cắt, lưu từng đoạn (nếu cần) và ghi nối tiếp vào file kết quả ngay khi có audio
+        
+        Args:
+            audio_queue (queue.Queue): Hàng đợi (đoạn văn bản, wav), None để kết thúc
+            output_path (str): Đường dẫn file kết quả
+            lang_code (str): Mã ngôn ngữ
+            output_chunks (bool): Có lưu từng đoạn âm thanh riêng lẻ không
+            errors (list): Nơi ghi lại lỗi để luồng chính xử lý
+        """
+        out = None
         try:
-            text = (
-                TTSnorm(text, unknown=False, lower=False, rule=True)
-                .replace("..", ".")
-                .replace("!.", "!")
-                .replace("?.", "?")
-                .replace(" .", ".")
-                .replace(" ,", ",")
-                .replace('"', "")
-                .replace("'", "")
-                .replace("AI", "Ây Ai")
-                .replace("A.I", "Ây Ai")
-                .replace("+", "cộng")
-                .replace("-", "trừ")
-                .replace("*", "nhân")
-                .replace("/", "chia")
-                .replace("=", "bằng")
-            )
-            return text
-        except Exception:
-            print("Lỗi khi chuẩn hóa văn bản tiếng Việt, sử dụng văn bản gốc")
-            return text
+            for segment, wav in iter(audio_queue.get, None):
+                if isinstance(wav, torch.Tensor):
+                    wav = wav.detach().cpu().numpy()
+                wav = np.asarray(wav, dtype=np.float32).reshape(-1)
+                
+                # Cắt âm thanh nếu cần
+                keep_len = self._calculate_keep_len(segment, lang_code)
+                if keep_len > 0 and len(wav) > keep_len:
+                    wav = wav[:keep_len]
+                
+                # Lưu từng đoạn nếu cần
+                if output_chunks:
+                    chunk_dir = os.path.dirname(output_path)
+                    chunk_name = f"{self._get_file_name(segment)}.wav"
+                    sf.write(os.path.join(chunk_dir, chunk_name), wav, 24000, subtype="FLOAT")
+                
+                if out is None:
+                    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                    # Chỉ định rõ định dạng: đường dẫn có thể không có đuôi .wav (vd: file tạm .part của router)
+                    out = sf.SoundFile(output_path, "w", samplerate=24000, channels=1, subtype="FLOAT",
+                                       format="WAV")
+                out.write(wav)
+        except Exception as e:
+            errors.append(e)
+            # Tiếp tục lấy hết hàng đợi để luồng inference không bị chặn
+            for _ in iter(audio_queue.get, None):
+                pass
+        finally:
+            if out is not None:
+                out.close()
     
     def text_to_speech(self, text, language="vietnamese", voice_name=None, voice_path=None, 
                        output_path=None, normalize_text=True, output_chunks=False,
                        temperature=0.3, length_penalty=1.0, repetition_penalty=10.0,
-                       top_k=30, top_p=0.85):
+                       top_k=30, top_p=0.85, batch_max_chars=0):
         """
         Chuyển đổi văn bản thành giọng nói sử dụng model XTTS
         
@@ -201,9 +295,15 @@ class TextToSpeech:
             repetition_penalty (float): Hệ số điều chỉnh sự lặp lại
             top_k (int): Tham số top_k cho việc sinh âm thanh
             top_p (float): Tham số top_p cho việc sinh âm thanh
+            batch_max_chars (int): Gộp các câu ngắn liền nhau thành một lần inference, tối đa số
+                ký tự này (mặc định 0 = mỗi câu một lần inference, giữ nguyên ngữ điệu từng câu)
             
         Returns:
             str: Đường dẫn đến file audio hoặc None nếu lỗi
+        
+        Chuẩn hóa/tách câu, inference và ghi file chạy song song theo dạng pipeline: luồng
+        front-end chuẩn bị câu tiếp theo và luồng ghi xử lý đoạn đã xong trong khi model
+        đang sinh âm thanh cho câu hiện tại.
         """
         if self.model is None:
             raise ValueError("Model chưa được nạp")
@@ -258,77 +358,61 @@ class TextToSpeech:
             output_path = os.path.join(output_dir, f"{self._get_file_name(text)}.wav")
         
         try:
-            # Lấy conditioning latents từ file giọng mẫu
-            gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
-                audio_path=voice_path,
-                gpt_cond_len=self.model.config.gpt_cond_len,
-                max_ref_length=self.model.config.max_ref_len,
-                sound_norm_refs=self.model.config.sound_norm_refs,
-            )
+            # Lấy conditioning latents từ cache (chỉ tính lại khi file giọng mẫu thay đổi)
+            gpt_cond_latent, speaker_embedding = self.voice_store.get_latents(voice_path)
             
-            # Chuẩn hóa văn bản nếu cần
-            if normalize_text and lang_code == "vi":
-                text = self._normalize_vietnamese_text(text)
+            # Front-end: chuẩn hóa và tách câu trên luồng riêng, đưa dần vào hàng đợi
+            text_queue = queue.Queue()
+            audio_queue = queue.Queue()
+            errors = []
             
-            # Tách văn bản thành các câu
-            if lang_code in ["ja", "zh-cn"]:
-                text_segments = text.split("。")
-            else:
-                text_segments = sent_tokenize(text)
+            def produce_text_units():
+                try:
+                    for unit in self._iter_text_units(text, lang_code, normalize_text, batch_max_chars):
+                        text_queue.put(unit)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    text_queue.put(None)
             
-            # Sinh âm thanh cho từng đoạn văn bản
-            wav_chunks = []
-            for segment in tqdm(text_segments):
-                if segment.strip() == "":
-                    continue
-                
-                wav_chunk = self.model.inference(
-                    text=segment,
-                    language=lang_code,
-                    gpt_cond_latent=gpt_cond_latent,
-                    speaker_embedding=speaker_embedding,
-                    temperature=temperature,
-                    length_penalty=length_penalty,
-                    repetition_penalty=repetition_penalty,
-                    top_k=top_k,
-                    top_p=top_p,
-                )
-                
-                # Chuyển đổi sang tensor và cắt âm thanh nếu cần
-                keep_len = self._calculate_keep_len(segment, lang_code)
-                if keep_len > 0 and len(wav_chunk["wav"]) > keep_len:
-                    wav = wav_chunk["wav"][:keep_len]
-                else:
-                    wav = wav_chunk["wav"]
-                
-                # Đảm bảo là tensor
-                if not isinstance(wav, torch.Tensor):
-                    wav = torch.tensor(wav)
-                
-                # Lưu từng đoạn nếu cần
-                if output_chunks:
-                    chunk_dir = os.path.dirname(output_path)
-                    chunk_name = f"{self._get_file_name(segment)}.wav"
-                    chunk_path = os.path.join(chunk_dir, chunk_name)
-                    torchaudio.save(chunk_path, wav.unsqueeze(0), 24000)
-                
-                wav_chunks.append(wav)
+            frontend = threading.Thread(target=produce_text_units, daemon=True)
+            writer = threading.Thread(
+                target=self._write_chunks,
+                args=(audio_queue, output_path, lang_code, output_chunks, errors),
+                daemon=True,
+            )
+            frontend.start()
+            writer.start()
             
-            # Đảm bảo tất cả các đoạn là tensors
-            tensor_chunks = []
-            for chunk in wav_chunks:
-                if not isinstance(chunk, torch.Tensor):
-                    chunk = torch.tensor(chunk)
-                tensor_chunks.append(chunk)
-                
-            # Ghép các đoạn âm thanh và lưu kết quả
-            if tensor_chunks:
-                out_wav = torch.cat(tensor_chunks, dim=0).unsqueeze(0)
-                # Đảm bảo thư mục đầu ra tồn tại
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                torchaudio.save(output_path, out_wav, 24000)
-            else:
+            # Inference trên luồng hiện tại (model không dùng chung an toàn giữa các luồng)
+            num_units = 0
+            try:
+                for segment in tqdm(iter(text_queue.get, None)):
+                    if errors:
+                        break
+                    wav_chunk = self.model.inference(
+                        text=segment,
+                        language=lang_code,
+                        gpt_cond_latent=gpt_cond_latent,
+                        speaker_embedding=speaker_embedding,
+                        temperature=temperature,
+                        length_penalty=length_penalty,
+                        repetition_penalty=repetition_penalty,
+                        top_k=top_k,
+                        top_p=top_p,
+                    )
+                    audio_queue.put((segment, wav_chunk["wav"]))
+                    num_units += 1
+            finally:
+                audio_queue.put(None)
+                writer.join()
+            
+            if errors:
+                raise errors[0]
+            if num_units == 0:
+                # Không có file nào được ghi, không trả về đường dẫn như thể đã thành công
                 print("Không có đoạn âm thanh nào được tạo")
+                return None
             
             return output_path
             
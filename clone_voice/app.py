@@ -1,13 +1,19 @@
 import os
 import torch
-import torchaudio
-import numpy as np
 import time
 import uuid
-from flask import Flask, request, render_template, send_file, jsonify
+import threading
+from collections import OrderedDict
+from flask import Flask, Response, request, render_template, send_file, jsonify
 from werkzeug.utils import secure_filename
 from TTS.tts.configs.xtts_config import XttsConfig
 from TTS.tts.models.xtts import Xtts
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from voice_store import VoiceLatentStore, model_version
+import audio_encoder
+import xtts_profile
+from worker_pool import XttsWorkerPool, PoolBusy
+from singleflight import SingleFlight, make_key
 
 app = Flask(__name__)
 
@@ -27,6 +33,13 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Giới hạn 16MB cho t
 # Đường dẫn đến thư mục chứa model
 MODEL_PATH = "model"
 
+# Chế độ phục vụ nhiều tiến trình: XTTS_WORKERS > 0 fork ra các worker dùng chung trọng số model
+# (chỉ trên CPU, CUDA không dùng được sau khi fork). 0 = inference ngay trong tiến trình Flask.
+XTTS_WORKERS = int(os.environ.get("XTTS_WORKERS", 0))
+XTTS_QUEUE_SIZE = int(os.environ.get("XTTS_QUEUE_SIZE", 8))
+REQUEST_TIMEOUT = float(os.environ.get("XTTS_REQUEST_TIMEOUT", 300))
+USE_WORKER_POOL = XTTS_WORKERS > 0 and not torch.cuda.is_available()
+
 # Khởi tạo model
 print("Đang tải mô hình...")
 start_load_time = time.time()
@@ -43,79 +56,229 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 print(f"Đang sử dụng thiết bị: {device}")
 model.to(device)
 
+# Cấu hình inference (lượng tử hóa int8, số luồng, biên dịch), chọn qua biến môi trường XTTS_PROFILE.
+# Khi dùng worker pool, tiến trình cha chỉ chạy torch một luồng để không khởi tạo thread pool
+# OpenMP/MKL trước khi fork (worker tự đặt số luồng của mình)
+xtts_profile.apply_profile(model, device=device, num_threads=1 if USE_WORKER_POOL else None)
+
+# Cache latents của các giọng đã tải lên, khóa theo hash nội dung file.
+# Hash được trả về cho client như một voice handle để dùng lại mà không cần tải lên file.
+VOICE_CACHE_SIZE = int(os.environ.get("VOICE_CACHE_SIZE", 64))
+voice_store = VoiceLatentStore(model, model_version(MODEL_PATH), max_memory_items=VOICE_CACHE_SIZE, persist=False)
+
+# Warm-up bằng giọng mẫu đi kèm model để request đầu tiên không phải chịu thời gian khởi tạo
+WARMUP_VOICE = os.path.join(MODEL_PATH, "vi_sample.wav")
+
+def warmup_model():
+    """Chạy một lần tổng hợp với giọng mẫu (trong tiến trình hiện tại hoặc trong từng worker)"""
+    if not os.path.exists(WARMUP_VOICE):
+        return
+    try:
+        xtts_profile.warmup(model, *voice_store.get_latents(WARMUP_VOICE))
+    except Exception as e:
+        print(f"Lỗi khi warm-up XTTS: {e}")
+
+# Với worker pool, warm-up chạy trong từng worker sau khi fork (xem XttsWorkerPool)
+if not USE_WORKER_POOL:
+    warmup_model()
+
+# Model XTTS không an toàn khi nhiều luồng Flask cùng chạy inference: tuần tự hóa trong tiến trình
+# (mỗi worker của pool có model và khóa riêng sau khi fork)
+inference_lock = threading.Lock()
+
+# Thống kê của các phiên streaming gần đây, tra cứu qua /api/tts/stream/<stream_id>/stats
+STREAM_STATS_SIZE = 256
+stream_stats = OrderedDict()
+stream_stats_lock = threading.Lock()
+
+class VoiceError(Exception):
+    """Lỗi khi xác định giọng mẫu của request, kèm mã HTTP tương ứng"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
 def allowed_file(filename):
     """Kiểm tra xem tệp có đuôi hợp lệ hay không"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def text_to_speech(text, speaker_wav, output_path, language="vi"):
-    """Chuyển đổi văn bản thành giọng nói, sử dụng mẫu giọng từ file audio"""
-    # Tạo thư mục đầu ra nếu chưa tồn tại
-    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+def resolve_voice():
+    """
+    Lấy conditioning latents cho request hiện tại từ voice_id (handle đã có) hoặc voice_file (tải lên mới)
     
-    # Bắt đầu đo thời gian cho việc tạo conditioning latents
+    Trả về:
+        tuple: (voice_id, (gpt_cond_latent, speaker_embedding), cond_time, cached)
+    """
     start_cond_time = time.time()
-    # Tạo conditioning latents từ file giọng mẫu
-    gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
-        audio_path=speaker_wav,
-        gpt_cond_len=model.config.gpt_cond_len,
-        max_ref_length=model.config.max_ref_len,
-        sound_norm_refs=model.config.sound_norm_refs,
-    )
-    end_cond_time = time.time()
-    cond_time = end_cond_time - start_cond_time
-    print(f"Thời gian tạo conditioning latents: {cond_time:.2f} giây")
+    voice_id = request.form.get('voice_id', '').strip()
+    if voice_id:
+        latents = voice_store.get_latents_by_handle(voice_id)
+        if latents is None:
+            raise VoiceError('voice_id không tồn tại hoặc đã hết hạn, vui lòng tải lại tệp giọng nói', 404)
+        return voice_id, latents, time.time() - start_cond_time, True
+    
+    if 'voice_file' not in request.files:
+        raise VoiceError('Không tìm thấy tệp giọng nói')
+    
+    file = request.files['voice_file']
+    if file.filename == '':
+        raise VoiceError('Không có tệp nào được chọn')
+    
+    if not allowed_file(file.filename):
+        raise VoiceError('Định dạng tệp không được hỗ trợ. Chỉ chấp nhận .mp3 và .wav')
+    
+    # Cùng một file tải lên nhiều lần chỉ tính conditioning latents một lần
+    data = file.read()
+    suffix = os.path.splitext(secure_filename(file.filename))[1].lower()
+    voice_id, latents, cached = voice_store.get_latents_for_bytes(data, suffix=suffix, tmp_dir=app.config['UPLOAD_FOLDER'])
+    cond_time = time.time() - start_cond_time
+    print(f"Thời gian tạo conditioning latents: {cond_time:.2f} giây" + (" (dùng lại từ cache)" if cached else ""))
+    return voice_id, latents, cond_time, cached
+
+def text_to_speech(text, voice_latents, output_path, language="vi", fmt="mp3"):
+    """Chuyển đổi văn bản thành giọng nói, sử dụng conditioning latents của giọng mẫu"""
+    # Tạo thư mục đầu ra nếu chưa tồn tại
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    gpt_cond_latent, speaker_embedding = voice_latents
     
     # Bắt đầu đo thời gian cho việc inference
     start_inference_time = time.time()
     # Tạo wav từ văn bản
-    outputs = model.inference(
-        text=text,
-        language=language,
-        gpt_cond_latent=gpt_cond_latent,
-        speaker_embedding=speaker_embedding,
-        temperature=0.3,
-        length_penalty=1.0,
-        repetition_penalty=10.0,
-        top_k=30,
-        top_p=0.85,
-    )
+    with inference_lock:
+        outputs = model.inference(
+            text=text,
+            language=language,
+            gpt_cond_latent=gpt_cond_latent,
+            speaker_embedding=speaker_embedding,
+            temperature=0.3,
+            length_penalty=1.0,
+            repetition_penalty=10.0,
+            top_k=30,
+            top_p=0.85,
+        )
     end_inference_time = time.time()
     inference_time = end_inference_time - start_inference_time
     print(f"Thời gian inference: {inference_time:.2f} giây")
     
-    # Bắt đầu đo thời gian cho việc lưu file
+    # Bắt đầu đo thời gian cho việc mã hóa và lưu file
     start_save_time = time.time()
-    # Lưu file WAV
-    wav_path = output_path
-    if output_path.endswith('.mp3'):
-        wav_path = output_path.replace('.mp3', '.wav')
-    
-    # Chuyển numpy array sang tensor torch
-    wav_tensor = torch.tensor(outputs["wav"]).unsqueeze(0)
-    torchaudio.save(wav_path, wav_tensor, 24000)
-    
-    # Chuyển sang MP3 nếu cần
-    if output_path.endswith('.mp3'):
-        try:
-            os.system(f"ffmpeg -i {wav_path} -vn -ar 44100 -ac 2 -b:a 192k {output_path} -y -loglevel quiet")
-            if os.path.exists(output_path):
-                os.remove(wav_path)  # Xóa file wav tạm nếu chuyển đổi thành công
-                end_save_time = time.time()
-                save_time = end_save_time - start_save_time
-                print(f"Thời gian lưu file: {save_time:.2f} giây")
-                return output_path, cond_time, inference_time, save_time
-        except Exception as e:
-            end_save_time = time.time()
-            save_time = end_save_time - start_save_time
-            print(f"Lỗi khi chuyển sang MP3: {e}")
-            print(f"Thời gian lưu file: {save_time:.2f} giây")
-            return wav_path, cond_time, inference_time, save_time
-    
+    # Mã hóa ngay trong tiến trình ở 24kHz mono, ghi một lần ra file đích
+    audio_data = audio_encoder.encode(outputs["wav"], fmt)
+    with open(output_path, 'wb') as f:
+        f.write(audio_data)
     end_save_time = time.time()
     save_time = end_save_time - start_save_time
-    print(f"Thời gian lưu file: {save_time:.2f} giây")
-    return wav_path, cond_time, inference_time, save_time
+    print(f"Thời gian mã hóa và lưu file ({fmt}): {save_time:.2f} giây")
+    return output_path, inference_time, save_time
+
+def save_stream_stats(stream_id, stats):
+    """Lưu thống kê của một phiên streaming, chỉ giữ STREAM_STATS_SIZE phiên gần nhất"""
+    with stream_stats_lock:
+        stream_stats[stream_id] = stats
+        stream_stats.move_to_end(stream_id)
+        while len(stream_stats) > STREAM_STATS_SIZE:
+            stream_stats.popitem(last=False)
+
+def text_to_speech_stream(text, voice_latents, stats, language="vi", fmt="wav", stream_chunk_size=20):
+    """
+    Sinh giọng nói theo từng khối bằng inference_stream của XTTS
+    
+    Khối đầu tiên được trả về ngay khi GPT sinh đủ stream_chunk_size token, không cần chờ
+    toàn bộ câu. Thời gian ra khối đầu tiên và thống kê khác được ghi vào stats.
+    
+    Trả về:
+        generator: Các khối bytes đã mã hóa theo fmt (xem audio_encoder.STREAMABLE_FORMATS)
+    """
+    gpt_cond_latent, speaker_embedding = voice_latents
+    start_inference_time = time.time()
+    total_samples = 0
+    
+    def generate_chunks():
+        nonlocal total_samples
+        # Giữ khóa đến khi luồng kết thúc hoặc client ngắt kết nối (generator bị đóng)
+        with inference_lock:
+            chunks = model.inference_stream(
+                text,
+                language,
+                gpt_cond_latent,
+                speaker_embedding,
+                stream_chunk_size=stream_chunk_size,
+                temperature=0.3,
+                length_penalty=1.0,
+                repetition_penalty=10.0,
+                top_k=30,
+                top_p=0.85,
+                enable_text_splitting=True,
+            )
+            for i, chunk in enumerate(chunks):
+                if i == 0:
+                    stats['first_chunk_time'] = time.time() - start_inference_time
+                    print(f"Thời gian ra khối audio đầu tiên: {stats['first_chunk_time']:.2f} giây")
+                total_samples += chunk.shape[-1]
+                stats['chunks'] = i + 1
+                yield chunk
+    
+    try:
+        yield from audio_encoder.iter_encode(generate_chunks(), fmt)
+        stats['status'] = 'done'
+    except Exception as e:
+        print(f"Lỗi khi streaming: {e}")
+        stats['status'] = 'error'
+        stats['error'] = str(e)
+    finally:
+        stats['inference_time'] = time.time() - start_inference_time
+        stats['audio_duration'] = total_samples / audio_encoder.SAMPLE_RATE
+        if stats.get('status') == 'streaming':
+            # Client ngắt kết nối giữa chừng
+            stats['status'] = 'cancelled'
+        print(f"Thời gian inference (streaming): {stats['inference_time']:.2f} giây")
+
+# Worker được fork khi tiến trình cha chưa chạy lần inference nào (không có warm-up, torch một luồng)
+worker_pool = None
+if USE_WORKER_POOL:
+    worker_pool = XttsWorkerPool(text_to_speech, num_workers=XTTS_WORKERS, queue_size=XTTS_QUEUE_SIZE,
+                                 threads_per_worker=max(1, xtts_profile.available_cpus() // XTTS_WORKERS),
+                                 initializer=warmup_model)
+elif XTTS_WORKERS > 0:
+    print("Worker pool chỉ hỗ trợ CPU, chạy inference trong tiến trình hiện tại")
+
+# Nhiều học sinh mở cùng một link sẽ gửi cùng văn bản + giọng cùng lúc: chỉ tổng hợp một lần
+single_flight = SingleFlight()
+
+def run_synthesis(**kwargs):
+    """Chạy text_to_speech trên worker pool nếu được bật, ngược lại chạy ngay trong tiến trình hiện tại"""
+    if worker_pool is None:
+        return text_to_speech(**kwargs)
+    return worker_pool.submit(**kwargs).result(timeout=REQUEST_TIMEOUT)
+
+def synthesize_once(voice_id, text, language, fmt, voice_latents, output_path):
+    """
+    Gộp các request tổng hợp giống hệt nhau đang chạy đồng thời
+    
+    Trả về:
+        tuple: (đường dẫn file, inference_time, save_time, coalesced) - các request được gộp
+        dùng chung file kết quả của request đầu tiên
+    """
+    key = make_key(voice_id, text, language, fmt)
+    (result_file, inference_time, save_time), coalesced = single_flight.do(
+        key,
+        run_synthesis,
+        text=text,
+        voice_latents=voice_latents,
+        output_path=output_path,
+        language=language,
+        fmt=fmt,
+    )
+    if coalesced:
+        print(f"Dùng chung kết quả tổng hợp với request đang chạy: {result_file}")
+    return result_file, inference_time, save_time, coalesced
+
+def busy_response():
+    """Phản hồi 503 khi hàng đợi inference đã đầy"""
+    response = jsonify({'error': 'Máy chủ đang bận, vui lòng thử lại sau'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
 
 @app.route('/')
 def index():
@@ -125,58 +288,52 @@ def index():
 @app.route('/synthesize', methods=['POST'])
 def synthesize():
     """API để chuyển đổi văn bản thành giọng nói"""
-    if 'voice_file' not in request.files:
-        return jsonify({'error': 'Không tìm thấy tệp giọng nói'}), 400
-    
-    file = request.files['voice_file']
-    if file.filename == '':
-        return jsonify({'error': 'Không có tệp nào được chọn'}), 400
-    
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'Định dạng tệp không được hỗ trợ. Chỉ chấp nhận .mp3 và .wav'}), 400
-    
     text = request.form.get('text', '')
     if not text:
         return jsonify({'error': 'Vui lòng nhập văn bản để chuyển đổi'}), 400
     
     language = request.form.get('language', 'vi')
     
-    # Lưu tệp giọng nói tải lên
-    filename = secure_filename(file.filename)
-    voice_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{str(uuid.uuid4())}_{filename}")
-    file.save(voice_file_path)
+    # Giọng mẫu: voice_id đã có hoặc tệp tải lên mới
+    try:
+        voice_id, voice_latents, cond_time, voice_cached = resolve_voice()
+    except VoiceError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Lỗi khi xử lý tệp giọng nói: {str(e)}'}), 500
+    
+    # Định dạng đầu ra: tham số format hoặc header Accept (mặc định MP3)
+    fmt = audio_encoder.negotiate_format(request.form.get('format'), request.accept_mimetypes)
     
     # Tạo tên tệp đầu ra duy nhất
-    output_filename = f"output_{str(uuid.uuid4())}.mp3"
+    output_filename = f"output_{str(uuid.uuid4())}.{audio_encoder.extension(fmt)}"
     output_file_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
     
     try:
         # Chuyển đổi văn bản thành giọng nói
-        result_file, cond_time, inference_time, save_time = text_to_speech(
-            text=text,
-            speaker_wav=voice_file_path,
-            output_path=output_file_path,
-            language=language
+        result_file, inference_time, save_time, coalesced = synthesize_once(
+            voice_id, text, language, fmt, voice_latents, output_file_path
         )
         
         # Trả về thông tin về tệp âm thanh đã tạo
         return jsonify({
             'success': True,
             'message': 'Chuyển đổi thành công',
-            'audio_file': output_filename,
+            'audio_file': os.path.basename(result_file),
+            'voice_id': voice_id,
             'stats': {
+                'voice_cached': voice_cached,
+                'coalesced': coalesced,
                 'conditioning_time': f"{cond_time:.2f} giây",
                 'inference_time': f"{inference_time:.2f} giây",
                 'save_time': f"{save_time:.2f} giây",
                 'total_time': f"{cond_time + inference_time + save_time:.2f} giây"
             }
         })
+    except PoolBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'error': f'Lỗi khi chuyển đổi: {str(e)}'}), 500
-    finally:
-        # Xóa tệp giọng nói tải lên sau khi xử lý xong
-        if os.path.exists(voice_file_path):
-            os.remove(voice_file_path)
 
 @app.route('/download/<filename>')
 def download_file(filename):
@@ -187,38 +344,31 @@ def download_file(filename):
 def api_tts():
     """API cho phép sử dụng qua các ứng dụng khác"""
     # Kiểm tra dữ liệu đầu vào
-    if 'voice_file' not in request.files:
-        return jsonify({'error': 'Không tìm thấy tệp giọng nói'}), 400
-    
-    file = request.files['voice_file']
-    if file.filename == '':
-        return jsonify({'error': 'Không có tệp nào được chọn'}), 400
-    
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'Định dạng tệp không được hỗ trợ. Chỉ chấp nhận .mp3 và .wav'}), 400
-    
     text = request.form.get('text', '')
     if not text:
         return jsonify({'error': 'Vui lòng nhập văn bản để chuyển đổi'}), 400
     
     language = request.form.get('language', 'vi')
     
-    # Lưu tệp giọng nói tải lên
-    filename = secure_filename(file.filename)
-    voice_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{str(uuid.uuid4())}_{filename}")
-    file.save(voice_file_path)
+    # Giọng mẫu: voice_id đã có hoặc tệp tải lên mới
+    try:
+        voice_id, voice_latents, cond_time, voice_cached = resolve_voice()
+    except VoiceError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Lỗi khi xử lý tệp giọng nói: {str(e)}'}), 500
+    
+    # Định dạng đầu ra: tham số format hoặc header Accept (mặc định MP3)
+    fmt = audio_encoder.negotiate_format(request.form.get('format'), request.accept_mimetypes)
     
     # Tạo tên tệp đầu ra duy nhất
-    output_filename = f"output_{str(uuid.uuid4())}.mp3"
+    output_filename = f"output_{str(uuid.uuid4())}.{audio_encoder.extension(fmt)}"
     output_file_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
     
     try:
         # Chuyển đổi văn bản thành giọng nói
-        result_file, cond_time, inference_time, save_time = text_to_speech(
-            text=text,
-            speaker_wav=voice_file_path,
-            output_path=output_file_path,
-            language=language
+        result_file, inference_time, save_time, coalesced = synthesize_once(
+            voice_id, text, language, fmt, voice_latents, output_file_path
         )
         
         # Tạo URL để tải xuống tệp
@@ -227,19 +377,104 @@ def api_tts():
         return jsonify({
             'success': True,
             'download_url': download_url,
+            'voice_id': voice_id,
             'stats': {
+                'voice_cached': voice_cached,
+                'coalesced': coalesced,
                 'conditioning_time': f"{cond_time:.2f} giây",
                 'inference_time': f"{inference_time:.2f} giây",
                 'save_time': f"{save_time:.2f} giây",
                 'total_time': f"{cond_time + inference_time + save_time:.2f} giây"
             }
         })
+    except PoolBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'error': f'Lỗi khi chuyển đổi: {str(e)}'}), 500
-    finally:
-        # Xóa tệp giọng nói tải lên sau khi xử lý xong
-        if os.path.exists(voice_file_path):
-            os.remove(voice_file_path)
+
+@app.route('/api/tts/stream', methods=['POST'])
+def api_tts_stream():
+    """
+    API streaming: trả audio theo từng khối (chunked HTTP) ngay khi XTTS sinh ra
+    
+    Header X-Stream-Id dùng để lấy thống kê (thời gian ra khối đầu tiên, ...) tại
+    /api/tts/stream/<stream_id>/stats sau khi luồng kết thúc.
+    """
+    # Worker pool chỉ trả về file hoàn chỉnh; streaming trong tiến trình Flask sẽ chạy model của
+    # tiến trình cha song song với các worker trên cùng số nhân CPU nên bị từ chối
+    if worker_pool is not None:
+        response = jsonify({'error': 'Streaming không khả dụng khi bật worker pool (XTTS_WORKERS > 0), '
+                                     'vui lòng dùng /api/tts'})
+        response.status_code = 503
+        return response
+    
+    text = request.form.get('text', '')
+    if not text:
+        return jsonify({'error': 'Vui lòng nhập văn bản để chuyển đổi'}), 400
+    
+    language = request.form.get('language', 'vi')
+    
+    # Giọng mẫu: voice_id đã có hoặc tệp tải lên mới
+    try:
+        voice_id, voice_latents, cond_time, voice_cached = resolve_voice()
+    except VoiceError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Lỗi khi xử lý tệp giọng nói: {str(e)}'}), 500
+    
+    # Định dạng luồng: WAV (mặc định), Opus/OGG hoặc PCM thô
+    fmt = audio_encoder.negotiate_format(request.form.get('format'), request.accept_mimetypes,
+                                         default='wav', streaming=True)
+    
+    stream_id = str(uuid.uuid4())
+    stats = {
+        'status': 'streaming',
+        'voice_id': voice_id,
+        'voice_cached': voice_cached,
+        'conditioning_time': cond_time,
+        'chunks': 0,
+    }
+    save_stream_stats(stream_id, stats)
+    
+    # Không có Content-Length nên Flask gửi theo Transfer-Encoding: chunked
+    return Response(
+        text_to_speech_stream(text, voice_latents, stats, language=language, fmt=fmt),
+        mimetype=audio_encoder.mimetype(fmt),
+        headers={
+            'X-Stream-Id': stream_id,
+            'X-Voice-Id': voice_id,
+            'Cache-Control': 'no-cache',
+        },
+    )
+
+@app.route('/api/tts/stream/<stream_id>/stats')
+def api_tts_stream_stats(stream_id):
+    """API lấy thống kê thời gian của một phiên streaming"""
+    with stream_stats_lock:
+        stats = stream_stats.get(stream_id)
+        stats = dict(stats) if stats is not None else None
+    if stats is None:
+        return jsonify({'error': 'Không tìm thấy phiên streaming'}), 404
+    
+    formatted = {
+        'status': stats.pop('status'),
+        'voice_cached': stats.pop('voice_cached'),
+        'chunks': stats.pop('chunks'),
+    }
+    if 'error' in stats:
+        formatted['error'] = stats.pop('error')
+    for key in ('conditioning_time', 'first_chunk_time', 'inference_time'):
+        if key in stats:
+            formatted[key] = f"{stats[key]:.2f} giây"
+    if 'audio_duration' in stats:
+        formatted['audio_duration'] = f"{stats['audio_duration']:.2f} giây"
+    if 'first_chunk_time' in stats:
+        # Thời gian từ lúc nhận request đến khi client nhận được âm thanh đầu tiên
+        formatted['time_to_first_audio'] = f"{stats['conditioning_time'] + stats['first_chunk_time']:.2f} giây"
+    if 'inference_time' in stats and stats.get('audio_duration'):
+        formatted['real_time_factor'] = f"{stats['inference_time'] / stats['audio_duration']:.2f}"
+    
+    return jsonify({'success': True, 'voice_id': stats['voice_id'], 'stats': formatted})
 
 if __name__ == '__main__':
     # Chạy ứng dụng Flask trên cổng 9321
@@ -0,0 +1,174 @@
+import io
+import struct
+
+import numpy as np
+import soundfile as sf
+
+# XTTS sinh audio mono 24kHz, giữ nguyên tần số này khi mã hóa (không upsample)
+SAMPLE_RATE = 24000
+
+# Các định dạng đầu ra hỗ trợ
+# compression_level: mức nén của libsndfile (0 = chất lượng cao nhất, 1 = nén nhiều nhất),
+# chọn ở mức phù hợp cho giọng nói mono thay vì 192kbps stereo như trước
+FORMATS = {
+    "opus": {"format": "OGG", "subtype": "OPUS", "mimetype": "audio/ogg", "ext": "ogg", "compression_level": 0.85},
+    "mp3": {"format": "MP3", "subtype": "MPEG_LAYER_III", "mimetype": "audio/mpeg", "ext": "mp3", "compression_level": 0.7},
+    "wav": {"format": "WAV", "subtype": "PCM_16", "mimetype": "audio/wav", "ext": "wav"},
+    "pcm": {"format": "RAW", "subtype": "PCM_16", "mimetype": f"audio/L16;rate={SAMPLE_RATE};channels=1", "ext": "pcm"},
+}
+
+# Tên gọi khác mà client có thể gửi lên
+FORMAT_ALIASES = {"ogg": "opus", "mpeg": "mp3", "raw": "pcm", "l16": "pcm"}
+
+# Định dạng gửi dần được khi streaming. MP3 bị loại vì libsndfile chỉ ghi lại header
+# (số frame) khi đóng file, nên phần đã gửi đi sẽ mang độ dài sai.
+STREAMABLE_FORMATS = ("opus", "wav", "pcm")
+
+
+def is_supported(fmt):
+    """Kiểm tra libsndfile hiện tại có mã hóa được định dạng hay không"""
+    spec = FORMATS.get(fmt)
+    if spec is None:
+        return False
+    if fmt in ("wav", "pcm"):
+        return True
+    return (spec["format"] in sf.available_formats()
+            and spec["subtype"] in sf.available_subtypes(spec["format"]))
+
+
+def negotiate_format(requested=None, accept_mimetypes=None, default="mp3", streaming=False):
+    """
+    Chọn định dạng đầu ra từ tham số của client hoặc header Accept
+
+    Tham số:
+        requested (str): Định dạng client chỉ định (vd: "opus", "mp3", "wav", "pcm")
+        accept_mimetypes: request.accept_mimetypes của Flask (có best_match)
+        default (str): Định dạng dùng khi client không yêu cầu
+        streaming (bool): Chỉ chọn trong STREAMABLE_FORMATS
+
+    Trả về:
+        str: Khóa trong FORMATS, luôn là định dạng mã hóa được
+    """
+    candidates = []
+    if requested:
+        requested = requested.lower().strip()
+        candidates.append(FORMAT_ALIASES.get(requested, requested))
+    elif accept_mimetypes is not None:
+        by_mimetype = {spec["mimetype"].split(";")[0]: fmt for fmt, spec in FORMATS.items()
+                       if not streaming or fmt in STREAMABLE_FORMATS}
+        best = accept_mimetypes.best_match(list(by_mimetype))
+        # "*/*" khớp với mọi định dạng, khi đó dùng mặc định
+        if best and accept_mimetypes[best] > accept_mimetypes["*/*"]:
+            candidates.append(by_mimetype[best])
+    candidates += [default, "wav"]
+
+    for fmt in candidates:
+        if streaming and fmt not in STREAMABLE_FORMATS:
+            continue
+        if is_supported(fmt):
+            return fmt
+    return "wav"
+
+
+def mimetype(fmt):
+    """MIME type của định dạng"""
+    return FORMATS[fmt]["mimetype"]
+
+
+def extension(fmt):
+    """Phần mở rộng file của định dạng"""
+    return FORMATS[fmt]["ext"]
+
+
+def to_float32(wav):
+    """Chuyển waveform (tensor torch hoặc mảng numpy) sang mảng float32 một chiều"""
+    if hasattr(wav, "detach"):
+        wav = wav.detach().cpu().numpy()
+    return np.asarray(wav, dtype=np.float32).reshape(-1)
+
+
+def to_pcm16_bytes(wav):
+    """Chuyển waveform float trong [-1, 1] sang PCM 16-bit little-endian"""
+    return (np.clip(to_float32(wav), -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_stream_header(sample_rate=SAMPLE_RATE, channels=1, bits_per_sample=16):
+    """
+    Header WAV cho luồng chưa biết trước độ dài (kích thước đặt 0xFFFFFFFF)
+
+    Trình duyệt và ffplay/ffmpeg phát được ngay khi nhận các khối PCM tiếp theo.
+    """
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+def _open_encoder(buffer, fmt, sample_rate):
+    """Mở SoundFile ghi vào buffer trong bộ nhớ với định dạng và mức nén tương ứng"""
+    spec = FORMATS[fmt]
+    kwargs = dict(mode="w", samplerate=sample_rate, channels=1, format=spec["format"], subtype=spec["subtype"])
+    if "compression_level" in spec:
+        try:
+            return sf.SoundFile(buffer, compression_level=spec["compression_level"], **kwargs)
+        except TypeError:
+            # soundfile < 0.13 chưa hỗ trợ compression_level, dùng mức mặc định của libsndfile
+            pass
+    return sf.SoundFile(buffer, **kwargs)
+
+
+def encode(wav, fmt="mp3", sample_rate=SAMPLE_RATE):
+    """
+    Mã hóa toàn bộ waveform trong bộ nhớ (không tạo file tạm, không gọi ffmpeg)
+
+    Tham số:
+        wav: Waveform mono (tensor torch hoặc mảng numpy)
+        fmt (str): Khóa trong FORMATS
+        sample_rate (int): Tần số lấy mẫu của waveform
+
+    Trả về:
+        bytes: Dữ liệu audio đã mã hóa
+    """
+    if fmt == "pcm":
+        return to_pcm16_bytes(wav)
+    buffer = io.BytesIO()
+    with _open_encoder(buffer, fmt, sample_rate) as out:
+        out.write(to_float32(wav))
+    return buffer.getvalue()
+
+
+def iter_encode(chunks, fmt="wav", sample_rate=SAMPLE_RATE):
+    """
+    Mã hóa dần các khối waveform, trả về bytes ngay khi bộ mã hóa xuất ra dữ liệu
+
+    Tham số:
+        chunks (iterable): Các khối waveform mono theo thứ tự
+        fmt (str): Khóa trong STREAMABLE_FORMATS ("wav"/"pcm" gửi PCM trực tiếp, "opus" qua libsndfile)
+        sample_rate (int): Tần số lấy mẫu của waveform
+
+    Trả về:
+        generator: Các khối bytes để gửi cho client
+    """
+    if fmt in ("wav", "pcm"):
+        if fmt == "wav":
+            yield wav_stream_header(sample_rate)
+        for chunk in chunks:
+            yield to_pcm16_bytes(chunk)
+        return
+
+    buffer = io.BytesIO()
+    sent = 0
+    with _open_encoder(buffer, fmt, sample_rate) as out:
+        for chunk in chunks:
+            out.write(to_float32(chunk))
+            # Bộ mã hóa ghi tuần tự nên chỉ cần gửi phần mới được thêm vào buffer
+            with buffer.getbuffer() as view:
+                data = bytes(view[sent:])
+            if data:
+                sent += len(data)
+                yield data
+    with buffer.getbuffer() as view:
+        data = bytes(view[sent:])
+    if data:
+        yield data
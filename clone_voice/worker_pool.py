@@ -0,0 +1,166 @@
+import gc
+import os
+import queue
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import Future
+
+import torch
+
+
+class PoolBusy(Exception):
+    """Hàng đợi đã đầy, client nên thử lại sau"""
+
+
+class WorkerDied(Exception):
+    """Tiến trình worker bị dừng đột ngột khi đang xử lý request"""
+
+
+def _worker_main(handler, tasks, results, current_job, num_threads, initializer):
+    """Vòng lặp của một tiến trình worker: nhận job, gọi handler, trả kết quả"""
+    # Chia CPU giữa các worker để tổng số luồng không vượt quá số nhân
+    torch.set_num_threads(num_threads)
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception as e:
+            print(f"Lỗi khi khởi tạo worker: {e}")
+    while True:
+        job = tasks.get()
+        if job is None:
+            break
+        job_id, kwargs = job
+        # Ghi trực tiếp vào bộ nhớ dùng chung để tiến trình cha biết job nào bị mất nếu worker chết
+        current_job.value = job_id
+        try:
+            results.put(("done", job_id, handler(**kwargs)))
+        except Exception as e:
+            results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+        current_job.value = -1
+
+
+class XttsWorkerPool:
+    """
+    Nhóm tiến trình inference dùng chung trọng số model với tiến trình cha
+
+    Model được nạp một lần trong tiến trình cha, sau đó fork ra các worker: trang bộ nhớ
+    chứa trọng số được chia sẻ theo cơ chế copy-on-write nên RAM không tăng theo số worker.
+    Số job chưa xong bị giới hạn ở num_workers + queue_size; vượt quá thì submit báo PoolBusy
+    để server trả 503.
+
+    Tiến trình cha phải tạo pool trước lần inference đầu tiên và chạy torch với một luồng
+    (torch.set_num_threads(1)): thread pool OpenMP/MKL đã khởi tạo trước khi fork không dùng
+    được trong tiến trình con và có thể làm worker treo. Warm-up chạy trong từng worker qua
+    initializer, sau khi worker đã đặt số luồng của mình. Worker chết được fork lại từ tiến
+    trình cha nên tiến trình cha cũng không nên chạy inference nhiều luồng sau đó.
+    """
+
+    def __init__(self, handler, num_workers=2, queue_size=8, threads_per_worker=None, initializer=None):
+        """
+        Tham số:
+            handler (callable): Hàm xử lý một job trong worker, nhận keyword arguments và
+                trả về kết quả picklable (thường là hàm dùng model toàn cục đã nạp)
+            num_workers (int): Số tiến trình worker
+            queue_size (int): Số job tối đa đang chờ (chưa kể job đang chạy)
+            threads_per_worker (int, optional): Số luồng torch mỗi worker (mặc định chia đều số CPU)
+            initializer (callable, optional): Hàm chạy một lần trong mỗi worker trước job đầu
+                tiên (vd: warm-up model)
+        """
+        self.handler = handler
+        self.initializer = initializer
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self._ctx = multiprocessing.get_context("fork")
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._futures = {}
+        self._current_jobs = [self._ctx.Value("q", -1, lock=False) for _ in range(num_workers)]
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self._closed = False
+
+        # Đưa các object hiện có ra khỏi vùng quét của GC để worker không chạm (và sao chép) các trang này
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        self._workers = [self._start_worker(i) for i in range(num_workers)]
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        print(f"Đã khởi động {num_workers} worker XTTS ({self._threads_per_worker} luồng mỗi worker)")
+
+    def _start_worker(self, index):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.handler, self._tasks, self._results, self._current_jobs[index], self._threads_per_worker,
+                  self.initializer),
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def submit(self, **kwargs):
+        """
+        Đưa một job vào hàng đợi
+
+        Trả về:
+            Future: Kết quả của handler(**kwargs)
+
+        Ngoại lệ:
+            PoolBusy: Hàng đợi đã đầy
+        """
+        future = Future()
+        with self._lock:
+            if len(self._futures) >= self.num_workers + self.queue_size:
+                raise PoolBusy(f"Hàng đợi đầy ({self.queue_size} job đang chờ)")
+            job_id = next(self._ids)
+            self._futures[job_id] = future
+        self._tasks.put((job_id, kwargs))
+        return future
+
+    def pending(self):
+        """Số job đã nhận nhưng chưa hoàn tất (đang chờ + đang chạy)"""
+        with self._lock:
+            return len(self._futures)
+
+    def _collect(self):
+        """Luồng nhận kết quả từ worker và kiểm tra worker bị dừng đột ngột"""
+        while not self._closed:
+            self._check_workers()
+            try:
+                kind, job_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                future = self._futures.pop(job_id, None)
+            if future is None:
+                continue
+            if kind == "done":
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """Khởi động lại worker đã chết và báo lỗi cho job nó đang xử lý"""
+        for index, process in enumerate(self._workers):
+            if process.is_alive() or self._closed:
+                continue
+            print(f"Worker {index} đã dừng (exit code {process.exitcode}), khởi động lại")
+            lost_job = self._current_jobs[index].value
+            self._current_jobs[index].value = -1
+            with self._lock:
+                future = self._futures.pop(lost_job, None)
+            if future is not None:
+                future.set_exception(WorkerDied(f"Worker {index} dừng khi đang xử lý"))
+            self._workers[index] = self._start_worker(index)
+
+    def close(self):
+        """Dừng các worker sau khi xử lý xong job đang chờ"""
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for process in self._workers:
+            process.join(timeout=10)
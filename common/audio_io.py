@@ -0,0 +1,337 @@
+import os
+import io
+import wave
+import struct
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+
+import numpy as np
+
+# Tần số lấy mẫu chuẩn cho các mô hình nhận dạng giọng nói
+TARGET_SAMPLE_RATE = 16000
+
+# Thư mục lưu cache audio đã giải mã, mặc định .audio_cache ở gốc repo để mọi script dùng chung
+# một cache bất kể chạy từ thư mục nào (đặt AUDIO_CACHE_DIR="" để tắt cache trên đĩa)
+CACHE_DIR = os.environ.get(
+    "AUDIO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".audio_cache"),
+)
+
+# Số mảng audio giữ trong bộ nhớ
+MEMORY_CACHE_SIZE = 8
+
+# Số hash file được ghi nhớ (LRU)
+HASH_CACHE_SIZE = 1024
+
+_memory_cache = OrderedDict()
+_hash_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# (audio_format, bits_per_sample) -> dtype numpy của dữ liệu PCM trong file WAV
+_WAV_DTYPES = {
+    (1, 8): np.dtype("u1"),
+    (1, 16): np.dtype("<i2"),
+    (1, 32): np.dtype("<i4"),
+    (3, 32): np.dtype("<f4"),
+}
+
+
+def file_hash(path, block_size=1 << 20):
+    """
+    Tính hash nội dung file (SHA-1), có ghi nhớ (LRU) theo (đường dẫn, mtime, kích thước)
+
+    Tham số:
+        path (str): Đường dẫn đến file
+        block_size (int): Kích thước mỗi khối đọc
+
+    Trả về:
+        str: Chuỗi hex của hash
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        digest = _hash_cache.get(memo_key)
+        if digest is not None:
+            _hash_cache.move_to_end(memo_key)
+            return digest
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _cache_lock:
+        _hash_cache[memo_key] = digest
+        while len(_hash_cache) > HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return digest
+
+
+def _parse_wav_header(path):
+    """
+    Đọc header RIFF/WAVE để tìm vị trí dữ liệu PCM
+
+    Trả về:
+        dict hoặc None: Thông tin định dạng và vị trí chunk "data", None nếu không phải WAV hỗ trợ
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+
+            if chunk_id == b"fmt ":
+                fmt_data = f.read(chunk_size)
+                audio_format, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt_data[:16])
+                # WAVE_FORMAT_EXTENSIBLE: định dạng thật nằm ở 2 byte đầu của SubFormat GUID
+                if audio_format == 0xFFFE and len(fmt_data) >= 26:
+                    audio_format = struct.unpack("<H", fmt_data[24:26])[0]
+                fmt = {
+                    "audio_format": audio_format,
+                    "channels": channels,
+                    "sample_rate": sample_rate,
+                    "block_align": block_align,
+                    "bits": bits,
+                }
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                offset = f.tell()
+                # File ghi theo luồng có thể để kích thước 0xFFFFFFFF, giới hạn theo kích thước file
+                data_size = min(chunk_size, file_size - offset)
+                fmt["offset"] = offset
+                fmt["frames"] = data_size // fmt["block_align"] if fmt["block_align"] else 0
+                return fmt
+            else:
+                f.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+
+def _read_wav_memmap(path):
+    """
+    Ánh xạ trực tiếp dữ liệu PCM của file WAV vào bộ nhớ (không giải mã, không copy)
+
+    Trả về:
+        tuple hoặc None: (mảng float32 mono, sample_rate) hoặc None nếu định dạng không hỗ trợ
+    """
+    fmt = _parse_wav_header(path)
+    if fmt is None:
+        return None
+
+    dtype = _WAV_DTYPES.get((fmt["audio_format"], fmt["bits"]))
+    if dtype is None or fmt["channels"] == 0:
+        return None
+    if fmt["frames"] == 0:
+        return np.zeros(0, dtype=np.float32), fmt["sample_rate"]
+
+    pcm = np.memmap(path, dtype=dtype, mode="r", offset=fmt["offset"],
+                    shape=(fmt["frames"], fmt["channels"]))
+
+    if dtype == np.dtype("u1"):
+        audio = (pcm.astype(np.float32) - 128.0) / 128.0
+    elif dtype == np.dtype("<i2"):
+        audio = pcm.astype(np.float32) / 32768.0
+    elif dtype == np.dtype("<i4"):
+        audio = pcm.astype(np.float32) / 2147483648.0
+    else:
+        audio = np.asarray(pcm, dtype=np.float32)
+
+    if audio.shape[1] > 1:
+        audio = audio.mean(axis=1)
+    else:
+        audio = audio[:, 0]
+    return np.ascontiguousarray(audio, dtype=np.float32), fmt["sample_rate"]
+
+
+def _run_ffmpeg_pipe(input_args, sr, input_bytes=None, read_size=1 << 16):
+    """Giải mã audio qua ffmpeg, đọc PCM 16-bit mono từ stdout theo luồng"""
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", *input_args,
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sr), "-"]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input_bytes is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    if input_bytes is not None:
+        # Ghi dữ liệu vào stdin ở luồng riêng để không bị nghẽn pipe
+        writer = threading.Thread(target=_feed_stdin, args=(proc.stdin, input_bytes), daemon=True)
+        writer.start()
+
+    buffer = bytearray()
+    while True:
+        block = proc.stdout.read(read_size)
+        if not block:
+            break
+        buffer.extend(block)
+
+    stderr = proc.stderr.read()
+    proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg không giải mã được audio: {stderr.decode(errors='ignore').strip()}")
+
+    # Bỏ byte lẻ cuối cùng nếu có
+    usable = len(buffer) - (len(buffer) % 2)
+    return np.frombuffer(bytes(buffer[:usable]), dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _feed_stdin(stdin, data):
+    try:
+        stdin.write(data)
+    finally:
+        stdin.close()
+
+
+def resample(audio, orig_sr, target_sr=TARGET_SAMPLE_RATE):
+    """
+    Đổi tần số lấy mẫu bằng bộ lọc polyphase
+
+    Tham số:
+        audio (np.ndarray): Tín hiệu mono float32
+        orig_sr (int): Tần số lấy mẫu gốc
+        target_sr (int): Tần số lấy mẫu đích
+
+    Trả về:
+        np.ndarray: Tín hiệu đã đổi tần số lấy mẫu
+    """
+    if orig_sr == target_sr or len(audio) == 0:
+        return audio
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    g = gcd(int(orig_sr), int(target_sr))
+    return resample_poly(audio, target_sr // g, orig_sr // g).astype(np.float32)
+
+
+def _decode(path, sr):
+    decoded = _read_wav_memmap(path)
+    if decoded is not None:
+        audio, orig_sr = decoded
+        return resample(audio, orig_sr, sr)
+    return _run_ffmpeg_pipe(["-i", path], sr)
+
+
+def _cache_get(key):
+    with _cache_lock:
+        audio = _memory_cache.get(key)
+        if audio is not None:
+            _memory_cache.move_to_end(key)
+            return audio
+
+    if CACHE_DIR:
+        cache_path = os.path.join(CACHE_DIR, f"{key}.npy")
+        if os.path.exists(cache_path):
+            try:
+                audio = np.load(cache_path, mmap_mode="r")
+            except (ValueError, OSError):
+                return None
+            _cache_put(key, audio, persist=False)
+            return audio
+    return None
+
+
+def _cache_put(key, audio, persist=True):
+    # Mảng trong cache được dùng chung giữa các lần gọi nên chỉ cho đọc
+    audio.setflags(write=False)
+    with _cache_lock:
+        _memory_cache[key] = audio
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+    if persist and CACHE_DIR:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        cache_path = os.path.join(CACHE_DIR, f"{key}.npy")
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+        os.replace(tmp_path, cache_path)
+
+
+def load_audio(audio_path, sr=TARGET_SAMPLE_RATE, use_cache=True):
+    """
+    Đọc file audio thành mảng float32 mono ở tần số lấy mẫu sr
+
+    WAV PCM được ánh xạ trực tiếp vào bộ nhớ, các định dạng nén (mp3, m4a, ...) được giải mã
+    qua pipe ffmpeg mà không tạo file tạm. Kết quả được cache theo hash nội dung file.
+    Khi use_cache=True, mảng trả về được dùng chung giữa các lần gọi nên là chỉ đọc - cần sửa tại
+    chỗ (hoặc đưa vào torch.from_numpy) thì dùng audio.copy().
+
+    Tham số:
+        audio_path (str): Đường dẫn đến file audio
+        sr (int): Tần số lấy mẫu đầu ra
+        use_cache (bool): Có dùng cache (bộ nhớ và đĩa) hay không
+
+    Trả về:
+        np.ndarray: Tín hiệu mono float32 trong khoảng [-1, 1] (chỉ đọc nếu use_cache=True)
+    """
+    if not os.path.exists(audio_path):
+        raise FileNotFoundError(f"File audio không tồn tại: {audio_path}")
+
+    if not use_cache:
+        return _decode(audio_path, sr)
+
+    key = f"{file_hash(audio_path)}_{sr}"
+    audio = _cache_get(key)
+    if audio is None:
+        audio = _decode(audio_path, sr)
+        _cache_put(key, audio)
+    return audio
+
+
+def decode_bytes(data, sr=TARGET_SAMPLE_RATE):
+    """
+    Giải mã dữ liệu audio trong bộ nhớ (mp3, wav, ogg, ...) qua pipe ffmpeg
+
+    Tham số:
+        data (bytes): Nội dung file audio
+        sr (int): Tần số lấy mẫu đầu ra
+
+    Trả về:
+        np.ndarray: Tín hiệu mono float32
+    """
+    return _run_ffmpeg_pipe(["-i", "pipe:0"], sr, input_bytes=data)
+
+
+def to_pcm16(audio):
+    """Chuyển tín hiệu float32 thành bytes PCM 16-bit little-endian"""
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def load_pcm16(audio_path, sr=TARGET_SAMPLE_RATE, use_cache=True):
+    """Đọc file audio thành bytes PCM 16-bit mono (dùng cho Vosk/Kaldi)"""
+    return to_pcm16(load_audio(audio_path, sr=sr, use_cache=use_cache))
+
+
+def wav_bytes(audio, sr=TARGET_SAMPLE_RATE):
+    """Đóng gói tín hiệu float32 thành nội dung file WAV PCM 16-bit trong bộ nhớ"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(to_pcm16(audio))
+    return buffer.getvalue()
+
+
+def save_wav(output_path, audio, sr=TARGET_SAMPLE_RATE):
+    """Lưu tín hiệu float32 thành file WAV PCM 16-bit mono"""
+    with open(output_path, "wb") as f:
+        f.write(wav_bytes(audio, sr))
+    return output_path
+
+
+def get_duration(audio, sr=TARGET_SAMPLE_RATE):
+    """Độ dài tín hiệu tính bằng giây"""
+    return len(audio) / float(sr)
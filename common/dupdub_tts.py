@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import soundfile as sf
+from http_client import get_client
+import text_frontend
+
+# API endpoint
+url = "https://moyin-gateway.dupdub.com/tts/v1/playDemo/dubForSpeaker"
+
+# Client dùng chung: giữ kết nối keep-alive, có timeout và tự thử lại khi gặp 429/5xx
+http = get_client()
+
+def make_batches(sentences, max_sentences=10, max_chars=1000):
+    """
+    Gộp các câu thành từng lô gửi trong một lần gọi API (mỗi câu là một phần tử textList)
+
+    Parameters:
+        sentences (list): Danh sách câu
+        max_sentences (int): Số câu tối đa mỗi lô
+        max_chars (int): Tổng số ký tự tối đa mỗi lô
+
+    Returns:
+        list: Danh sách lô (mỗi lô là list câu)
+    """
+    batches, current, length = [], [], 0
+    for sentence in sentences:
+        if current and (len(current) >= max_sentences or length + len(sentence) > max_chars):
+            batches.append(current)
+            current, length = [], 0
+        current.append(sentence)
+        length += len(sentence)
+    if current:
+        batches.append(current)
+    return batches
+
+def request_batch(text_list, api_key, speaker, speed=0.85, pitch=0):
+    """
+    Gọi API DupDub cho một lô câu
+
+    Parameters:
+        text_list (list): Các câu cần tổng hợp
+        api_key (str): API key của DupDub
+        speaker (str): ID giọng đọc
+        speed (float): Tốc độ đọc
+        pitch (int): Cao độ
+
+    Returns:
+        list: Link file WAV của từng phần tử trong resList (theo thứ tự trả về)
+
+    Raises:
+        RuntimeError: Khi API trả về lỗi
+    """
+    headers = {
+        "dupdub_token": f"{api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "speaker": speaker,
+        "speed": speed,
+        "pitch": pitch,
+        "textList": text_list,
+        "source": "web",
+        "language": ""
+    }
+    response = http.post(url, json=payload, headers=headers, provider="dupdub")
+    if response.status_code != 200:
+        raise RuntimeError(f"Gọi API thất bại. Status code: {response.status_code}: {response.text[:200]}")
+
+    result = response.json()
+    if result.get('code') != 200 or not (result.get('data') or {}).get('resList'):
+        raise RuntimeError(f"Không tìm thấy URL âm thanh trong phản hồi: {result}")
+    return [item['result']['ossFile'] for item in result['data']['resList']]
+
+def download_file(audio_url, output_path, chunk_size=65536):
+    """
+    Tải file âm thanh, ghi thẳng từng khối ra đĩa thay vì giữ toàn bộ trong bộ nhớ
+
+    Returns:
+        str: Đường dẫn file đã tải
+    """
+    response = http.get(audio_url, stream=True, provider="dupdub-download")
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"Không thể tải file âm thanh. Status code: {response.status_code}")
+        with open(output_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+    finally:
+        response.close()
+    return output_path
+
+def merge_wav(part_paths, output_path, block_size=65536):
+    """Nối các file WAV (cùng định dạng) thành một file, đọc theo từng khối"""
+    with sf.SoundFile(part_paths[0]) as first:
+        samplerate, channels, subtype = first.samplerate, first.channels, first.subtype
+    with sf.SoundFile(output_path, 'w', samplerate=samplerate, channels=channels, subtype=subtype,
+                      format="WAV") as out:
+        for path in part_paths:
+            with sf.SoundFile(path) as part:
+                for block in part.blocks(blocksize=block_size):
+                    out.write(block)
+    return output_path
+
+def synthesize_dupdub(text, api_key, speaker, output_path="output.wav", parts_dir=None,
+                      on_part=None, max_sentences=10, max_chars=1000, max_workers=4,
+                      speed=0.85, pitch=0):
+    """
+    Chuyển đổi đoạn văn nhiều câu thành giọng nói bằng DupDub, raise khi lỗi (xem text_to_speech_dupdub)
+
+    Văn bản được tách câu và gộp thành lô: mỗi lô chỉ tốn một lần gọi API, các file của mọi phần
+    tử trong resList được tải song song ngay khi lô đó có kết quả (các lô cũng được gọi song song).
+
+    Parameters:
+        text (str): Văn bản cần chuyển đổi
+        api_key (str): API key của DupDub
+        speaker (str): ID giọng đọc
+        output_path (str): File WAV ghép toàn bộ các câu (None = chỉ giữ các file từng câu)
+        parts_dir (str, optional): Thư mục lưu file từng câu. Mặc định mỗi lần gọi dùng một thư mục
+            tạm riêng (tempfile.mkdtemp), bị xóa sau khi ghép xong nếu có output_path
+        on_part (callable, optional): Hàm gọi on_part(index, path) theo đúng thứ tự câu khi
+            mỗi file đã tải xong, để phát hoặc chuyển tiếp mà không cần chờ cả đoạn (file trong
+            thư mục tạm chỉ tồn tại đến khi hàm trả về)
+        max_sentences (int): Số câu tối đa mỗi lần gọi API
+        max_chars (int): Số ký tự tối đa mỗi lần gọi API
+        max_workers (int): Số luồng gọi API / tải file song song
+        speed (float): Tốc độ đọc
+        pitch (int): Cao độ
+
+    Returns:
+        str hoặc list: output_path, hoặc danh sách file từng câu nếu output_path=None
+
+    Raises:
+        RuntimeError: Khi không có câu nào, API trả về lỗi hoặc số file không khớp số câu
+    """
+    sentences = list(text_frontend.split_sentences(text, "vi"))
+    sentences = [sentence for sentence in sentences if sentence.strip()]
+    if not sentences:
+        raise RuntimeError("Không có câu nào để chuyển đổi")
+
+    # Thư mục riêng cho từng lần gọi để các lần gọi đồng thời không ghi đè file của nhau
+    own_parts_dir = parts_dir is None
+    if own_parts_dir:
+        parts_dir = tempfile.mkdtemp(prefix="dupdub_parts_")
+    else:
+        os.makedirs(parts_dir, exist_ok=True)
+    batches = make_batches(sentences, max_sentences, max_chars)
+    print(f"{len(sentences)} câu, {len(batches)} lần gọi API")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            batch_futures = [pool.submit(request_batch, batch, api_key, speaker, speed, pitch)
+                             for batch in batches]
+
+            download_futures = []
+            for batch, future in zip(batches, batch_futures):
+                audio_urls = future.result()
+                if len(audio_urls) != len(batch):
+                    # Không biết file nào ứng với câu nào: ghép tiếp sẽ lệch thứ tự hoặc mất câu
+                    raise RuntimeError(f"Gửi {len(batch)} câu nhưng DupDub trả về {len(audio_urls)} file")
+                for audio_url in audio_urls:
+                    index = len(download_futures)
+                    part_path = os.path.join(parts_dir, f"part_{index:03d}.wav")
+                    download_futures.append(pool.submit(download_file, audio_url, part_path))
+
+            part_paths = []
+            for index, future in enumerate(download_futures):
+                part_paths.append(future.result())
+                if on_part is not None:
+                    on_part(index, part_paths[-1])
+    except Exception:
+        if own_parts_dir:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        raise
+
+    if output_path is None:
+        return part_paths
+    try:
+        merge_wav(part_paths, output_path)
+    finally:
+        if own_parts_dir:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+    return output_path
+
+def text_to_speech_dupdub(text, api_key, speaker, output_path="output.wav", **kwargs):
+    """
+    Chuyển đổi đoạn văn nhiều câu thành giọng nói bằng DupDub
+
+    Parameters:
+        text (str): Văn bản cần chuyển đổi
+        api_key (str): API key của DupDub
+        speaker (str): ID giọng đọc
+        output_path (str): File WAV ghép toàn bộ các câu (None = chỉ giữ các file từng câu)
+        **kwargs: Tham số khác của synthesize_dupdub
+
+    Returns:
+        str hoặc list: output_path, hoặc danh sách file từng câu nếu output_path=None; None nếu lỗi
+    """
+    try:
+        result = synthesize_dupdub(text, api_key, speaker, output_path=output_path, **kwargs)
+    except Exception as e:
+        print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
+        return None
+    if output_path is not None:
+        print(f"File âm thanh đã được lưu thành công: {output_path}")
+    return result
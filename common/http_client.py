@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Thời gian chờ mặc định (giây): kết nối và đọc phản hồi
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 60))
+
+# Mã lỗi được thử lại với thời gian chờ tăng dần (tôn trọng header Retry-After)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# POST (tổng hợp giọng nói tính phí theo ký tự) chỉ được thử lại khi server chắc chắn chưa xử lý
+POST_RETRY_STATUS = (429, 503)
+
+# Phương thức idempotent: thử lại mọi lỗi kết nối, lỗi đọc và mã lỗi trong RETRY_STATUS
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+class ProviderRetry(Retry):
+    """
+    Retry phân biệt theo phương thức
+
+    POST không nằm trong allowed_methods nên không được thử lại khi lỗi đọc (request có thể đã
+    được xử lý và tính phí), nhưng vẫn được thử lại khi lỗi kết nối (chưa gửi đi) và khi server
+    từ chối rõ ràng bằng 429/503.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return status_code in POST_RETRY_STATUS
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _make_retry(total, backoff_factor):
+    kwargs = dict(
+        total=total,
+        connect=total,
+        read=total,
+        status=total,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return ProviderRetry(allowed_methods=IDEMPOTENT_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return ProviderRetry(method_whitelist=IDEMPOTENT_METHODS, **kwargs)
+
+
+class ProviderHTTPClient:
+    """
+    HTTP client dùng chung cho các nhà cung cấp TTS đám mây (ElevenLabs, Minimax, DupDub, ...)
+
+    Giữ kết nối keep-alive theo từng host (không phải bắt tay TCP + TLS mỗi lần gọi), đặt
+    timeout cho mọi request, tự thử lại khi gặp 429/5xx (POST chỉ khi lỗi kết nối hoặc 429/503,
+    xem ProviderRetry) và ghi lại độ trễ từng lần gọi.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, retries=3, backoff_factor=0.5,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, latency_window=200):
+        """
+        Args:
+            pool_connections (int): Số host được giữ pool kết nối
+            pool_maxsize (int): Số kết nối tối đa giữ lại cho mỗi host
+            retries (int): Số lần thử lại tối đa
+            backoff_factor (float): Hệ số thời gian chờ giữa các lần thử lại (0.5, 1, 2, ... giây)
+            connect_timeout (float): Thời gian chờ kết nối (giây)
+            read_timeout (float): Thời gian chờ đọc phản hồi (giây)
+            latency_window (int): Số lần gọi gần nhất được giữ để tính thống kê độ trễ
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=_make_retry(retries, backoff_factor),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=latency_window))
+        self._errors = defaultdict(int)
+
+    def request(self, method, url, provider=None, timeout=None, **kwargs):
+        """
+        Gửi request qua pool kết nối dùng chung
+
+        Args:
+            method (str): "GET", "POST", ...
+            url (str): Địa chỉ API
+            provider (str, optional): Tên nhà cung cấp để thống kê độ trễ (mặc định là host)
+            timeout (float hoặc tuple, optional): Ghi đè timeout mặc định
+            **kwargs: Tham số của requests (json, data, headers, stream, ...)
+
+        Returns:
+            requests.Response: Phản hồi (với stream=True, độ trễ tính đến khi nhận header)
+        """
+        provider = provider or urlparse(url).netloc
+        start = time.time()
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException:
+            self._record(provider, time.time() - start, error=True)
+            raise
+        self._record(provider, time.time() - start, error=response.status_code >= 400)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, provider, latency, error=False):
+        with self._lock:
+            self._latencies[provider].append(latency)
+            if error:
+                self._errors[provider] += 1
+
+    def latency_stats(self):
+        """
+        Thống kê độ trễ theo nhà cung cấp
+
+        Returns:
+            dict: {provider: {"count", "errors", "avg", "p50", "p95"}} (giây)
+        """
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._latencies.items()}
+            errors = dict(self._errors)
+
+        stats = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            stats[name] = {
+                "count": len(values),
+                "errors": errors.get(name, 0),
+                "avg": sum(values) / len(values),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Trả về client dùng chung cho toàn bộ tiến trình (tạo khi gọi lần đầu)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ProviderHTTPClient()
+    return _client
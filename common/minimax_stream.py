@@ -0,0 +1,55 @@
+import json
+
+# Ở chế độ stream, Minimax t2a_v2 trả về các dòng SSE "data: {...}": mỗi dòng status=1 chứa một
+# đoạn audio dạng hex, dòng cuối (status=2) lặp lại toàn bộ audio nên không cần đọc.
+
+
+def parse_line(line):
+    """
+    Phân tích một dòng trong phản hồi stream của Minimax
+
+    Args:
+        line (bytes): Một dòng của phản hồi
+
+    Returns:
+        bytes hoặc None: Đoạn audio đã giải mã hex (b"" nếu dòng không có audio), None khi gặp
+            dòng tổng hợp cuối stream (status=2) - người gọi dừng đọc tại đây
+
+    Raises:
+        RuntimeError: Khi Minimax báo lỗi (sai key, hết hạn mức, ...)
+    """
+    line = line.strip()
+    if not line:
+        return b""
+    if not line.startswith(b"data:"):
+        # Khi lỗi Minimax trả về JSON thường thay vì SSE
+        message = (json.loads(line).get("base_resp") or {}).get("status_msg")
+        raise RuntimeError(f"Minimax không trả về audio: {message}")
+
+    event = json.loads(line[len(b"data:"):])
+    base_resp = event.get("base_resp") or {}
+    if base_resp.get("status_code", 0) != 0:
+        raise RuntimeError(f"Minimax báo lỗi: {base_resp.get('status_msg')}")
+
+    data = event.get("data") or {}
+    if data.get("status") == 2:
+        return None
+    return bytes.fromhex(data["audio"]) if data.get("audio") else b""
+
+
+def iter_audio(lines):
+    """
+    Duyệt các dòng của phản hồi stream và trả về từng đoạn audio ngay khi nhận được
+
+    Args:
+        lines (iterable): Các dòng bytes (vd: response.iter_lines() của requests)
+
+    Returns:
+        generator: Các khối bytes audio
+    """
+    for line in lines:
+        chunk = parse_line(line)
+        if chunk is None:
+            return
+        if chunk:
+            yield chunk
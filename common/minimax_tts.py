@@ -0,0 +1,134 @@
+import os
+import time
+from http_client import get_client
+import minimax_stream
+
+def iter_speech_minimax(text, api_key, group_id, voice_id="Grinch", model="speech-02-hd",
+                        speed=1, vol=1, pitch=0, sample_rate=32000, bitrate=128000, audio_format="mp3"):
+    """
+    Gọi Minimax t2a_v2 ở chế độ stream và trả về audio theo từng khối ngay khi nhận được
+
+    Ở chế độ stream, Minimax trả về các dòng SSE "data: {...}", mỗi dòng chứa một đoạn audio
+    dạng hex (status=1). Dòng cuối (status=2) lặp lại toàn bộ audio nên được bỏ qua. Mỗi đoạn
+    được giải mã hex ngay khi đến, không cần giữ toàn bộ phản hồi trong bộ nhớ.
+
+    Parameters:
+        text (str): Văn bản cần chuyển thành giọng nói
+        api_key (str): API key của Minimax
+        group_id (str): GroupId của tài khoản Minimax
+        voice_id (str): ID giọng nói
+        model (str): Model Minimax
+        speed, vol, pitch: Tham số giọng nói
+        sample_rate, bitrate, audio_format: Tham số audio đầu ra
+
+    Returns:
+        generator: Các khối bytes audio
+
+    Raises:
+        RuntimeError: Khi API trả về lỗi
+    """
+    url = f"https://api.minimaxi.chat/v1/t2a_v2?GroupId={group_id}"
+    payload = {
+        "model": model,
+        "text": text,
+        "stream": True,
+        "subtitle_enable": False,
+        "voice_setting": {
+            "voice_id": voice_id,
+            "speed": speed,
+            "vol": vol,
+            "pitch": pitch
+        },
+        "audio_setting": {
+            "sample_rate": sample_rate,
+            "bitrate": bitrate,
+            "format": audio_format,
+            "channel": 1
+        }
+    }
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+
+    response = get_client().post(url, stream=True, headers=headers, json=payload, provider="minimax")
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"Minimax trả về lỗi {response.status_code}: {response.text[:200]}")
+
+        yield from minimax_stream.iter_audio(response.iter_lines())
+    finally:
+        response.close()
+
+def synthesize_minimax(text, api_key, group_id, output_path="output.mp3", sink=None, **kwargs):
+    """
+    Ghi audio Minimax ra file (và sink) theo từng khối khi nhận được, raise khi lỗi
+
+    Parameters:
+        text (str): Văn bản cần chuyển thành giọng nói
+        api_key (str): API key của Minimax
+        group_id (str): GroupId của tài khoản Minimax
+        output_path (str): Đường dẫn tới file output
+        sink (callable, optional): Hàm nhận từng khối bytes
+        **kwargs: Tham số khác của iter_speech_minimax
+
+    Returns:
+        str: output_path
+
+    Raises:
+        RuntimeError: Khi API trả về lỗi hoặc không có dữ liệu audio (file rỗng bị xóa)
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    received = False
+    with open(output_path, 'wb') as f:
+        for chunk in iter_speech_minimax(text, api_key, group_id, **kwargs):
+            f.write(chunk)
+            if sink is not None:
+                sink(chunk)
+            received = True
+    if not received:
+        os.remove(output_path)
+        raise RuntimeError("Minimax không trả về dữ liệu audio")
+    return output_path
+
+def text_to_speech_minimax(text, api_key, group_id, output_path="output.mp3", sink=None, **kwargs):
+    """
+    Chuyển đổi văn bản thành giọng nói bằng Minimax, ghi từng khối audio ra file (và sink) khi nhận được
+
+    Parameters:
+        text (str): Văn bản cần chuyển thành giọng nói
+        api_key (str): API key của Minimax
+        group_id (str): GroupId của tài khoản Minimax
+        output_path (str): Đường dẫn tới file output
+        sink (callable, optional): Hàm nhận từng khối bytes (ví dụ trình phát hoặc HTTP response)
+        **kwargs: Tham số khác của iter_speech_minimax
+
+    Returns:
+        str: Đường dẫn tới file audio đã tạo hoặc None nếu lỗi
+    """
+    print(f"Đang gửi yêu cầu text-to-speech cho văn bản: {text[:50]}...")
+    start_time = time.time()
+    first_chunk_time = None
+    total_bytes = 0
+
+    def on_chunk(chunk):
+        nonlocal first_chunk_time, total_bytes
+        if first_chunk_time is None:
+            first_chunk_time = time.time() - start_time
+        total_bytes += len(chunk)
+        if sink is not None:
+            sink(chunk)
+
+    try:
+        synthesize_minimax(text, api_key, group_id, output_path, sink=on_chunk, **kwargs)
+    except Exception as e:
+        print(f"Lỗi: {str(e)}")
+        return None
+
+    print(f"Khối audio đầu tiên sau {first_chunk_time:.2f} giây, "
+          f"hoàn tất sau {time.time() - start_time:.2f} giây ({total_bytes} bytes)")
+    print(f"Đã tạo thành công file audio: {output_path}")
+    return output_path
@@ -0,0 +1,86 @@
+import json
+import hashlib
+import threading
+
+
+def make_key(*parts):
+    """
+    Tạo khóa cho một yêu cầu tổng hợp từ các tham số ảnh hưởng đến kết quả
+
+    Args:
+        *parts: Các giá trị (văn bản, giọng, model, tham số, ...) - phải chuyển được sang JSON
+
+    Returns:
+        str: Hash SHA-1 của các tham số
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """Một lần thực thi đang diễn ra, các request trùng khóa chờ trên event"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các request giống nhau đang chạy đồng thời thành một lần thực thi
+
+    Request đầu tiên với một khóa sẽ thực thi hàm, các request cùng khóa đến trong lúc đó chỉ
+    chờ và nhận chung kết quả (hoặc ngoại lệ). Khi hoàn tất, khóa được giải phóng nên request
+    đến sau sẽ thực thi lại - đây không phải cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Thực thi fn(*args, **kwargs) hoặc chờ lần thực thi đang chạy với cùng khóa
+
+        Args:
+            key (str): Khóa của yêu cầu (xem make_key)
+            fn (callable): Hàm thực hiện yêu cầu
+
+        Returns:
+            tuple: (kết quả, shared) - shared=True nếu dùng chung kết quả của request khác
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Số yêu cầu đang được thực thi"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,89 @@
+import os
+from functools import lru_cache
+
+# Số đoạn văn bản đã chuẩn hóa + tách câu được giữ lại (câu trả lời và bài học lặp lại rất nhiều)
+CACHE_SIZE = int(os.environ.get("TTS_TEXT_CACHE_SIZE", 1024))
+
+# Các quy tắc thay thế sau TTSnorm, áp dụng lần lượt theo đúng thứ tự (như chuỗi .replace() nối
+# tiếp trước đây): kết quả của quy tắc trước có thể được quy tắc sau thay tiếp, vd " .." -> " ." -> "."
+REPLACEMENTS = {
+    "..": ".",
+    "!.": "!",
+    "?.": "?",
+    " .": ".",
+    " ,": ",",
+    '"': "",
+    "'": "",
+    "AI": "Ây Ai",
+    "A.I": "Ây Ai",
+    "+": "cộng",
+    "-": "trừ",
+    "*": "nhân",
+    "/": "chia",
+    "=": "bằng",
+}
+
+def apply_replacements(text):
+    """Áp dụng lần lượt các quy tắc trong REPLACEMENTS"""
+    for old, new in REPLACEMENTS.items():
+        text = text.replace(old, new)
+    return text
+
+
+def normalize_vietnamese(text):
+    """
+    Chuẩn hóa văn bản tiếng Việt cho TTS (TTSnorm + các quy tắc thay thế)
+
+    Args:
+        text (str): Văn bản cần chuẩn hóa
+
+    Returns:
+        str: Văn bản đã chuẩn hóa, hoặc văn bản gốc nếu có lỗi
+    """
+    try:
+        # Import khi cần để tiến trình khởi động nhanh hơn
+        from vinorm import TTSnorm
+        return apply_replacements(TTSnorm(text, unknown=False, lower=False, rule=True))
+    except Exception:
+        print("Lỗi khi chuẩn hóa văn bản tiếng Việt, sử dụng văn bản gốc")
+        return text
+
+
+def split_sentences(text, lang_code="vi"):
+    """
+    Tách văn bản thành các câu theo ngôn ngữ
+
+    Args:
+        text (str): Văn bản đầu vào
+        lang_code (str): Mã ngôn ngữ
+
+    Returns:
+        list: Danh sách câu
+    """
+    if lang_code in ["ja", "zh-cn"]:
+        return text.split("。")
+    from underthesea import sent_tokenize
+    return sent_tokenize(text)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def prepare(text, lang_code="vi", normalize=True):
+    """
+    Chuẩn hóa (với tiếng Việt) và tách câu, kết quả được cache theo văn bản đầu vào
+
+    Args:
+        text (str): Văn bản đầu vào (thường là một đoạn văn)
+        lang_code (str): Mã ngôn ngữ
+        normalize (bool): Có chuẩn hóa văn bản tiếng Việt hay không
+
+    Returns:
+        tuple: Các câu không rỗng
+    """
+    if normalize and lang_code == "vi":
+        text = normalize_vietnamese(text)
+    return tuple(sentence for sentence in split_sentences(text, lang_code) if sentence.strip())
+
+
+def cache_info():
+    """Thống kê cache của prepare (hits, misses, maxsize, currsize)"""
+    return prepare.cache_info()
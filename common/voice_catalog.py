@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import threading
+
+from http_client import get_client
+
+# File cache danh sách giọng và thời gian sống (giây) trước khi được làm mới ở nền
+CATALOG_PATH = os.environ.get("VOICE_CATALOG_PATH", "voice_cache/voice_catalog.json")
+CATALOG_TTL = float(os.environ.get("VOICE_CATALOG_TTL", 24 * 3600))
+
+# Danh sách có sẵn, dùng khi chưa có cache và chưa tải được từ API
+SEED_VOICES = {
+    "elevenlabs": {
+        "callum": "N2lVS1w4EtoT3dr4eOWO",
+        "alice": "Xb7hH8MSUJpSbSDYk0k2",
+        "aria": "9BWtsMINqrJLrRacOk9x",
+        "rachel": "21m00Tcm4TlvDq8ikWAM",
+        "bill": "pqHfZKP75CvOlQylNhV4",
+        "brian": "nPczCjzI2devNBz1zQrb",
+        "domi": "AZnzlk1XvdvUeBnXmlld",
+        "elli": "MF3mGyEYCl7XYWbV9V6O",
+        "nicole": "MF3mGyEYCl7XYWbV9V6O",
+        "harry": "SOYHLrjzK2X1ezoPC6cr",
+        "ethan": "g5CIjZEefAph4nQFvHAz"
+    },
+    "dupdub": {
+        "luke": "uranus||||b4f0a08396ed164c2a7a9abfd1e4b02b",
+        "spoony": "uranus||||c2d38855d8f15bedd8d3881fd6d85647"
+    },
+}
+
+
+def fetch_elevenlabs(api_key):
+    """
+    Tải danh sách giọng của tài khoản ElevenLabs
+
+    Returns:
+        dict: {tên giọng (chữ thường): voice_id}
+    """
+    response = get_client().get("https://api.elevenlabs.io/v1/voices",
+                                headers={"xi-api-key": api_key}, provider="elevenlabs-voices")
+    response.raise_for_status()
+    return {voice["name"].strip().lower(): voice["voice_id"] for voice in response.json().get("voices", [])}
+
+
+def fetch_dupdub(api_key, language="Vietnamese"):
+    """
+    Tải danh sách giọng đọc DupDub theo ngôn ngữ
+
+    Theo tài liệu API searchSpeakerList, "data" là danh sách giọng, mỗi phần tử có "speaker"
+    (ID dùng khi gọi TTS) và "name" (tên hiển thị).
+
+    Returns:
+        dict: {tên giọng (chữ thường): speaker}
+
+    Raises:
+        RuntimeError: Khi API báo lỗi hoặc phản hồi không có danh sách giọng như tài liệu
+    """
+    url = f"https://moyin-gateway.dupdub.com/tts/v1/storeSpeakerV2/searchSpeakerList?language={language}"
+    response = get_client().get(url, headers={"dupdub_token": api_key}, provider="dupdub-voices")
+    response.raise_for_status()
+    result = response.json()
+    if result.get("code") != 200:
+        raise RuntimeError(f"DupDub báo lỗi: {result.get('msg')}")
+    data = result.get("data")
+    if not isinstance(data, list):
+        raise RuntimeError(f"Phản hồi DupDub không có danh sách giọng trong 'data': {str(result)[:200]}")
+
+    voices = {}
+    skipped = 0
+    for item in data:
+        name, speaker = item.get("name"), item.get("speaker")
+        if not name or not speaker:
+            skipped += 1
+            continue
+        voices[name.strip().lower()] = speaker
+    if skipped:
+        print(f"Bỏ qua {skipped} giọng DupDub thiếu trường name/speaker")
+    return voices
+
+
+class VoiceCatalog:
+    """
+    Danh sách giọng của các nhà cung cấp TTS, phục vụ tra cứu từ bộ nhớ
+
+    Danh sách được nạp từ file cache (hoặc SEED_VOICES) khi khởi tạo; việc tải lại từ API chỉ
+    chạy ở luồng nền khi cache quá TTL, nên tra cứu giọng không bao giờ gọi mạng trong request.
+    """
+
+    def __init__(self, fetchers, cache_path=CATALOG_PATH, ttl=CATALOG_TTL):
+        """
+        Args:
+            fetchers (dict): {nhà cung cấp: hàm không tham số trả về {tên: id}}
+            cache_path (str): Đường dẫn file cache JSON
+            ttl (float): Thời gian (giây) trước khi danh sách được làm mới
+        """
+        self.fetchers = fetchers
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._voices = {provider: dict(voices) for provider, voices in SEED_VOICES.items()}
+        self._updated = {}
+        self._refresh_thread = None
+        self._load()
+
+    def _load(self):
+        """Nạp cache từ đĩa (kể cả khi đã quá TTL - dữ liệu cũ vẫn tốt hơn danh sách có sẵn)"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            for provider, entry in cached.items():
+                if entry.get("voices"):
+                    self._voices[provider] = entry["voices"]
+                    self._updated[provider] = entry.get("updated", 0)
+        except Exception as e:
+            print(f"Không thể đọc cache danh sách giọng: {str(e)}")
+
+    def _save(self):
+        with self._lock:
+            data = {provider: {"voices": voices, "updated": self._updated.get(provider, 0)}
+                    for provider, voices in self._voices.items() if provider in self._updated}
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def voices(self, provider):
+        """
+        Danh sách giọng của một nhà cung cấp (từ bộ nhớ, không gọi mạng)
+
+        Returns:
+            dict: {tên giọng: id} - không sửa trực tiếp dict này
+        """
+        return self._voices.get(provider, {})
+
+    def resolve(self, provider, name):
+        """
+        Tra id giọng theo tên (không phân biệt hoa thường)
+
+        Returns:
+            str: id giọng hoặc None nếu không có
+        """
+        if not name:
+            return None
+        return self.voices(provider).get(name.strip().lower())
+
+    def is_stale(self, provider):
+        return time.time() - self._updated.get(provider, 0) > self.ttl
+
+    def refresh(self, providers=None, force=False):
+        """
+        Tải lại danh sách giọng từ API và ghi cache (chạy đồng bộ, dùng ở luồng nền hoặc script)
+
+        Args:
+            providers (list, optional): Các nhà cung cấp cần tải (mặc định tất cả)
+            force (bool): Tải lại cả khi cache chưa quá TTL
+
+        Returns:
+            list: Các nhà cung cấp đã cập nhật
+        """
+        updated = []
+        for provider in providers or list(self.fetchers):
+            if not force and not self.is_stale(provider):
+                continue
+            try:
+                voices = self.fetchers[provider]()
+            except Exception as e:
+                print(f"Không thể tải danh sách giọng {provider}: {str(e)}")
+                continue
+            if not voices:
+                continue
+            # Giữ các tên có sẵn để giọng mặc định trong code vẫn tra được
+            voices = {**SEED_VOICES.get(provider, {}), **voices}
+            with self._lock:
+                # Thay cả dict để luồng đang đọc không thấy dữ liệu dở dang
+                self._voices[provider] = voices
+                self._updated[provider] = time.time()
+            updated.append(provider)
+        if updated:
+            try:
+                self._save()
+            except Exception as e:
+                print(f"Không thể ghi cache danh sách giọng: {str(e)}")
+        return updated
+
+    def start_background_refresh(self, interval=None):
+        """Chạy luồng nền làm mới danh sách ngay khi cần rồi định kỳ kiểm tra TTL"""
+        if self._refresh_thread is not None:
+            return
+        interval = interval or min(self.ttl, 3600)
+
+        def loop():
+            while True:
+                self.refresh()
+                time.sleep(interval)
+
+        self._refresh_thread = threading.Thread(target=loop, daemon=True, name="voice-catalog")
+        self._refresh_thread.start()
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    Trả về catalog dùng chung (tạo khi gọi lần đầu và bắt đầu làm mới ở nền)
+
+    API key lấy từ biến môi trường ELEVEN_API_KEY (hoặc api_text2speech) và api_dupdub;
+    nhà cung cấp không có key chỉ dùng cache / danh sách có sẵn.
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                fetchers = {}
+                eleven_key = os.environ.get("ELEVEN_API_KEY") or os.environ.get("api_text2speech")
+                if eleven_key:
+                    fetchers["elevenlabs"] = lambda: fetch_elevenlabs(eleven_key)
+                dupdub_key = os.environ.get("api_dupdub")
+                if dupdub_key:
+                    fetchers["dupdub"] = lambda: fetch_dupdub(dupdub_key)
+                _catalog = VoiceCatalog(fetchers)
+                _catalog.start_background_refresh()
+    return _catalog
@@ -0,0 +1,223 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import torch
+
+from audio_io import file_hash
+
+# Các định dạng file giọng mẫu được tính trước khi khởi động
+VOICE_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg")
+
+
+def model_version(model_path):
+    """
+    Tạo định danh phiên bản model từ kích thước và thời gian sửa đổi của các file checkpoint
+
+    Args:
+        model_path (str): Thư mục chứa model.pth, config.json, vocab.json
+
+    Returns:
+        str: Chuỗi định danh ngắn, thay đổi khi file model thay đổi
+    """
+    h = hashlib.sha1()
+    for name in ("model.pth", "config.json", "vocab.json"):
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            h.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:12]
+
+
+class VoiceLatentStore:
+    """
+    Lưu conditioning latents (gpt_cond_latent, speaker_embedding) của XTTS cho từng giọng mẫu
+
+    Latents được tính một lần cho mỗi file giọng, khóa theo hash nội dung + phiên bản model,
+    giữ trong bộ nhớ (LRU) và lưu xuống đĩa. Khi file giọng thay đổi, hash đổi theo nên
+    latents cũ tự động không còn được dùng.
+
+    Với giọng do người dùng tải lên, hash nội dung đóng vai trò "voice handle": client gửi lại
+    handle thay cho file ở các request sau (xem get_latents_for_bytes, get_latents_by_handle).
+    """
+
+    def __init__(self, model, version, cache_dir="voice_cache", max_memory_items=16, persist=True):
+        """
+        Args:
+            model: Model XTTS đã nạp
+            version (str): Định danh phiên bản model (xem model_version)
+            cache_dir (str): Thư mục lưu latents trên đĩa
+            max_memory_items (int): Số giọng giữ trong bộ nhớ
+            persist (bool): Có lưu latents xuống đĩa hay chỉ giữ trong bộ nhớ
+        """
+        self.model = model
+        self.version = version
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.persist = persist
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        if persist:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    def _remember(self, key, latents):
+        with self._lock:
+            self._memory[key] = latents
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        """Tìm latents trong bộ nhớ rồi trên đĩa, trả về None nếu chưa có"""
+        with self._lock:
+            latents = self._memory.get(key)
+            if latents is not None:
+                self._memory.move_to_end(key)
+                return latents
+
+        cache_path = self._cache_path(key)
+        if self.persist and os.path.exists(cache_path):
+            try:
+                data = torch.load(cache_path, map_location=self.model.device)
+                latents = (data["gpt_cond_latent"], data["speaker_embedding"])
+            except Exception as e:
+                print(f"Không đọc được cache giọng {cache_path}: {e}")
+                return None
+            self._remember(key, latents)
+            return latents
+        return None
+
+    def _compute(self, voice_path, key):
+        gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
+            audio_path=voice_path,
+            gpt_cond_len=self.model.config.gpt_cond_len,
+            max_ref_length=self.model.config.max_ref_len,
+            sound_norm_refs=self.model.config.sound_norm_refs,
+        )
+        latents = (gpt_cond_latent, speaker_embedding)
+
+        if self.persist:
+            # Ghi ra file tạm rồi đổi tên để không để lại file hỏng khi bị dừng giữa chừng
+            cache_path = self._cache_path(key)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            torch.save({"gpt_cond_latent": gpt_cond_latent.cpu(),
+                        "speaker_embedding": speaker_embedding.cpu()}, tmp_path)
+            os.replace(tmp_path, cache_path)
+
+        self._remember(key, latents)
+        return latents
+
+    def _get_or_compute(self, key, compute):
+        """Tra cache theo khóa, nếu chưa có thì gọi compute() đúng một lần cho mỗi khóa"""
+        latents = self._lookup(key)
+        if latents is not None:
+            return latents
+
+        # Nhiều request cùng giọng chỉ tính latents một lần
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            latents = self._lookup(key)
+            if latents is None:
+                latents = compute()
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return latents
+
+    def _key(self, content_hash):
+        return f"{content_hash}_{self.version}"
+
+    def key_for(self, voice_path):
+        """Khóa cache của một file giọng (hash nội dung + phiên bản model)"""
+        return self._key(file_hash(voice_path))
+
+    def get_latents(self, voice_path):
+        """
+        Lấy conditioning latents cho file giọng mẫu, tính mới nếu chưa có trong cache
+
+        Args:
+            voice_path (str): Đường dẫn đến file giọng mẫu
+
+        Returns:
+            tuple: (gpt_cond_latent, speaker_embedding)
+        """
+        key = self.key_for(voice_path)
+        return self._get_or_compute(key, lambda: self._compute(voice_path, key))
+
+    def get_latents_by_handle(self, handle):
+        """
+        Lấy latents của giọng đã tải lên trước đó theo voice handle
+
+        Args:
+            handle (str): Voice handle trả về từ get_latents_for_bytes
+
+        Returns:
+            tuple: (gpt_cond_latent, speaker_embedding) hoặc None nếu handle không hợp lệ/đã bị loại khỏi cache
+        """
+        if not handle or not all(c in "0123456789abcdef" for c in handle):
+            return None
+        return self._lookup(self._key(handle))
+
+    def get_latents_for_bytes(self, data, suffix=".wav", tmp_dir=None):
+        """
+        Lấy conditioning latents cho dữ liệu audio tải lên, tính mới nếu chưa có trong cache
+
+        Args:
+            data (bytes): Nội dung file giọng mẫu
+            suffix (str): Phần mở rộng của file (để đọc đúng định dạng)
+            tmp_dir (str, optional): Thư mục ghi file tạm khi cần tính latents
+
+        Returns:
+            tuple: (handle, (gpt_cond_latent, speaker_embedding), cached) - cached=True nếu không phải tính lại
+        """
+        handle = hashlib.sha1(data).hexdigest()
+        key = self._key(handle)
+        computed = []
+
+        def compute():
+            computed.append(True)
+            # get_conditioning_latents cần đường dẫn file nên chỉ ghi ra file tạm khi thực sự phải tính
+            fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=tmp_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                return self._compute(tmp_path, key)
+            finally:
+                os.remove(tmp_path)
+
+        latents = self._get_or_compute(key, compute)
+        return handle, latents, not computed
+
+    def precompute(self, voice_paths):
+        """
+        Tính trước latents cho danh sách file giọng hoặc thư mục chứa giọng mẫu
+
+        Args:
+            voice_paths (iterable): Đường dẫn file hoặc thư mục
+
+        Returns:
+            int: Số giọng đã sẵn sàng
+        """
+        ready = 0
+        for path in voice_paths:
+            if os.path.isdir(path):
+                files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(VOICE_EXTENSIONS)]
+            elif os.path.exists(path):
+                files = [path]
+            else:
+                continue
+
+            for voice_file in files:
+                try:
+                    self.get_latents(voice_file)
+                    ready += 1
+                except Exception as e:
+                    print(f"Không thể tính latents cho giọng {voice_file}: {e}")
+        return ready
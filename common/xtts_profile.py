@@ -0,0 +1,271 @@
+import os
+import time
+import argparse
+
+import torch
+from torch import nn
+
+# Các cấu hình chạy XTTS trên CPU
+# - quantize: lượng tử hóa động int8 các lớp Linear của GPT (phần sinh token tự hồi quy)
+# - compile: biên dịch bộ giải mã HiFi-GAN bằng torch.compile
+# Mọi cấu hình đều đặt số luồng và chạy warm-up khi khởi động.
+PROFILES = {
+    "default": {"quantize": False, "compile": False},
+    "int8": {"quantize": True, "compile": False},
+    "int8-compile": {"quantize": True, "compile": True},
+}
+
+DEFAULT_PROFILE = os.environ.get("XTTS_PROFILE", "default")
+WARMUP_TEXT = "Xin chào, đây là câu khởi động mô hình."
+
+
+def available_cpus():
+    """Số CPU tiến trình được phép dùng"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    """
+    Đặt số luồng cho PyTorch
+
+    Args:
+        intra_op (int, optional): Số luồng trong một phép toán (mặc định XTTS_NUM_THREADS hoặc số CPU)
+        inter_op (int, optional): Số luồng chạy song song giữa các phép toán (mặc định 1,
+            vì XTTS sinh token tuần tự)
+
+    Returns:
+        tuple: (intra_op, inter_op) thực tế
+    """
+    intra_op = intra_op or int(os.environ.get("XTTS_NUM_THREADS", available_cpus()))
+    inter_op = inter_op or int(os.environ.get("XTTS_NUM_INTEROP_THREADS", 1))
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(inter_op)
+    except RuntimeError:
+        # Chỉ đặt được trước khi PyTorch chạy phép toán song song đầu tiên
+        pass
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def _replace_conv1d(module):
+    """
+    Đổi các lớp Conv1D của transformers (GPT-2) thành nn.Linear tương đương
+
+    quantize_dynamic chỉ nhận nn.Linear, còn GPT-2 dùng Conv1D với trọng số chuyển vị.
+    """
+    for name, child in module.named_children():
+        if type(child).__name__ == "Conv1D" and hasattr(child, "nf"):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _replace_conv1d(child)
+
+
+def quantize_gpt(model):
+    """
+    Lượng tử hóa động int8 các lớp Linear của GPT dùng khi inference (chỉ áp dụng trên CPU)
+
+    Chỉ gpt_inference (transformer + lm_head) bị thay đổi; bộ mã hóa điều kiện và speaker
+    encoder giữ float32 nên conditioning latents đã cache vẫn dùng được.
+
+    Args:
+        model: Model XTTS đã nạp checkpoint
+    """
+    gpt_inference = model.gpt.gpt_inference
+    _replace_conv1d(gpt_inference.transformer)
+    torch.ao.quantization.quantize_dynamic(gpt_inference, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def compile_decoder(model):
+    """Biên dịch bộ giải mã HiFi-GAN (chỉ gồm tích chập) bằng torch.compile, độ dài đầu vào thay đổi"""
+    decoder = model.hifigan_decoder
+    decoder.waveform_decoder = torch.compile(decoder.waveform_decoder, dynamic=True)
+
+
+def apply_profile(model, profile=None, device="cpu", num_threads=None):
+    """
+    Áp dụng cấu hình inference cho model XTTS
+
+    Args:
+        model: Model XTTS đã nạp checkpoint
+        profile (str, optional): Tên cấu hình trong PROFILES (mặc định biến môi trường XTTS_PROFILE)
+        device (str): Thiết bị đang chạy model
+        num_threads (int, optional): Số luồng intra-op (mặc định xem configure_threads). Tiến trình
+            sẽ fork ra worker nên đặt 1: thread pool OpenMP/MKL tạo trước khi fork có thể làm worker treo
+
+    Returns:
+        dict: Các thiết lập đã áp dụng
+    """
+    profile = profile or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        print(f"Không có cấu hình XTTS {profile}, sử dụng cấu hình default")
+        profile = "default"
+    options = PROFILES[profile]
+
+    model.eval()
+    applied = {"profile": profile, "quantized": False, "compiled": False}
+    if device == "cpu":
+        applied["threads"], applied["interop_threads"] = configure_threads(num_threads)
+        if options["quantize"]:
+            try:
+                quantize_gpt(model)
+                applied["quantized"] = True
+            except Exception as e:
+                print(f"Không thể lượng tử hóa GPT: {e}")
+
+    if options["compile"]:
+        try:
+            compile_decoder(model)
+            applied["compiled"] = True
+        except Exception as e:
+            print(f"Không thể biên dịch bộ giải mã: {e}")
+
+    print(f"Cấu hình XTTS: {applied}")
+    return applied
+
+
+def warmup(model, gpt_cond_latent, speaker_embedding, language="vi", text=WARMUP_TEXT):
+    """
+    Chạy một lần tổng hợp để khởi tạo bộ nhớ, kernel và (nếu có) đồ thị đã biên dịch
+
+    Args:
+        model: Model XTTS
+        gpt_cond_latent, speaker_embedding: Conditioning latents của một giọng bất kỳ
+        language (str): Mã ngôn ngữ
+        text (str): Câu dùng để warm-up
+
+    Returns:
+        float: Thời gian warm-up (giây)
+    """
+    start = time.time()
+    model.inference(
+        text=text,
+        language=language,
+        gpt_cond_latent=gpt_cond_latent,
+        speaker_embedding=speaker_embedding,
+        temperature=0.3,
+        length_penalty=1.0,
+        repetition_penalty=10.0,
+        top_k=30,
+        top_p=0.85,
+    )
+    elapsed = time.time() - start
+    print(f"Warm-up XTTS: {elapsed:.2f} giây")
+    return elapsed
+
+
+def load_xtts(model_path, device="cpu"):
+    """Nạp model XTTS từ thư mục chứa model.pth, config.json, vocab.json"""
+    from TTS.tts.configs.xtts_config import XttsConfig
+    from TTS.tts.models.xtts import Xtts
+
+    config = XttsConfig()
+    config.load_json(os.path.join(model_path, "config.json"))
+    model = Xtts.init_from_config(config)
+    model.load_checkpoint(config, checkpoint_dir=model_path, use_deepspeed=False)
+    model.to(device)
+    return model
+
+
+def benchmark(model_path, voice_path, profiles, texts, language="vi", runs=3, device="cpu"):
+    """
+    So sánh các cấu hình: độ trễ request đầu tiên (không warm-up) và hệ số thời gian thực (RTF)
+
+    Mỗi cấu hình được nạp lại model từ đầu để đo đúng độ trễ khởi động.
+
+    Args:
+        model_path (str): Thư mục model
+        voice_path (str): File giọng mẫu
+        profiles (list): Tên các cấu hình cần đo
+        texts (list): Các câu dùng để đo
+        language (str): Mã ngôn ngữ
+        runs (int): Số lượt đo cho mỗi câu
+        device (str): Thiết bị
+
+    Returns:
+        list: Kết quả mỗi cấu hình (dict)
+    """
+    results = []
+    sample_rate = 24000
+    for profile in profiles:
+        print(f"\n===== Cấu hình {profile} =====")
+        start_load = time.time()
+        model = load_xtts(model_path, device)
+        applied = apply_profile(model, profile, device)
+        load_time = time.time() - start_load
+
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+            audio_path=voice_path,
+            gpt_cond_len=model.config.gpt_cond_len,
+            max_ref_length=model.config.max_ref_len,
+            sound_norm_refs=model.config.sound_norm_refs,
+        )
+
+        # Request đầu tiên sau khi nạp (đây chính là phần warm-up loại bỏ khi phục vụ)
+        first_latency = warmup(model, gpt_cond_latent, speaker_embedding, language, texts[0])
+
+        synth_time = 0.0
+        audio_seconds = 0.0
+        for _ in range(runs):
+            for text in texts:
+                start = time.time()
+                out = model.inference(
+                    text=text,
+                    language=language,
+                    gpt_cond_latent=gpt_cond_latent,
+                    speaker_embedding=speaker_embedding,
+                    temperature=0.3,
+                    length_penalty=1.0,
+                    repetition_penalty=10.0,
+                    top_k=30,
+                    top_p=0.85,
+                )
+                synth_time += time.time() - start
+                audio_seconds += len(out["wav"]) / sample_rate
+
+        result = {
+            "profile": profile,
+            "quantized": applied["quantized"],
+            "compiled": applied["compiled"],
+            "load_time": load_time,
+            "first_request_latency": first_latency,
+            "avg_latency": synth_time / (runs * len(texts)),
+            "rtf": synth_time / audio_seconds if audio_seconds else float("nan"),
+        }
+        results.append(result)
+        del model
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo hiệu năng các cấu hình inference XTTS trên CPU")
+    parser.add_argument("--model-path", default="model", help="Thư mục chứa model XTTS")
+    parser.add_argument("--voice", default="model/vi_sample.wav", help="File giọng mẫu")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES),
+                        help="Các cấu hình cần đo")
+    parser.add_argument("--text", action="append",
+                        help="Câu dùng để đo (có thể lặp lại tham số)")
+    parser.add_argument("--language", default="vi", help="Mã ngôn ngữ")
+    parser.add_argument("--runs", type=int, default=3, help="Số lượt đo cho mỗi câu")
+    parser.add_argument("--device", default="cpu", help="Thiết bị (cpu hoặc cuda)")
+    args = parser.parse_args()
+
+    texts = args.text or [
+        "Xin chào các em, hôm nay chúng ta sẽ học về phép cộng.",
+        "Một cộng một bằng hai, hai cộng hai bằng bốn.",
+    ]
+    results = benchmark(args.model_path, args.voice, args.profiles, texts,
+                        language=args.language, runs=args.runs, device=args.device)
+
+    print("\n===== KẾT QUẢ =====")
+    print(f"{'Cấu hình':<14} {'Nạp (s)':>8} {'Request đầu (s)':>16} {'TB/câu (s)':>11} {'RTF':>6}")
+    for r in results:
+        print(f"{r['profile']:<14} {r['load_time']:>8.2f} {r['first_request_latency']:>16.2f} "
+              f"{r['avg_latency']:>11.2f} {r['rtf']:>6.2f}")
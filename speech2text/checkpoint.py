@@ -0,0 +1,157 @@
+import os
+import json
+
+CHECKPOINT_VERSION = 1
+
+
+class TranscriptionCheckpoint:
+    """
+    Lưu các đoạn đã nhận dạng cùng vị trí audio đã xử lý để có thể tiếp tục khi bị dừng giữa chừng
+
+    File checkpoint là JSONL chỉ ghi nối tiếp: dòng đầu là header (hash audio + tham số),
+    mỗi dòng sau là một đoạn kèm "offset" (giây) - vị trí audio mà lần chạy sau sẽ tiếp tục.
+    Dòng cuối bị ghi dở (do tiến trình bị kill) sẽ được bỏ qua khi đọc lại.
+    """
+
+    def __init__(self, output_base, audio_hash, params=None, resume=True, sync_every=1):
+        """
+        Tham số:
+            output_base (str): Đường dẫn file đầu ra (không có phần mở rộng)
+            audio_hash (str): Hash nội dung file audio
+            params (dict): Tham số ảnh hưởng đến kết quả (mô hình, ngôn ngữ, ...)
+            resume (bool): Có tiếp tục từ checkpoint cũ hay không
+            sync_every (int): Số đoạn giữa hai lần fsync
+        """
+        self.path = f"{output_base}.ckpt.jsonl"
+        # Chuẩn hóa qua JSON để so sánh được với header đọc lại từ file
+        self.header = json.loads(json.dumps({
+            "version": CHECKPOINT_VERSION,
+            "audio_hash": audio_hash,
+            "params": params or {},
+        }))
+        self.sync_every = max(1, sync_every)
+        self.resume_offset = 0.0
+        self.resumed_segments = 0
+        self._resumed_lines = 0
+        self._pending = 0
+
+        valid_size = self._scan() if resume else None
+        if valid_size is None:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write_line(self.header)
+            self._sync()
+        else:
+            # Cắt bỏ phần ghi dở ở cuối file trước khi ghi tiếp
+            os.truncate(self.path, valid_size)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self.resumed_segments:
+                print(f"Tiếp tục từ checkpoint: {self.resumed_segments} đoạn, vị trí {self.resume_offset:.2f} giây")
+
+    def _scan(self):
+        """Đọc checkpoint cũ, trả về số byte hợp lệ hoặc None nếu không dùng được"""
+        if not os.path.exists(self.path):
+            return None
+
+        valid_size = 0
+        with open(self.path, "rb") as f:
+            first = f.readline()
+            try:
+                header = json.loads(first)
+            except ValueError:
+                return None
+            if not first.endswith(b"\n") or header != self.header:
+                print("Checkpoint không khớp với audio hoặc tham số hiện tại, xử lý lại từ đầu")
+                return None
+            valid_size = len(first)
+
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_size += len(line)
+                self._resumed_lines += 1
+                self.resume_offset = max(self.resume_offset, record.get("offset", 0.0))
+                if "segments" in record:
+                    self.resumed_segments += len(record["segments"])
+                elif "text" in record:
+                    self.resumed_segments += 1
+        return valid_size
+
+    def replay(self):
+        """
+        Duyệt lại các đoạn đã lưu trong checkpoint (đọc từ đĩa, không giữ trong bộ nhớ)
+
+        Trả về:
+            generator: Các dict {"start", "end", "text", ...}
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.readline()
+            for _, line in zip(range(self._resumed_lines), f):
+                record = json.loads(line)
+                if "segments" in record:
+                    yield from record["segments"]
+                elif "text" in record:
+                    record.pop("offset", None)
+                    yield record
+
+    def record(self, start, end, text, offset=None, **extra):
+        """
+        Ghi một đoạn đã hoàn tất
+
+        Tham số:
+            start (float): Thời điểm bắt đầu (giây, tính từ đầu file audio)
+            end (float): Thời điểm kết thúc (giây)
+            text (str): Nội dung đoạn
+            offset (float): Vị trí audio để tiếp tục, mặc định là end
+            **extra: Thông tin bổ sung (vd: avg_logprob)
+        """
+        entry = {"start": start, "end": end, "text": text}
+        entry.update(extra)
+        entry["offset"] = end if offset is None else offset
+        self._write_line(entry)
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self._sync()
+
+    def record_batch(self, segments, offset):
+        """
+        Ghi nguyên tử nhiều đoạn cùng lúc (một dòng), dùng khi xử lý theo từng khối audio
+
+        Tham số:
+            segments (list): Danh sách dict {"start", "end", "text", ...}
+            offset (float): Vị trí audio đã xử lý xong sau khối này
+        """
+        self._write_line({"segments": segments, "offset": offset})
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self._sync()
+
+    def mark_offset(self, offset):
+        """Ghi nhận vị trí audio đã xử lý xong mà không có đoạn văn bản nào (vd: khoảng lặng)"""
+        self._write_line({"offset": offset})
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self._sync()
+
+    def _write_line(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def finish(self):
+        """Đóng và xóa checkpoint khi quá trình nhận dạng hoàn tất"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        """Đóng file checkpoint (giữ lại để có thể tiếp tục)"""
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
@@ -1,5 +1,7 @@
+import io
 from gtts import gTTS
-from pydub import AudioSegment
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import decode_bytes, save_wav
 
 # Văn bản cần chuyển thành giọng nói
 text = "Xin chào tất cả mọi người, chúc mọi người có một ngày mới vui vẻ"
@@ -10,17 +12,13 @@ language = 'vi'
 # Tạo đối tượng gTTS
 tts = gTTS(text=text, lang=language, slow=False)
 
-# Lưu file MP3 tạm thời
-mp3_file = "output_temp.mp3"
-tts.save(mp3_file)
+# Ghi MP3 vào bộ nhớ thay vì file tạm
+mp3_buffer = io.BytesIO()
+tts.write_to_fp(mp3_buffer)
 
-# Chuyển đổi từ MP3 sang WAV
-sound = AudioSegment.from_mp3(mp3_file)
+# Giải mã MP3 qua pipe thành WAV 16kHz mono (định dạng đầu vào của các mô hình nhận dạng)
+audio = decode_bytes(mp3_buffer.getvalue())
 wav_file = "output.wav"
-sound.export(wav_file, format="wav")
+save_wav(wav_file, audio)
 
-# Xóa file MP3 tạm thời nếu muốn
-import os
-os.remove(mp3_file)
-
-print(f"Đã tạo file {wav_file}")
\ No newline at end of file
+print(f"Đã tạo file {wav_file}")
@@ -1,18 +1,45 @@
 import time
 import argparse
 import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from faster_whisper import WhisperModel
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio, file_hash, get_duration, TARGET_SAMPLE_RATE
+from checkpoint import TranscriptionCheckpoint
+from silence_split import split_on_silence
+from transcript_writer import TranscriptWriter
 
-def transcribe_with_faster_whisper(audio_path, model_size="tiny", device="cpu", language="vi", output_format="txt"):
+# Đoạn audio ngắn hơn mức này (0.1 giây) thì không cần nhận dạng
+MIN_REMAINING_SAMPLES = TARGET_SAMPLE_RATE // 10
+
+# Số ký tự cuối của văn bản đã nhận dạng được dùng làm ngữ cảnh (initial_prompt) cho đoạn kế tiếp
+PROMPT_CHARS = 200
+
+def _append_context(context, text):
+    """Nối văn bản mới vào ngữ cảnh, chỉ giữ PROMPT_CHARS ký tự cuối"""
+    return (context + " " + text.strip()).strip()[-PROMPT_CHARS:]
+
+def transcribe_with_faster_whisper(audio_path, model_size="tiny", device="cpu", language="vi", output_format="txt",
+                                   use_checkpoint=False, chunk_seconds=60.0):
     """
     Chuyển đổi audio thành văn bản sử dụng Faster-Whisper
     
+    Mặc định cả file được nhận dạng trong một lần gọi model.transcribe. Khi bật checkpoint, audio
+    được chia tại các khoảng lặng thành các đoạn khoảng chunk_seconds giây và nhận dạng lần lượt;
+    phần cuối văn bản của các đoạn trước được truyền làm initial_prompt (thay cho
+    condition_on_previous_text giữa hai đoạn). Checkpoint chỉ ghi ở biên đoạn và ngữ cảnh được dựng
+    lại từ các đoạn đã lưu, nên lần chạy tiếp tục cho kết quả giống hệt khi chạy liền một mạch.
+    
     Tham số:
         audio_path (str): Đường dẫn đến file audio
         model_size (str): Kích thước mô hình ("tiny", "base", "small", "medium", "large-v1", "large-v2", "large-v3")
         device (str): Thiết bị xử lý ("cuda" hoặc "cpu")
         language (str): Mã ngôn ngữ
-        output_format (str): Định dạng đầu ra ("txt" hoặc "srt")
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
+        use_checkpoint (bool): Lưu checkpoint để có thể tiếp tục nếu bị dừng giữa chừng (chia audio
+            tại các khoảng lặng)
+        chunk_seconds (float): Độ dài mong muốn của mỗi đoạn khi bật checkpoint (giây)
     """
     total_start_time = time.time()
     
@@ -25,54 +52,100 @@ def transcribe_with_faster_whisper(audio_path, model_size="tiny", device="cpu",
     model_load_time = time.time() - model_load_start
     print(f"Thời gian tải mô hình: {model_load_time:.2f} giây")
     
-    # Chuyển đổi
-    inference_start = time.time()
+    # Tải audio (dùng chung lớp đọc audio có cache)
+    audio_load_start = time.time()
     print(f"Đang xử lý file audio: {audio_path}")
-    segments, info = model.transcribe(
-        audio_path,
-        language=language,
-        beam_size=5,
-        vad_filter=True,
-        vad_parameters=dict(min_silence_duration_ms=500)
-    )
+    audio = load_audio(audio_path)
+    audio_load_time = time.time() - audio_load_start
+    print(f"Thời gian tải audio: {audio_load_time:.2f} giây")
     
-    # Đảm bảo segments là một list để tránh iterator đã dùng
-    segments_list = list(segments)
-    inference_time = time.time() - inference_start
-    print(f"Thời gian inference: {inference_time:.2f} giây")
+    # Checkpoint: nếu lần chạy trước bị dừng giữa chừng, tiếp tục từ đoạn chưa xử lý
+    output_base = os.path.splitext(audio_path)[0]
+    total_duration = get_duration(audio)
+    checkpoint = None
+    offset = 0.0
+    if use_checkpoint:
+        checkpoint = TranscriptionCheckpoint(
+            output_base,
+            file_hash(audio_path),
+            params={"engine": "faster-whisper", "model": model_size, "language": language,
+                    "chunk_seconds": chunk_seconds},
+        )
+        offset = checkpoint.resume_offset
     
-    # Thông tin về ngôn ngữ
-    print(f"Đã phát hiện ngôn ngữ: {info.language} (độ tin cậy: {info.language_probability:.2f})")
+    # Ghi từng đoạn ra file ngay khi giải mã xong
+    formats = ["txt"] if output_format == "txt" else ["txt", output_format]
+    inference_start = time.time()
+    output_time = 0.0
+    texts = []
+    with TranscriptWriter(output_base, formats, total_duration=total_duration) as writer:
+        def write_segments(segments, chunk_offset=0.0):
+            """Ghi các segment (generator, mỗi câu được giải mã khi duyệt tới), trả về list dict đã ghi"""
+            nonlocal output_time
+            written = []
+            for segment in segments:
+                write_start = time.time()
+                start = segment.start + chunk_offset
+                end = segment.end + chunk_offset
+                avg_logprob = round(segment.avg_logprob, 4)
+                writer.write_segment(start, end, segment.text, avg_logprob=avg_logprob)
+                written.append({"start": start, "end": end, "text": segment.text, "avg_logprob": avg_logprob})
+                texts.append(segment.text)
+                output_time += time.time() - write_start
+            return written
+        
+        if checkpoint is None:
+            segments, info = model.transcribe(
+                audio,
+                language=language,
+                beam_size=5,
+                vad_filter=True,
+                vad_parameters=dict(min_silence_duration_ms=500)
+            )
+            # Thông tin về ngôn ngữ
+            print(f"Đã phát hiện ngôn ngữ: {info.language} (độ tin cậy: {info.language_probability:.2f})")
+            write_segments(segments)
+        else:
+            # Ghi lại các đoạn đã hoàn tất từ lần chạy trước và dựng lại ngữ cảnh từ chúng
+            context = ""
+            writer.show_progress = False
+            for saved in checkpoint.replay():
+                writer.write_segment(**saved)
+                texts.append(saved["text"])
+                context = _append_context(context, saved["text"])
+            writer.show_progress = True
+            
+            # Các đoạn được xác định hoàn toàn từ audio nên lần chạy tiếp tục chia giống hệt lần trước
+            chunks = split_on_silence(audio, TARGET_SAMPLE_RATE, target_chunk=chunk_seconds)
+            pending_chunks = [(start, end) for start, end in chunks if end / TARGET_SAMPLE_RATE > offset + 1e-6]
+            for index, (start_sample, end_sample) in enumerate(pending_chunks):
+                chunk_segments = []
+                if end_sample - start_sample >= MIN_REMAINING_SAMPLES:
+                    segments, info = model.transcribe(
+                        audio[start_sample:end_sample],
+                        language=language,
+                        beam_size=5,
+                        vad_filter=True,
+                        vad_parameters=dict(min_silence_duration_ms=500),
+                        initial_prompt=context or None
+                    )
+                    if index == 0:
+                        # Thông tin về ngôn ngữ
+                        print(f"Đã phát hiện ngôn ngữ: {info.language} (độ tin cậy: {info.language_probability:.2f})")
+                    chunk_segments = write_segments(segments, start_sample / TARGET_SAMPLE_RATE)
+                    for segment in chunk_segments:
+                        context = _append_context(context, segment["text"])
+                # Mỗi đoạn audio được lưu nguyên tử: lần chạy sau tiếp tục đúng tại biên đoạn
+                checkpoint.record_batch(chunk_segments, end_sample / TARGET_SAMPLE_RATE)
+    full_text = " ".join(text.strip() for text in texts if text.strip())
     
-    # Xử lý kết quả
-    output_start = time.time()
-    output_base = os.path.splitext(audio_path)[0]
+    if checkpoint:
+        checkpoint.finish()
+    inference_time = time.time() - inference_start - output_time
+    print(f"Thời gian inference: {inference_time:.2f} giây")
     
-    # Xử lý kết quả text
-    full_text = ""
-    for segment in segments_list:
-        full_text += segment.text + " "
-    
-    # Lưu văn bản
-    with open(f"{output_base}.txt", "w", encoding="utf-8") as f:
-        f.write(full_text.strip())
-    print(f"Đã lưu văn bản vào: {output_base}.txt")
-    
-    # Tạo file SRT nếu cần
-    if output_format == "srt":
-        with open(f"{output_base}.srt", "w", encoding="utf-8") as f:
-            for i, segment in enumerate(segments_list, start=1):
-                # Định dạng thời gian
-                start_time = format_timestamp(segment.start)
-                end_time = format_timestamp(segment.end)
-                
-                # Viết vào file SRT
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"{segment.text.strip()}\n\n")
-        print(f"Đã lưu phụ đề vào: {output_base}.srt")
-    
-    output_time = time.time() - output_start
+    for fmt in formats:
+        print(f"Đã lưu kết quả vào: {writer.path(fmt)}")
     print(f"Thời gian xử lý đầu ra: {output_time:.2f} giây")
     
     # Tổng thời gian
@@ -80,6 +153,7 @@ def transcribe_with_faster_whisper(audio_path, model_size="tiny", device="cpu",
     
     print("\n===== THỐNG KÊ THỜI GIAN =====")
     print(f"Thời gian tải mô hình: {model_load_time:.2f} giây")
+    print(f"Thời gian tải audio: {audio_load_time:.2f} giây")
     print(f"Thời gian inference: {inference_time:.2f} giây")
     print(f"Thời gian xử lý đầu ra: {output_time:.2f} giây")
     print(f"Tổng thời gian xử lý: {total_time:.2f} giây")
@@ -91,13 +165,112 @@ def transcribe_with_faster_whisper(audio_path, model_size="tiny", device="cpu",
     
     return full_text.strip()
 
-def format_timestamp(seconds):
-    """Định dạng thời gian theo chuẩn SRT (HH:MM:SS,mmm)"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = seconds % 60
-    millisecs = int((secs - int(secs)) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{int(secs):02d},{millisecs:03d}"
+# Mô hình của mỗi tiến trình worker (nạp một lần trong initializer)
+_worker_model = None
+
+def _init_worker(model_size, device, compute_type, cpu_threads):
+    """Nạp mô hình Faster-Whisper trong tiến trình worker"""
+    global _worker_model
+    _worker_model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                                 cpu_threads=cpu_threads)
+
+def _transcribe_chunk(chunk_audio, start_sample, language):
+    """
+    Nhận dạng một đoạn audio trong worker, trả về các segment với thời gian tính từ đầu file
+    
+    Tham số:
+        chunk_audio (np.ndarray): Mẫu audio của đoạn (đã được tiến trình chính giải mã)
+        start_sample (int): Vị trí mẫu đầu tiên của đoạn trong file
+        language (str): Mã ngôn ngữ
+    """
+    offset = start_sample / TARGET_SAMPLE_RATE
+    segments, _ = _worker_model.transcribe(
+        chunk_audio,
+        language=language,
+        beam_size=5,
+        vad_filter=True,
+        vad_parameters=dict(min_silence_duration_ms=500)
+    )
+    return [(segment.start + offset, segment.end + offset, segment.text, round(segment.avg_logprob, 4))
+            for segment in segments]
+
+def transcribe_parallel(audio_path, model_size="tiny", device="cpu", language="vi", output_format="txt",
+                        workers=None, chunk_seconds=60.0, use_checkpoint=True):
+    """
+    Chia file audio dài tại các khoảng lặng và nhận dạng các đoạn song song trên nhiều tiến trình
+    
+    Tham số:
+        audio_path (str): Đường dẫn đến file audio
+        model_size (str): Kích thước mô hình
+        device (str): Thiết bị xử lý ("cuda" hoặc "cpu")
+        language (str): Mã ngôn ngữ
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
+        workers (int): Số tiến trình worker (mặc định: số nhân CPU)
+        chunk_seconds (float): Độ dài mong muốn của mỗi đoạn (giây)
+        use_checkpoint (bool): Lưu checkpoint theo từng đoạn để có thể tiếp tục nếu bị dừng
+    """
+    total_start_time = time.time()
+    workers = workers or os.cpu_count() or 1
+    compute_type = "float32" if device == "cuda" else "int8"
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+    
+    # Giải mã một lần ở tiến trình chính, mỗi worker chỉ nhận phần mẫu của đoạn mình xử lý
+    audio = load_audio(audio_path)
+    total_duration = get_duration(audio)
+    chunks = split_on_silence(audio, TARGET_SAMPLE_RATE, target_chunk=chunk_seconds)
+    print(f"Đã chia {total_duration:.1f} giây audio thành {len(chunks)} đoạn, xử lý bằng {workers} tiến trình")
+    
+    output_base = os.path.splitext(audio_path)[0]
+    checkpoint = None
+    offset = 0.0
+    if use_checkpoint:
+        checkpoint = TranscriptionCheckpoint(
+            output_base,
+            file_hash(audio_path),
+            params={"engine": "faster-whisper-parallel", "model": model_size, "language": language,
+                    "chunk_seconds": chunk_seconds},
+        )
+        offset = checkpoint.resume_offset
+    pending_chunks = [(start, end) for start, end in chunks if end / TARGET_SAMPLE_RATE > offset + 1e-6]
+    
+    formats = ["txt"] if output_format == "txt" else ["txt", output_format]
+    inference_start = time.time()
+    texts = []
+    with TranscriptWriter(output_base, formats, total_duration=total_duration) as writer:
+        if checkpoint:
+            writer.show_progress = False
+            for saved in checkpoint.replay():
+                writer.write_segment(**saved)
+                texts.append(saved["text"])
+            writer.show_progress = True
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_size, device, compute_type, cpu_threads)) as executor:
+            futures = [executor.submit(_transcribe_chunk, np.ascontiguousarray(audio[start:end]), start, language)
+                       for start, end in pending_chunks]
+            # Ghi kết quả theo đúng thứ tự các đoạn, ngay khi đoạn kế tiếp hoàn tất
+            for (start, end), future in zip(pending_chunks, futures):
+                chunk_segments = []
+                for seg_start, seg_end, text, avg_logprob in future.result():
+                    writer.write_segment(seg_start, seg_end, text, avg_logprob=avg_logprob)
+                    texts.append(text)
+                    chunk_segments.append({"start": seg_start, "end": seg_end, "text": text,
+                                           "avg_logprob": avg_logprob})
+                # Mỗi đoạn audio được lưu nguyên tử để khi tiếp tục không bị lặp segment
+                if checkpoint:
+                    checkpoint.record_batch(chunk_segments, end / TARGET_SAMPLE_RATE)
+    full_text = " ".join(text.strip() for text in texts if text.strip())
+    inference_time = time.time() - inference_start
+    
+    if checkpoint:
+        checkpoint.finish()
+    
+    for fmt in formats:
+        print(f"Đã lưu kết quả vào: {writer.path(fmt)}")
+    print(f"Thời gian inference song song: {inference_time:.2f} giây")
+    print(f"Tổng thời gian xử lý: {time.time() - total_start_time:.2f} giây")
+    
+    return full_text.strip()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Chuyển đổi audio thành văn bản với Faster-Whisper")
@@ -108,11 +281,27 @@ if __name__ == "__main__":
     parser.add_argument("--device", default="cpu", choices=["cuda", "cpu"], 
                        help="Thiết bị xử lý (cuda hoặc cpu)")
     parser.add_argument("--language", default="vi", help="Mã ngôn ngữ")
-    parser.add_argument("--format", default="txt", choices=["txt", "srt"], 
-                       help="Định dạng đầu ra (txt hoặc srt)")
+    parser.add_argument("--format", default="txt", choices=["txt", "srt", "vtt", "jsonl"], 
+                       help="Định dạng đầu ra (txt, srt, vtt hoặc jsonl)")
+    parser.add_argument("--checkpoint", action="store_true",
+                       help="Chế độ tuần tự: lưu checkpoint để tiếp tục khi bị dừng giữa chừng "
+                            "(audio được chia tại các khoảng lặng, kết quả có thể khác khi nhận dạng cả file)")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                       help="Chế độ song song: không lưu checkpoint (không thể tiếp tục khi bị dừng giữa chừng)")
+    
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Số tiến trình nhận dạng song song (>1: chia file tại các khoảng lặng)")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0,
+                       help="Độ dài mong muốn của mỗi đoạn audio, chia tại khoảng lặng (giây)")
     
     script_start_time = time.time()
     args = parser.parse_args()
-    transcribe_with_faster_whisper(args.audio_path, args.model, args.device, args.language, args.format)
+    if args.workers > 1:
+        transcribe_parallel(args.audio_path, args.model, args.device, args.language, args.format,
+                            workers=args.workers, chunk_seconds=args.chunk_seconds,
+                            use_checkpoint=not args.no_checkpoint)
+    else:
+        transcribe_with_faster_whisper(args.audio_path, args.model, args.device, args.language, args.format,
+                                       use_checkpoint=args.checkpoint, chunk_seconds=args.chunk_seconds)
     script_total_time = time.time() - script_start_time
     print(f"Thời gian chạy toàn bộ script: {script_total_time:.2f} giây")
\ No newline at end of file
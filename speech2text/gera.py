@@ -1,9 +1,11 @@
 import torch
-import librosa
 import time
 import os
 import argparse
 from transformers import AutoProcessor, AutoModelForSpeechSeq2Seq
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio, get_duration, TARGET_SAMPLE_RATE
+from transcript_writer import TranscriptWriter
 
 def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3.3-8b", device="cpu", output_format="txt"):
     """
@@ -13,7 +15,7 @@ def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3
         audio_path (str): Đường dẫn đến file audio
         model_name (str): Tên mô hình Granite Speech
         device (str): Thiết bị xử lý ("cpu" hoặc "cuda")
-        output_format (str): Định dạng đầu ra ("txt" hoặc "srt")
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
     """
     total_start_time = time.time()
     
@@ -36,7 +38,8 @@ def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3
     # Tải audio
     audio_load_start = time.time()
     print(f"Đang tải file audio: {audio_path}")
-    audio, sample_rate = librosa.load(audio_path, sr=16000)
+    audio = load_audio(audio_path)
+    sample_rate = TARGET_SAMPLE_RATE
     audio_load_time = time.time() - audio_load_start
     print(f"Thời gian tải audio: {audio_load_time:.2f} giây")
     
@@ -69,11 +72,11 @@ def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3
         f.write(transcription)
     print(f"Đã lưu văn bản vào: {output_base}.txt")
     
-    # Tạo file SRT nếu cần
-    if output_format == "srt":
+    # Tạo file phụ đề nếu cần
+    if output_format != "txt":
         # Tạo phụ đề đơn giản bằng cách chia văn bản thành các đoạn
         try:
-            duration = librosa.get_duration(y=audio, sr=sample_rate)
+            duration = get_duration(audio, sample_rate)
             words = transcription.split()
             words_per_segment = 10  # Khoảng 10 từ mỗi đoạn
             segments = [words[i:i+words_per_segment] for i in range(0, len(words), words_per_segment)]
@@ -81,24 +84,15 @@ def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3
             # Chia thời gian đều cho mỗi đoạn
             segment_duration = duration / max(len(segments), 1)
             
-            with open(f"{output_base}.srt", "w", encoding="utf-8") as f:
+            with TranscriptWriter(output_base, [output_format], show_progress=False) as writer:
                 for i, segment_words in enumerate(segments, start=1):
                     start_time = i * segment_duration - segment_duration
                     end_time = min(i * segment_duration, duration)
-                    segment_text = " ".join(segment_words)
-                    
-                    # Định dạng thời gian
-                    start_formatted = format_timestamp(start_time)
-                    end_formatted = format_timestamp(end_time)
-                    
-                    # Viết vào file SRT
-                    f.write(f"{i}\n")
-                    f.write(f"{start_formatted} --> {end_formatted}\n")
-                    f.write(f"{segment_text}\n\n")
+                    writer.write_segment(start_time, end_time, " ".join(segment_words))
             
-            print(f"Đã lưu phụ đề vào: {output_base}.srt")
+            print(f"Đã lưu phụ đề vào: {writer.path(output_format)}")
         except Exception as e:
-            print(f"Không thể tạo file SRT: {e}")
+            print(f"Không thể tạo file phụ đề: {e}")
     
     output_time = time.time() - output_start
     print(f"Thời gian xử lý đầu ra: {output_time:.2f} giây")
@@ -121,14 +115,6 @@ def transcribe_with_granite(audio_path, model_name="ibm-granite/granite-speech-3
     
     return transcription
 
-def format_timestamp(seconds):
-    """Định dạng thời gian theo chuẩn SRT (HH:MM:SS,mmm)"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = seconds % 60
-    millisecs = int((secs - int(secs)) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{int(secs):02d},{millisecs:03d}"
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Chuyển đổi audio thành văn bản với IBM Granite Speech")
     parser.add_argument("audio_path", help="Đường dẫn đến file audio")
@@ -136,8 +122,8 @@ if __name__ == "__main__":
                        help="Tên mô hình Granite Speech")
     parser.add_argument("--device", default="cpu", choices=["cuda", "cpu"], 
                        help="Thiết bị xử lý (cuda hoặc cpu)")
-    parser.add_argument("--format", default="txt", choices=["txt", "srt"], 
-                       help="Định dạng đầu ra (txt hoặc srt)")
+    parser.add_argument("--format", default="txt", choices=["txt", "srt", "vtt", "jsonl"], 
+                       help="Định dạng đầu ra (txt, srt, vtt hoặc jsonl)")
     
     script_start_time = time.time()
     args = parser.parse_args()
@@ -0,0 +1,107 @@
+import numpy as np
+
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import TARGET_SAMPLE_RATE
+
+
+def frame_energy_db(audio, sr=TARGET_SAMPLE_RATE, frame_ms=30):
+    """
+    Tính năng lượng (dB) của từng khung audio
+
+    Tham số:
+        audio (np.ndarray): Tín hiệu mono float32
+        sr (int): Tần số lấy mẫu
+        frame_ms (int): Độ dài mỗi khung (mili giây)
+
+    Trả về:
+        tuple: (mảng năng lượng dB theo khung, số mẫu mỗi khung)
+    """
+    frame_len = max(1, int(sr * frame_ms / 1000))
+    num_frames = len(audio) // frame_len
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len
+    frames = np.asarray(audio[:num_frames * frame_len], dtype=np.float32).reshape(num_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+    return 20.0 * np.log10(rms), frame_len
+
+
+def find_split_points(audio, sr=TARGET_SAMPLE_RATE, target_chunk=60.0, search_window=10.0,
+                      min_silence=0.3, frame_ms=30):
+    """
+    Tìm các điểm cắt nằm trong khoảng lặng, gần mỗi mốc target_chunk giây
+
+    Tại mỗi mốc, tìm trong cửa sổ ±search_window giây đoạn khung yên tĩnh dài nhất (ít nhất
+    min_silence giây) và cắt ở giữa đoạn đó. Nếu không có khoảng lặng đủ dài thì cắt ở khung
+    có năng lượng thấp nhất trong cửa sổ.
+
+    Tham số:
+        audio (np.ndarray): Tín hiệu mono float32
+        sr (int): Tần số lấy mẫu
+        target_chunk (float): Độ dài mong muốn của mỗi đoạn (giây)
+        search_window (float): Khoảng tìm kiếm quanh mỗi mốc (giây)
+        min_silence (float): Độ dài tối thiểu của khoảng lặng (giây)
+        frame_ms (int): Độ dài mỗi khung phân tích (mili giây)
+
+    Trả về:
+        list: Danh sách vị trí cắt (chỉ số mẫu), không gồm 0 và len(audio)
+    """
+    energy, frame_len = frame_energy_db(audio, sr, frame_ms)
+    if len(energy) == 0 or len(audio) <= target_chunk * sr:
+        return []
+
+    # Ngưỡng lặng tương đối: thấp hơn mức năng lượng phổ biến của tiếng nói
+    speech_level = np.percentile(energy, 90)
+    noise_floor = np.percentile(energy, 10)
+    threshold = noise_floor + 0.25 * (speech_level - noise_floor)
+    silent = energy < threshold
+
+    frames_per_sec = sr / frame_len
+    min_silent_frames = max(1, int(min_silence * frames_per_sec))
+    window = int(search_window * frames_per_sec)
+    step = int(target_chunk * frames_per_sec)
+    min_gap = step // 2
+
+    splits = []
+    last_split = 0
+    target = step
+    while target < len(energy) - min_gap:
+        lo = max(last_split + min_gap, target - window)
+        hi = min(len(energy), target + window)
+        if lo >= hi:
+            break
+
+        split_frame = _longest_silence_center(silent[lo:hi], min_silent_frames)
+        if split_frame is None:
+            split_frame = int(np.argmin(energy[lo:hi]))
+        split_frame += lo
+
+        splits.append(split_frame * frame_len)
+        last_split = split_frame
+        target = split_frame + step
+    return splits
+
+
+def _longest_silence_center(silent, min_frames):
+    """Trả về vị trí giữa của đoạn lặng liên tục dài nhất (hoặc None nếu ngắn hơn min_frames)"""
+    best_len, best_center = 0, None
+    run_start = None
+    for i, is_silent in enumerate(np.append(silent, False)):
+        if is_silent and run_start is None:
+            run_start = i
+        elif not is_silent and run_start is not None:
+            run_len = i - run_start
+            if run_len >= min_frames and run_len > best_len:
+                best_len, best_center = run_len, run_start + run_len // 2
+            run_start = None
+    return best_center
+
+
+def split_on_silence(audio, sr=TARGET_SAMPLE_RATE, target_chunk=60.0, **kwargs):
+    """
+    Chia audio thành các đoạn độc lập tại các khoảng lặng
+
+    Trả về:
+        list: Danh sách (start_sample, end_sample)
+    """
+    points = [0] + find_split_points(audio, sr, target_chunk, **kwargs) + [len(audio)]
+    return [(start, end) for start, end in zip(points[:-1], points[1:]) if end > start]
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+
+# Các định dạng đầu ra được hỗ trợ
+SUPPORTED_FORMATS = ("txt", "srt", "vtt", "jsonl")
+
+
+def format_srt_timestamp(seconds):
+    """Định dạng thời gian theo chuẩn SRT (HH:MM:SS,mmm)"""
+    millis = int(round(max(seconds, 0.0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def format_vtt_timestamp(seconds):
+    """Định dạng thời gian theo chuẩn WebVTT (HH:MM:SS.mmm)"""
+    return format_srt_timestamp(seconds).replace(",", ".")
+
+
+class TranscriptWriter:
+    """
+    Ghi kết quả nhận dạng theo từng đoạn ngay khi đoạn đó được giải mã
+
+    Mỗi đoạn được ghi nối tiếp vào các file TXT/SRT/VTT/JSONL và flush ngay, nên bộ nhớ không
+    tăng theo độ dài audio và kết quả một phần có thể đọc được trong lúc đang xử lý.
+    """
+
+    def __init__(self, output_base, formats=("txt",), total_duration=None,
+                 show_progress=True, flush_interval=0.0):
+        """
+        Tham số:
+            output_base (str): Đường dẫn file đầu ra (không có phần mở rộng)
+            formats (iterable): Các định dạng cần ghi ("txt", "srt", "vtt", "jsonl")
+            total_duration (float): Tổng độ dài audio (giây), dùng để hiển thị tiến độ
+            show_progress (bool): Có in tiến độ ra màn hình hay không
+            flush_interval (float): Khoảng thời gian tối thiểu giữa hai lần flush (0 = flush mỗi đoạn)
+        """
+        formats = list(dict.fromkeys(formats))
+        unknown = [fmt for fmt in formats if fmt not in SUPPORTED_FORMATS]
+        if unknown:
+            raise ValueError(f"Định dạng đầu ra không được hỗ trợ: {unknown}")
+
+        self.output_base = output_base
+        self.formats = formats
+        self.total_duration = total_duration
+        self.show_progress = show_progress
+        self.flush_interval = flush_interval
+
+        self.segment_count = 0
+        self.last_end = 0.0
+        self._last_flush = 0.0
+        self._files = {}
+
+        output_dir = os.path.dirname(output_base)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        for fmt in self.formats:
+            self._files[fmt] = open(self.path(fmt), "w", encoding="utf-8")
+        if "vtt" in self._files:
+            self._files["vtt"].write("WEBVTT\n\n")
+
+    def path(self, fmt):
+        """Đường dẫn file đầu ra cho một định dạng"""
+        return f"{self.output_base}.{fmt}"
+
+    def write_segment(self, start, end, text, **extra):
+        """
+        Ghi một đoạn văn bản đã nhận dạng
+
+        Tham số:
+            start (float): Thời điểm bắt đầu (giây)
+            end (float): Thời điểm kết thúc (giây)
+            text (str): Nội dung đoạn
+            **extra: Thông tin bổ sung ghi vào JSONL (vd: avg_logprob)
+        """
+        text = text.strip()
+        if not text:
+            return
+
+        self.segment_count += 1
+        index = self.segment_count
+
+        if "txt" in self._files:
+            if index > 1:
+                self._files["txt"].write(" ")
+            self._files["txt"].write(text)
+
+        if "srt" in self._files:
+            self._files["srt"].write(
+                f"{index}\n{format_srt_timestamp(start)} --> {format_srt_timestamp(end)}\n{text}\n\n"
+            )
+
+        if "vtt" in self._files:
+            self._files["vtt"].write(
+                f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}\n{text}\n\n"
+            )
+
+        if "jsonl" in self._files:
+            record = {"id": index, "start": round(start, 3), "end": round(end, 3), "text": text}
+            record.update(extra)
+            self._files["jsonl"].write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        self.last_end = max(self.last_end, end)
+        self._maybe_flush()
+
+        if self.show_progress:
+            self._print_progress(start, end, text)
+
+    def _maybe_flush(self):
+        now = time.time()
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+            self._last_flush = now
+
+    def flush(self):
+        """Đẩy dữ liệu đã ghi xuống đĩa"""
+        for f in self._files.values():
+            if not f.closed:
+                f.flush()
+
+    def _print_progress(self, start, end, text):
+        if self.total_duration:
+            percent = min(end / self.total_duration * 100, 100.0)
+            prefix = f"[{percent:5.1f}%]"
+        else:
+            prefix = f"[{self.segment_count}]"
+        sys.stdout.write(f"{prefix} [{start:.2f}s -> {end:.2f}s] {text}\n")
+        sys.stdout.flush()
+
+    def read_text(self):
+        """Đọc lại toàn bộ văn bản đã ghi (yêu cầu có định dạng txt)"""
+        if "txt" not in self._files:
+            raise ValueError("Cần bật định dạng txt để đọc lại văn bản")
+        self.flush()
+        with open(self.path("txt"), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def close(self):
+        """Đóng tất cả các file đầu ra"""
+        for f in self._files.values():
+            if not f.closed:
+                f.flush()
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -1,11 +1,13 @@
 import sys
 import os
-import wave
 import json
 import argparse
 import time
-from datetime import datetime, timedelta
 from vosk import Model, KaldiRecognizer, SetLogLevel
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_pcm16, file_hash, TARGET_SAMPLE_RATE
+from checkpoint import TranscriptionCheckpoint
+from transcript_writer import TranscriptWriter
 
 def get_model_url(model_name):
     """Lấy URL tải xuống cho mô hình dựa trên tên"""
@@ -57,22 +59,31 @@ def download_model_if_not_exists(model_path):
         download_time = time.time() - download_start_time
         print(f"Tải mô hình hoàn tất! Thời gian tải: {download_time:.2f} giây")
 
-def convert_to_srt_time(seconds):
-    """Chuyển đổi thời gian từ giây sang định dạng SRT"""
-    td = timedelta(seconds=seconds)
-    hours, remainder = divmod(td.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = td.microseconds // 1000
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+def split_words_into_segments(words, max_gap=1.0):
+    """
+    Gom các từ (có thời gian) của Vosk thành các đoạn, tách đoạn khi khoảng lặng giữa hai từ vượt max_gap giây
+    
+    Trả về:
+        list: Danh sách (start, end, text)
+    """
+    segments = []
+    for word_info in words:
+        if segments and word_info["start"] - segments[-1][1] <= max_gap:
+            start, _, text = segments[-1]
+            segments[-1] = (start, word_info["end"], f"{text} {word_info['word']}")
+        else:
+            segments.append((word_info["start"], word_info["end"], word_info["word"]))
+    return segments
 
-def transcribe_with_vosk(audio_path, model_path="vosk-model-small-vn-0.3", output_format="txt"):
+def transcribe_with_vosk(audio_path, model_path="vosk-model-small-vn-0.3", output_format="txt", use_checkpoint=True):
     """
     Chuyển đổi tiếng nói thành văn bản sử dụng Vosk với mô hình tiếng Việt
     
     Tham số:
         audio_path (str): Đường dẫn đến file audio cần chuyển đổi
         model_path (str): Đường dẫn đến thư mục chứa mô hình Vosk
-        output_format (str): Định dạng đầu ra ("txt" hoặc "srt")
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
+        use_checkpoint (bool): Lưu checkpoint để có thể tiếp tục nếu bị dừng giữa chừng
     """
     total_start_time = time.time()
     SetLogLevel(-1)  # Tắt log không cần thiết
@@ -87,122 +98,89 @@ def transcribe_with_vosk(audio_path, model_path="vosk-model-small-vn-0.3", outpu
         print(f"File audio không tồn tại: {audio_path}")
         return
     
-    # Nếu không phải file WAV, ta cần chuyển đổi trước
+    # Đọc audio thành PCM 16-bit mono 16kHz (WAV được ánh xạ trực tiếp, định dạng khác giải mã qua pipe)
     conversion_start_time = time.time()
-    audio_ext = os.path.splitext(audio_path)[1].lower()
-    temp_wav_path = None
-    
-    if audio_ext != ".wav":
-        print(f"Chuyển đổi {audio_ext} sang WAV...")
-        import subprocess
-        temp_wav_path = f"{os.path.splitext(audio_path)[0]}_temp.wav"
-        subprocess.call(['ffmpeg', '-i', audio_path, '-ar', '16000', '-ac', '1', temp_wav_path])
-        audio_path_for_processing = temp_wav_path
-    else:
-        audio_path_for_processing = audio_path
-    
+    pcm_data = load_pcm16(audio_path, sr=TARGET_SAMPLE_RATE)
     conversion_time = time.time() - conversion_start_time
-    if audio_ext != ".wav":
-        print(f"Thời gian chuyển đổi định dạng: {conversion_time:.2f} giây")
-    
-    # Mở file audio
-    wf = wave.open(audio_path_for_processing, "rb")
-    
-    # Kiểm tra định dạng audio
-    if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
-        print("Audio phải là WAV mono 16-bit PCM")
-        if temp_wav_path:
-            os.remove(temp_wav_path)
-        return
+    print(f"Thời gian đọc audio: {conversion_time:.2f} giây")
     
     # Tải mô hình
     model_load_start = time.time()
     print(f"Đang tải mô hình từ {model_path}...")
     model = Model(model_path)
-    rec = KaldiRecognizer(model, wf.getframerate())
+    rec = KaldiRecognizer(model, TARGET_SAMPLE_RATE)
     rec.SetWords(True)  # Để lấy thời gian cho từng từ
     model_load_time = time.time() - model_load_start
     print(f"Thời gian tải mô hình: {model_load_time:.2f} giây")
     
-    # Xử lý audio
-    recognition_start = time.time()
-    print("Đang chuyển đổi audio thành văn bản...")
-    results = []
-    
-    # Xử lý audio
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            part_result = json.loads(rec.Result())
-            results.append(part_result)
-    
-    part_result = json.loads(rec.FinalResult())
-    results.append(part_result)
-    
-    recognition_time = time.time() - recognition_start
-    print(f"Thời gian nhận dạng: {recognition_time:.2f} giây")
-    
-    # Dọn dẹp file tạm thời
-    if temp_wav_path:
-        os.remove(temp_wav_path)
-    
-    # Xử lý kết quả
-    processing_start = time.time()
-    full_text = ""
-    segments = []
-    
-    for res in results:
-        if "result" in res:
-            for i, word_info in enumerate(res["result"]):
-                if i == 0 or res["result"][i-1]["end"] + 1.0 < word_info["start"]:
-                    # Bắt đầu một segment mới
-                    if i > 0:
-                        segments.append({
-                            "start": segments[-1]["start"],
-                            "end": res["result"][i-1]["end"],
-                            "text": segments[-1]["text"].strip()
-                        })
-                    
-                    segments.append({
-                        "start": word_info["start"],
-                        "end": word_info["end"],
-                        "text": word_info["word"] + " "
-                    })
-                else:
-                    # Thêm từ vào segment hiện tại
-                    segments[-1]["end"] = word_info["end"]
-                    segments[-1]["text"] += word_info["word"] + " "
-        
-        if "text" in res:
-            full_text += res["text"] + " "
-    
     # Tạo tên file đầu ra với thông tin về mô hình đã sử dụng
     model_identifier = os.path.basename(model_path)
     output_base = os.path.splitext(audio_path)[0]
     output_file_base = f"{output_base}_{model_identifier}"
+    formats = ["txt"] if output_format == "txt" else ["txt", output_format]
+    
+    # Checkpoint: nếu lần chạy trước bị dừng giữa chừng, tiếp tục từ vị trí đã xử lý
+    checkpoint = None
+    offset = 0.0
+    if use_checkpoint:
+        checkpoint = TranscriptionCheckpoint(
+            output_file_base,
+            file_hash(audio_path),
+            params={"engine": "vosk", "model": model_identifier},
+        )
+        offset = checkpoint.resume_offset
+    
+    # Xử lý audio, mỗi kết quả của Kaldi được ghi ra file ngay khi nhận được
+    recognition_start = time.time()
+    print("Đang chuyển đổi audio thành văn bản...")
+    processing_time = 0.0
+    total_duration = len(pcm_data) / 2 / TARGET_SAMPLE_RATE
+    # Checkpoint chỉ lưu vị trí ngay sau một Result của Kaldi (ranh giới câu, đúng ranh giới khối),
+    # nên recognizer mới bắt đầu lại từ đầu một câu như khi chạy liền một mạch
+    start_byte = int(round(offset * TARGET_SAMPLE_RATE)) * 2
+    
+    with TranscriptWriter(output_file_base, formats, total_duration=total_duration) as writer:
+        if checkpoint:
+            # Ghi lại các đoạn đã hoàn tất từ lần chạy trước
+            writer.show_progress = False
+            for saved in checkpoint.replay():
+                writer.write_segment(**saved)
+            writer.show_progress = True
+        
+        def write_result(res, position):
+            write_start = time.time()
+            # Thời gian của Vosk tính từ vị trí bắt đầu đưa audio vào recognizer
+            segments = [
+                {"start": start + offset, "end": end + offset, "text": text}
+                for start, end, text in split_words_into_segments(res.get("result", []))
+            ]
+            for segment in segments:
+                writer.write_segment(**segment)
+            # Cả Result được ghi nguyên tử cùng vị trí audio đã đưa vào recognizer: bị dừng giữa
+            # chừng thì lần sau nhận dạng lại cả câu, không để lại nửa câu
+            if checkpoint:
+                checkpoint.record_batch(segments, position)
+            return time.time() - write_start
+        
+        # Xử lý audio theo từng khối 4000 mẫu (2 byte mỗi mẫu)
+        chunk_bytes = 4000 * 2
+        for pos in range(start_byte, len(pcm_data), chunk_bytes):
+            data = pcm_data[pos:pos + chunk_bytes]
+            if rec.AcceptWaveform(data):
+                # Vị trí (giây) của byte cuối cùng đã đưa vào recognizer
+                position = (pos + len(data)) / 2 / TARGET_SAMPLE_RATE
+                processing_time += write_result(json.loads(rec.Result()), position)
+        
+        processing_time += write_result(json.loads(rec.FinalResult()), total_duration)
+        full_text = writer.read_text()
     
-    if output_format == "txt":
-        with open(f"{output_file_base}.txt", "w", encoding="utf-8") as f:
-            f.write(full_text.strip())
-        print(f"Đã lưu văn bản vào: {output_file_base}.txt")
-    
-    elif output_format == "srt":
-        with open(f"{output_file_base}.srt", "w", encoding="utf-8") as f:
-            for i, segment in enumerate(segments, start=1):
-                if not segment["text"].strip():
-                    continue
-                
-                start_time = convert_to_srt_time(segment["start"])
-                end_time = convert_to_srt_time(segment["end"])
-                
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"{segment['text'].strip()}\n\n")
-        print(f"Đã lưu phụ đề vào: {output_file_base}.srt")
+    if checkpoint:
+        checkpoint.finish()
     
-    processing_time = time.time() - processing_start
+    recognition_time = time.time() - recognition_start - processing_time
+    print(f"Thời gian nhận dạng: {recognition_time:.2f} giây")
+    for fmt in formats:
+        print(f"Đã lưu kết quả vào: {writer.path(fmt)}")
     print(f"Thời gian xử lý kết quả: {processing_time:.2f} giây")
     
     # Tổng thời gian
@@ -211,8 +189,7 @@ def transcribe_with_vosk(audio_path, model_path="vosk-model-small-vn-0.3", outpu
     if not os.path.exists(model_path + "_DOWNLOADED"):
         print(f"Thời gian tải mô hình: {model_download_time:.2f} giây")
     print(f"Thời gian tải mô hình vào bộ nhớ: {model_load_time:.2f} giây")
-    if audio_ext != ".wav":
-        print(f"Thời gian chuyển đổi định dạng: {conversion_time:.2f} giây")
+    print(f"Thời gian đọc audio: {conversion_time:.2f} giây")
     print(f"Thời gian nhận dạng: {recognition_time:.2f} giây")
     print(f"Thời gian xử lý kết quả: {processing_time:.2f} giây")
     print(f"Tổng thời gian xử lý: {total_time:.2f} giây")
@@ -228,8 +205,10 @@ if __name__ == "__main__":
     parser.add_argument("--model", default="vosk-model-small-vn-0.3", 
                        choices=["vosk-model-small-vn-0.3", "vosk-model-small-vn-0.4", "vosk-model-vn-0.4"],
                        help="Mô hình Vosk tiếng Việt để sử dụng")
-    parser.add_argument("--format", default="txt", choices=["txt", "srt"], 
-                       help="Định dạng đầu ra (txt hoặc srt)")
+    parser.add_argument("--format", default="txt", choices=["txt", "srt", "vtt", "jsonl"], 
+                       help="Định dạng đầu ra (txt, srt, vtt hoặc jsonl)")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                       help="Không lưu checkpoint (không thể tiếp tục khi bị dừng giữa chừng)")
     parser.add_argument("--compare", action="store_true", 
                        help="So sánh kết quả từ tất cả các mô hình")
     
@@ -248,7 +227,8 @@ if __name__ == "__main__":
             print(f"{'='*50}\n")
             
             model_start_time = time.time()
-            results[model] = transcribe_with_vosk(args.audio_path, model, args.format)
+            results[model] = transcribe_with_vosk(args.audio_path, model, args.format,
+                                                  use_checkpoint=not args.no_checkpoint)
             model_total_time = time.time() - model_start_time
             
             print(f"Tổng thời gian xử lý cho {model}: {model_total_time:.2f} giây")
@@ -261,7 +241,7 @@ if __name__ == "__main__":
             print(f"{'-'*60}")
     else:
         # Chỉ chạy một mô hình được chỉ định
-        transcribe_with_vosk(args.audio_path, args.model, args.format)
+        transcribe_with_vosk(args.audio_path, args.model, args.format, use_checkpoint=not args.no_checkpoint)
     
     script_total_time = time.time() - script_start_time
     print(f"Thời gian chạy toàn bộ script: {script_total_time:.2f} giây")
\ No newline at end of file
@@ -1,11 +1,14 @@
 import torch
 import torchaudio
-import librosa
 import numpy as np
 import argparse
 import os
 import time
 from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio, file_hash, get_duration, TARGET_SAMPLE_RATE
+from checkpoint import TranscriptionCheckpoint
+from transcript_writer import TranscriptWriter
 
 def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-base-vietnamese-250h", output_format="txt"):
     """
@@ -14,7 +17,7 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
     Tham số:
         audio_path (str): Đường dẫn đến file audio cần chuyển đổi
         model_name (str): Tên mô hình hoặc đường dẫn đến mô hình
-        output_format (str): Định dạng đầu ra ("txt" hoặc "srt")
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
     """
     total_start_time = time.time()
     
@@ -35,7 +38,8 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
     # Tải audio
     audio_load_start = time.time()
     print(f"Đang xử lý file audio: {audio_path}")
-    speech_array, sampling_rate = librosa.load(audio_path, sr=16000)
+    speech_array = load_audio(audio_path)
+    sampling_rate = TARGET_SAMPLE_RATE
     audio_load_time = time.time() - audio_load_start
     print(f"Thời gian tải và xử lý audio: {audio_load_time:.2f} giây")
     
@@ -62,16 +66,17 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
     output_start = time.time()
     output_base = os.path.splitext(audio_path)[0]
     
-    # Xử lý cho output SRT nếu cần
-    if output_format == "srt":
-        # Tạo segments cho SRT (đơn giản hóa, vì Wav2Vec 2.0 không trực tiếp trả về thời gian)
+    # Xử lý cho output phụ đề nếu cần
+    if output_format != "txt":
+        # Tạo segments (đơn giản hóa, vì Wav2Vec 2.0 không trực tiếp trả về thời gian)
         # Chúng ta sẽ chia audio thành các đoạn cố định, mỗi đoạn 5 giây
-        duration = librosa.get_duration(y=speech_array, sr=sampling_rate)
+        duration = get_duration(speech_array, sampling_rate)
         segment_duration = 5.0  # 5 giây mỗi segment
         num_segments = int(np.ceil(duration / segment_duration))
         
         segments_start = time.time()
-        with open(f"{output_base}.srt", "w", encoding="utf-8") as f:
+        # Mỗi đoạn được ghi ra file ngay sau khi nhận dạng xong
+        with TranscriptWriter(output_base, [output_format], total_duration=duration) as writer:
             # Nếu muốn phụ đề chi tiết hơn, bạn cần sử dụng thêm các kỹ thuật phân đoạn audio
             # Dưới đây là phiên bản đơn giản
             for i in range(num_segments):
@@ -86,26 +91,12 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
                 # Chỉ xử lý nếu đoạn không quá ngắn
                 if len(segment_audio) > 0.5 * sampling_rate:  # Ít nhất 0.5 giây
                     # Xử lý đoạn audio
-                    segment_input = processor(segment_audio, sampling_rate=16000, return_tensors="pt").input_values
-                    if device == "cuda":
-                        segment_input = segment_input.to(device)
-                    with torch.no_grad():
-                        segment_logits = model(segment_input).logits
-                    segment_ids = torch.argmax(segment_logits, dim=-1)
-                    segment_text = processor.batch_decode(segment_ids)[0]
-                    
-                    # Định dạng thời gian cho SRT
-                    start_formatted = format_time_srt(start_time)
-                    end_formatted = format_time_srt(end_time)
-                    
-                    # Viết vào file SRT
-                    f.write(f"{i+1}\n")
-                    f.write(f"{start_formatted} --> {end_formatted}\n")
-                    f.write(f"{segment_text.strip()}\n\n")
+                    segment_text = decode_window(processor, model, device, segment_audio)
+                    writer.write_segment(start_time, end_time, segment_text)
         
         segments_time = time.time() - segments_start
         print(f"Thời gian tạo phụ đề: {segments_time:.2f} giây")
-        print(f"Đã lưu phụ đề vào: {output_base}.srt")
+        print(f"Đã lưu phụ đề vào: {writer.path(output_format)}")
     
     # Lưu văn bản đầy đủ
     with open(f"{output_base}.txt", "w", encoding="utf-8") as f:
@@ -124,7 +115,7 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
     print(f"Thời gian tokenize: {tokenize_time:.2f} giây")
     print(f"Thời gian inference: {inference_time:.2f} giây")
     print(f"Thời gian xử lý đầu ra: {output_time:.2f} giây")
-    if output_format == "srt":
+    if output_format != "txt":
         print(f"Thời gian tạo phụ đề: {segments_time:.2f} giây")
     print(f"Tổng thời gian xử lý: {total_time:.2f} giây")
     print(f"=============================\n")
@@ -134,25 +125,132 @@ def transcribe_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-bas
     
     return transcription
 
-def format_time_srt(seconds):
-    """Định dạng thời gian theo chuẩn SRT"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    seconds = seconds % 60
-    milliseconds = int((seconds - int(seconds)) * 1000)
-    seconds = int(seconds)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+def decode_window(processor, model, device, segment_audio):
+    """Nhận dạng một đoạn audio ngắn (16kHz) và trả về văn bản"""
+    segment_input = processor(segment_audio, sampling_rate=16000, return_tensors="pt").input_values
+    if device == "cuda":
+        segment_input = segment_input.to(device)
+    with torch.no_grad():
+        segment_logits = model(segment_input).logits
+    segment_ids = torch.argmax(segment_logits, dim=-1)
+    return processor.batch_decode(segment_ids)[0]
+
+def transcribe_long_with_wav2vec2(audio_path, model_name="nguyenvulebinh/wav2vec2-base-vietnamese-250h",
+                                  output_format="txt", segment_duration=5.0, use_checkpoint=True):
+    """
+    Chuyển đổi file audio dài theo từng cửa sổ cố định, có checkpoint để tiếp tục khi bị dừng
+    
+    Khác với transcribe_with_wav2vec2 (chạy một lần trên toàn bộ file), chế độ này không cần
+    giữ toàn bộ logits trong bộ nhớ và ghi từng cửa sổ ra file ngay khi nhận dạng xong.
+    
+    Tham số:
+        audio_path (str): Đường dẫn đến file audio cần chuyển đổi
+        model_name (str): Tên mô hình hoặc đường dẫn đến mô hình
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl"), file .txt luôn được ghi
+        segment_duration (float): Độ dài mỗi cửa sổ (giây)
+        use_checkpoint (bool): Lưu checkpoint để có thể tiếp tục nếu bị dừng giữa chừng
+    """
+    total_start_time = time.time()
+    
+    # Tải audio
+    speech_array = load_audio(audio_path)
+    sampling_rate = TARGET_SAMPLE_RATE
+    duration = get_duration(speech_array, sampling_rate)
+    output_base = os.path.splitext(audio_path)[0]
+    
+    # Checkpoint: nếu lần chạy trước bị dừng giữa chừng, tiếp tục từ cửa sổ đã xử lý
+    checkpoint = None
+    offset = 0.0
+    if use_checkpoint:
+        checkpoint = TranscriptionCheckpoint(
+            output_base,
+            file_hash(audio_path),
+            params={"engine": "wav2vec2", "model": model_name, "segment_duration": segment_duration},
+        )
+        offset = checkpoint.resume_offset
+    
+    formats = ["txt"] if output_format == "txt" else ["txt", output_format]
+    
+    if checkpoint and offset >= duration:
+        # Lần chạy trước đã nhận dạng hết file nhưng bị dừng trước khi xóa checkpoint:
+        # chỉ cần ghi lại kết quả, không tải mô hình
+        with TranscriptWriter(output_base, formats, total_duration=duration, show_progress=False) as writer:
+            for saved in checkpoint.replay():
+                writer.write_segment(**saved)
+            transcription = writer.read_text()
+        checkpoint.finish()
+        print(f"Checkpoint đã bao phủ toàn bộ audio, đã lưu kết quả vào: {writer.path('txt')}")
+        return transcription
+    
+    # Chỉ số cửa sổ đầu tiên chưa xử lý: offset luôn là biên cửa sổ đã xong nên làm tròn xuống
+    # (cộng sai số nhỏ để (i + 1) * segment_duration không bị tính thành cửa sổ i)
+    first_window = int(np.floor(offset / segment_duration + 1e-6))
+    num_segments = int(np.ceil(duration / segment_duration))
+    
+    # Tải mô hình
+    print(f"Đang tải mô hình và processor cho {model_name}...")
+    processor = Wav2Vec2Processor.from_pretrained(model_name)
+    model = Wav2Vec2ForCTC.from_pretrained(model_name)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        model = model.to(device)
+    
+    inference_start = time.time()
+    with TranscriptWriter(output_base, formats, total_duration=duration) as writer:
+        if checkpoint:
+            # Ghi lại các cửa sổ đã hoàn tất từ lần chạy trước
+            writer.show_progress = False
+            for saved in checkpoint.replay():
+                writer.write_segment(**saved)
+            writer.show_progress = True
+        
+        for i in range(first_window, num_segments):
+            start_time = i * segment_duration
+            end_time = min((i + 1) * segment_duration, duration)
+            segment_audio = speech_array[int(start_time * sampling_rate):int(end_time * sampling_rate)]
+            
+            segment_text = ""
+            if len(segment_audio) > 0.5 * sampling_rate:  # Ít nhất 0.5 giây
+                segment_text = decode_window(processor, model, device, segment_audio)
+                writer.write_segment(start_time, end_time, segment_text)
+            
+            if checkpoint:
+                if segment_text.strip():
+                    checkpoint.record(start_time, end_time, segment_text)
+                else:
+                    checkpoint.mark_offset(end_time)
+        transcription = writer.read_text()
+    inference_time = time.time() - inference_start
+    
+    if checkpoint:
+        checkpoint.finish()
+    
+    for fmt in formats:
+        print(f"Đã lưu kết quả vào: {writer.path(fmt)}")
+    print(f"Thời gian inference: {inference_time:.2f} giây")
+    print(f"Tổng thời gian xử lý: {time.time() - total_start_time:.2f} giây")
+    
+    return transcription
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Chuyển đổi audio tiếng Việt thành văn bản với Wav2Vec 2.0")
     parser.add_argument("audio_path", help="Đường dẫn đến file audio")
     parser.add_argument("--model", default="nguyenvulebinh/wav2vec2-base-vietnamese-250h", 
                         help="Tên hoặc đường dẫn đến mô hình Wav2Vec 2.0 cho tiếng Việt")
-    parser.add_argument("--format", default="txt", choices=["txt", "srt"], 
-                        help="Định dạng đầu ra (txt hoặc srt)")
+    parser.add_argument("--format", default="txt", choices=["txt", "srt", "vtt", "jsonl"], 
+                        help="Định dạng đầu ra (txt, srt, vtt hoặc jsonl)")
+    
+    parser.add_argument("--long", action="store_true",
+                        help="Xử lý file dài theo từng cửa sổ 5 giây, có checkpoint để tiếp tục khi bị dừng")
+    parser.add_argument("--no-checkpoint", action="store_true",
+                        help="Không lưu checkpoint khi dùng --long")
     
     script_start_time = time.time()
     args = parser.parse_args()
-    transcribe_with_wav2vec2(args.audio_path, args.model, args.format)
+    if args.long:
+        transcribe_long_with_wav2vec2(args.audio_path, args.model, args.format,
+                                      use_checkpoint=not args.no_checkpoint)
+    else:
+        transcribe_with_wav2vec2(args.audio_path, args.model, args.format)
     script_total_time = time.time() - script_start_time
     print(f"Thời gian chạy toàn bộ script: {script_total_time:.2f} giây")
\ No newline at end of file
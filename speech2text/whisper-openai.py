@@ -1,4 +1,7 @@
 import whisper
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from audio_io import load_audio
+from transcript_writer import TranscriptWriter
 import os
 import argparse
 import time
@@ -11,7 +14,7 @@ def transcribe_audio(audio_path, model_size="base", language=None, output_format
         audio_path (str): Đường dẫn đến file audio cần chuyển đổi
         model_size (str): Kích thước mô hình ("tiny", "base", "small", "medium", "large")
         language (str): Mã ngôn ngữ (vd: "vi" cho tiếng Việt, "en" cho tiếng Anh, None để tự động phát hiện)
-        output_format (str): Định dạng đầu ra ("txt" hoặc "srt")
+        output_format (str): Định dạng đầu ra ("txt", "srt", "vtt" hoặc "jsonl")
     """
     print(f"Đang tải mô hình Whisper {model_size}...")
     load_start_time = time.time()
@@ -28,7 +31,8 @@ def transcribe_audio(audio_path, model_size="base", language=None, output_format
     
     # Thực hiện chuyển đổi
     transcribe_start_time = time.time()
-    result = model.transcribe(audio_path, **transcribe_options)
+    # Whisper đưa mảng vào torch.from_numpy, cần mảng ghi được (mảng từ cache là chỉ đọc)
+    result = model.transcribe(load_audio(audio_path).copy(), **transcribe_options)
     transcribe_time = time.time() - transcribe_start_time
     print(f"Thời gian chuyển đổi: {transcribe_time:.2f} giây")
     
@@ -38,23 +42,10 @@ def transcribe_audio(audio_path, model_size="base", language=None, output_format
     # Lưu kết quả vào file
     output_path = os.path.splitext(audio_path)[0]
     
-    if output_format == "txt":
-        with open(f"{output_path}.txt", "w", encoding="utf-8") as f:
-            f.write(text)
-        print(f"Đã lưu văn bản vào: {output_path}.txt")
-    elif output_format == "srt":
-        import datetime
-        with open(f"{output_path}.srt", "w", encoding="utf-8") as f:
-            for i, segment in enumerate(result["segments"], start=1):
-                # Chuyển đổi thời gian từ giây sang định dạng SRT
-                start_time = str(datetime.timedelta(seconds=segment["start"])).replace(".", ",")[:11]
-                end_time = str(datetime.timedelta(seconds=segment["end"])).replace(".", ",")[:11]
-                
-                # Viết segment vào file SRT
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"{segment['text'].strip()}\n\n")
-        print(f"Đã lưu phụ đề vào: {output_path}.srt")
+    with TranscriptWriter(output_path, [output_format], show_progress=False) as writer:
+        for segment in result["segments"]:
+            writer.write_segment(segment["start"], segment["end"], segment["text"])
+    print(f"Đã lưu kết quả vào: {writer.path(output_format)}")
     
     # Tổng thời gian
     total_time = load_time + transcribe_time
@@ -71,8 +62,8 @@ if __name__ == "__main__":
     parser.add_argument("--model", default="base", choices=["tiny", "base", "small", "medium", "large"], 
                         help="Kích thước mô hình Whisper")
     parser.add_argument("--language", default=None, help="Mã ngôn ngữ (vd: 'vi' cho tiếng Việt, 'en' cho tiếng Anh)")
-    parser.add_argument("--format", default="txt", choices=["txt", "srt"], 
-                        help="Định dạng đầu ra (txt hoặc srt cho phụ đề)")
+    parser.add_argument("--format", default="txt", choices=["txt", "srt", "vtt", "jsonl"], 
+                        help="Định dạng đầu ra (txt, hoặc srt/vtt/jsonl cho phụ đề)")
     
     args = parser.parse_args()
     
@@ -1,8 +1,9 @@
-import requests
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 import time
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from http_client import get_client
 load_dotenv()
 
 def text_to_speech_elevenlabs(text, voice_id, api_key, output_path="output.mp3"):
@@ -40,7 +41,8 @@ def text_to_speech_elevenlabs(text, voice_id, api_key, output_path="output.mp3")
     
     print(f"Đang gửi yêu cầu text-to-speech cho văn bản: {text[:50]}...")
     
-    response = requests.post(url, json=data, headers=headers)
+    # Dùng lại kết nối keep-alive, có timeout và tự thử lại khi gặp 429/5xx
+    response = get_client().post(url, json=data, headers=headers, provider="elevenlabs")
     
     if response.status_code == 200:
         # Đảm bảo thư mục tồn tại
@@ -1,26 +1,19 @@
-import requests
 import os
 from dotenv import load_dotenv
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from voice_catalog import VoiceCatalog, fetch_dupdub
 
 load_dotenv()
 
 # API key
 api_key = os.getenv("api_dupdub")
-# API endpoint for query the speaker id
-url = "https://moyin-gateway.dupdub.com/tts/v1/storeSpeakerV2/searchSpeakerList?language={language}"
 
-# Your API key
+# Tải danh sách giọng qua catalog dùng chung: kết quả được ghi vào cache để chatbot dùng lại
+catalog = VoiceCatalog({"dupdub": lambda: fetch_dupdub(api_key, language="Vietnamese")})
 
-headers = {
-    "dupdub_token": f"{api_key}",
-    "Content-Type": "application/json"
-}
-
-response = requests.get(url.format(language="Vietnamese"), headers=headers)
-
-# Parse the response
-if response.status_code == 200:
-    result = response.json()
-    print(result)
+if catalog.refresh(["dupdub"], force=True):
+    # Danh sách gồm cả các giọng có sẵn trong SEED_VOICES
+    for name, speaker in sorted(catalog.voices("dupdub").items()):
+        print(f"{name}: {speaker}")
 else:
-    print("Failed to query voiceover actor information. Status Code:", response.status_code)
\ No newline at end of file
+    print("Failed to query voiceover actor information.")
@@ -1,23 +1,18 @@
-from elevenlabs import ElevenLabs
 import os
 from dotenv import load_dotenv
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from voice_catalog import VoiceCatalog, fetch_elevenlabs
 
 load_dotenv()
-client = ElevenLabs(
-    api_key= os.getenv("api_text2speech"),
-)
+api_key = os.getenv("api_text2speech") or os.getenv("ELEVEN_API_KEY")
 
-try:
-    voices = client.voices.search(include_total_count=True)
-    print("Kết quả tìm kiếm:", voices)
-    
-    # Nếu voices là một đối tượng phức tạp, có thể cần kiểm tra thuộc tính của nó
-    if hasattr(voices, 'voices'):
-        print("Danh sách voices:", voices.voices)
-    
-    # Nếu là dictionary
-    if isinstance(voices, dict) and 'voices' in voices:
-        print("Danh sách voices:", voices['voices'])
-        
-except Exception as e:
-    print(f"Có lỗi xảy ra: {e}")
\ No newline at end of file
+# Tải danh sách giọng qua catalog dùng chung: kết quả được ghi vào cache để chatbot dùng lại
+catalog = VoiceCatalog({"elevenlabs": lambda: fetch_elevenlabs(api_key)})
+
+if catalog.refresh(["elevenlabs"], force=True):
+    # Danh sách gồm cả các giọng có sẵn trong SEED_VOICES
+    print("Danh sách voices:")
+    for name, voice_id in sorted(catalog.voices("elevenlabs").items()):
+        print(f"{name}: {voice_id}")
+else:
+    print("Không tải được danh sách giọng ElevenLabs")
@@ -1,31 +1,93 @@
 import os
+import gc
+import queue
 import string
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import soundfile as sf
 import torch
-import torchaudio
 from datetime import datetime
 from tqdm import tqdm
-from underthesea import sent_tokenize
 from unidecode import unidecode
+import _common  # noqa: F401 - thêm common/ vào sys.path
+from voice_store import VoiceLatentStore, model_version
+import text_frontend
+import xtts_profile
 
 try:
-    from vinorm import TTSnorm
     from TTS.tts.configs.xtts_config import XttsConfig
     from TTS.tts.models.xtts import Xtts
 except:
     print("Không thể import một số thư viện cần thiết")
 
+# Đối tượng TextToSpeech mà các worker văn bản dài kế thừa qua fork (model đã nạp, không cần pickle)
+_long_form_tts = None
+
+def _init_long_form_worker(num_threads, warmup):
+    """Chia CPU giữa các worker để tổng số luồng không vượt quá số nhân, rồi warm-up trong worker"""
+    torch.set_num_threads(num_threads)
+    if warmup:
+        _long_form_tts._warmup()
+
+def _trim_silence(wav, sample_rate=24000, threshold=0.01, pad_seconds=0.05):
+    """Cắt khoảng lặng ở hai đầu đoạn âm thanh, giữ lại pad_seconds để không mất âm đầu/cuối"""
+    voiced = np.flatnonzero(np.abs(wav) > threshold)
+    if len(voiced) == 0:
+        return wav[:0]
+    pad = int(pad_seconds * sample_rate)
+    return wav[max(0, voiced[0] - pad):voiced[-1] + pad + 1]
+
+def _synthesize_long_form_unit(job):
+    """Sinh âm thanh cho một nhóm câu trong tiến trình worker"""
+    segment, gpt_cond_latent, speaker_embedding, lang_code, params = job
+    tts = _long_form_tts
+    wav_chunk = tts.model.inference(
+        text=segment,
+        language=lang_code,
+        gpt_cond_latent=gpt_cond_latent,
+        speaker_embedding=speaker_embedding,
+        **params,
+    )
+    wav = wav_chunk["wav"]
+    if isinstance(wav, torch.Tensor):
+        wav = wav.detach().cpu().numpy()
+    wav = np.asarray(wav, dtype=np.float32).reshape(-1)
+    
+    keep_len = tts._calculate_keep_len(segment, lang_code)
+    if keep_len > 0 and len(wav) > keep_len:
+        wav = wav[:keep_len]
+    return _trim_silence(wav)
+
 class TextToSpeech:
-    def __init__(self, model_path="model", device=None):
+    def __init__(self, model_path="model", device=None, voice_cache_dir="voice_cache", voices_dir="voices",
+                 profile=None, warmup=True, long_form_workers=0):
         """
         Khởi tạo module Text to Speech với XTTS
         
         Args:
             model_path (str): Đường dẫn đến thư mục chứa model
             device (str, optional): Thiết bị để chạy model ("cuda" hoặc "cpu")
+            voice_cache_dir (str): Thư mục lưu conditioning latents của các giọng mẫu
+            voices_dir (str): Thư mục giọng mẫu được tính latents sẵn khi khởi động
+            profile (str, optional): Cấu hình inference trên CPU (xem xtts_profile.PROFILES),
+                mặc định lấy từ biến môi trường XTTS_PROFILE
+            warmup (bool): Chạy một lần tổng hợp khi khởi động để request đầu tiên không bị chậm
+            long_form_workers (int): Số tiến trình worker cho text_to_speech_long (0 = không dùng,
+                chỉ hỗ trợ CPU). Các worker được fork ngay sau khi nạp model, trước lần inference
+                đầu tiên; sau đó tiến trình hiện tại chỉ chạy torch một luồng
         """
         self.model_path = model_path
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
+        self.profile_name = profile
+        self.long_form_pool = None
+        if long_form_workers and self.device != "cpu":
+            # CUDA không dùng được trong tiến trình con sau khi fork
+            print("Chế độ song song chỉ hỗ trợ CPU, text_to_speech_long sẽ chạy tuần tự")
+            long_form_workers = 0
+        self.long_form_workers = long_form_workers
         self.language_code_map = {
             "vietnamese": "vi",
             "english": "en",
@@ -55,6 +117,20 @@ class TextToSpeech:
         
         # Tự động load model
         self._load_model()
+        
+        # Latents của giọng mẫu được tính một lần, lưu trong bộ nhớ và trên đĩa
+        self.voice_store = VoiceLatentStore(self.model, model_version(self.model_path), cache_dir=voice_cache_dir)
+        
+        # Fork worker văn bản dài trước mọi lần inference (kể cả tính latents và warm-up bên dưới)
+        if self.long_form_workers:
+            self._start_long_form_pool(warmup)
+        
+        ready = self.voice_store.precompute(list(self.voices.values()) + [voices_dir])
+        print(f"Đã chuẩn bị latents cho {ready} giọng mẫu")
+        
+        # Khi có worker văn bản dài, warm-up đã chạy trong từng worker
+        if warmup and self.long_form_pool is None:
+            self._warmup()
     
     def _clear_gpu_cache(self):
         """Xóa bộ nhớ cache GPU nếu đang sử dụng CUDA"""
@@ -84,12 +160,53 @@ class TextToSpeech:
             
             if self.device == "cuda":
                 self.model.cuda()
+            
+            # Lượng tử hóa / số luồng / biên dịch theo cấu hình đã chọn. Tiến trình sẽ fork ra
+            # worker thì chỉ chạy một luồng: thread pool OpenMP/MKL tạo trước khi fork có thể làm worker treo
+            self.profile = xtts_profile.apply_profile(self.model, self.profile_name, self.device,
+                                                      num_threads=1 if self.long_form_workers else None)
                 
             print("Đã nạp mô hình thành công!")
         except Exception as e:
             print(f"Lỗi khi nạp mô hình XTTS: {str(e)}")
             raise
     
+    def _start_long_form_pool(self, warmup):
+        """Fork các worker văn bản dài (dùng chung trọng số model theo copy-on-write)"""
+        global _long_form_tts
+        
+        threads_per_worker = max(1, xtts_profile.available_cpus() // self.long_form_workers)
+        _long_form_tts = self
+        # Đưa các object hiện có ra khỏi vùng quét của GC để worker không sao chép các trang bộ nhớ của model
+        gc.collect()
+        gc.freeze()
+        try:
+            ctx = multiprocessing.get_context("fork")
+            self.long_form_pool = ctx.Pool(self.long_form_workers, initializer=_init_long_form_worker,
+                                           initargs=(threads_per_worker, warmup))
+        finally:
+            gc.unfreeze()
+        print(f"Đã khởi động {self.long_form_workers} worker văn bản dài ({threads_per_worker} luồng mỗi worker)")
+    
+    def close(self):
+        """Dừng các worker văn bản dài (nếu có)"""
+        if self.long_form_pool is not None:
+            self.long_form_pool.terminate()
+            self.long_form_pool.join()
+            self.long_form_pool = None
+    
+    def _warmup(self):
+        """Chạy thử một câu với giọng mặc định để khởi tạo kernel và bộ nhớ trước request đầu tiên"""
+        voice_path = self.voices.get("vi_female")
+        if not voice_path or not os.path.exists(voice_path):
+            print("Bỏ qua warm-up: không tìm thấy giọng mẫu mặc định")
+            return
+        try:
+            gpt_cond_latent, speaker_embedding = self.voice_store.get_latents(voice_path)
+            xtts_profile.warmup(self.model, gpt_cond_latent, speaker_embedding)
+        except Exception as e:
+            print(f"Lỗi khi warm-up XTTS: {e}")
+    
     def get_available_voices(self):
         """
         Lấy danh sách giọng nói có sẵn
@@ -147,72 +264,68 @@ class TextToSpeech:
             return 13000 * word_count + 2000 * num_punct
         return -1
     
-    def _normalize_vietnamese_text(self, text):
+    def _group_sentences(self, sentences, max_chars):
         """
-        Chuẩn hóa văn bản tiếng Việt
+        Gộp các câu ngắn liền nhau vào một lần inference
         
         Args:
-            text (str): Văn bản cần chuẩn hóa
+            sentences (list): Danh sách câu
+            max_chars (int): Độ dài tối đa (ký tự) của một nhóm câu
             
         Returns:
-            str: Văn bản đã chuẩn hóa
+            generator: Các đoạn văn bản, mỗi đoạn ứng với một lần gọi model
         """
-        try:
-            text = (
-                TTSnorm(text, unknown=False, lower=False, rule=True)
-                .replace("..", ".")
-                .replace("!.", "!")
-                .replace("?.", "?")
-                .replace(" .", ".")
-                .replace(" ,", ",")
-                .replace('"', "")
-                .replace("'", "")
-                .replace("AI", "Ây Ai")
-                .replace("A.I", "Ây Ai")
-                .replace("+", "cộng")
-                .replace("-", "trừ")
-                .replace("*", "nhân")
-                .replace("/", "chia")
-                .replace("=", "bằng")
-            )
-            return text
-        except Exception:
-            print("Lỗi khi chuẩn hóa văn bản tiếng Việt, sử dụng văn bản gốc")
-            return text
+        group = ""
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if group and len(group) + 1 + len(sentence) <= max_chars:
+                group = f"{group} {sentence}"
+            else:
+                if group:
+                    yield group
+                group = sentence
+        if group:
+            yield group
     
-    def text_to_speech(self, text, language="vietnamese", voice_name=None, voice_path=None, 
-                       output_path=None, normalize_text=True, output_chunks=False,
-                       temperature=0.3, length_penalty=1.0, repetition_penalty=10.0,
-                       top_k=30, top_p=0.85):
+    def _iter_text_units(self, text, lang_code, normalize_text=True, batch_max_chars=0):
         """
-        Chuyển đổi văn bản thành giọng nói sử dụng model XTTS
+        Chuẩn hóa và tách câu theo từng đoạn văn, để câu đầu tiên sẵn sàng cho inference sớm nhất
         
         Args:
-            text (str): Văn bản cần chuyển đổi
-            language (str): Ngôn ngữ của văn bản
-            voice_path (str): Đường dẫn đến file giọng mẫu
-            output_path (str): Đường dẫn lưu file audio
-            normalize_text (bool): Có chuẩn hóa văn bản hay không
-            output_chunks (bool): Có lưu từng đoạn âm thanh riêng lẻ không
-            temperature (float): Nhiệt độ cho quá trình sinh âm thanh
-            length_penalty (float): Hệ số điều chỉnh độ dài
-            repetition_penalty (float): Hệ số điều chỉnh sự lặp lại
-            top_k (int): Tham số top_k cho việc sinh âm thanh
-            top_p (float): Tham số top_p cho việc sinh âm thanh
+            text (str): Văn bản đầu vào
+            lang_code (str): Mã ngôn ngữ
+            normalize_text (bool): Có chuẩn hóa văn bản tiếng Việt hay không
+            batch_max_chars (int): Gộp câu ngắn đến tối đa số ký tự này (0 = không gộp)
             
         Returns:
-            str: Đường dẫn đến file audio hoặc None nếu lỗi
+            generator: Các đoạn văn bản đưa vào model
         """
-        if self.model is None:
-            raise ValueError("Model chưa được nạp")
-        
-        # Xử lý ngôn ngữ
+        for paragraph in text.splitlines():
+            if not paragraph.strip():
+                continue
+            # Kết quả chuẩn hóa + tách câu được cache theo đoạn văn
+            sentences = text_frontend.prepare(paragraph, lang_code, normalize_text)
+            if batch_max_chars > 0:
+                yield from self._group_sentences(sentences, batch_max_chars)
+            else:
+                yield from sentences
+    
+    def _resolve_language(self, language):
+        """Chuyển tên ngôn ngữ (vd: "vietnamese") sang mã ngôn ngữ của XTTS"""
         lang = language.lower()
         if lang in self.language_code_map:
-            lang_code = self.language_code_map[lang]
-        else:
-            lang_code = lang  # Giả sử người dùng đã nhập mã ngôn ngữ
+            return self.language_code_map[lang]
+        return lang  # Giả sử người dùng đã nhập mã ngôn ngữ
+    
+    def _resolve_voice_path(self, lang_code, language, voice_name=None, voice_path=None):
+        """
+        Xác định file giọng mẫu từ voice_name hoặc voice_path
         
+        Returns:
+            str: Đường dẫn đến file giọng mẫu tồn tại
+        """
         # Xử lý voice_name và voice_path
         if voice_path is None and voice_name is None:
             # Không có cả voice_name và voice_path
@@ -249,83 +362,144 @@ class TextToSpeech:
             else:
                 raise ValueError(f"Không tìm thấy file giọng mẫu: {voice_path}")
         
-        # Xử lý output path
-        if output_path is None:
-            output_dir = "./output"
-            os.makedirs(output_dir, exist_ok=True)
-            output_path = os.path.join(output_dir, f"{self._get_file_name(text)}.wav")
+        return voice_path
+    
+    def _write_chunks(self, audio_queue, output_path, lang_code, output_chunks, errors):
+        """
+        Luồng ghi: cắt, lưu từng đoạn (nếu cần) và ghi nối tiếp vào file kết quả ngay khi có audio
         
+        Args:
+            audio_queue (queue.Queue): Hàng đợi (đoạn văn bản, wav), None để kết thúc
+            output_path (str): Đường dẫn file kết quả
+            lang_code (str): Mã ngôn ngữ
+            output_chunks (bool): Có lưu từng đoạn âm thanh riêng lẻ không
+            errors (list): Nơi ghi lại lỗi để luồng chính xử lý
+        """
+        out = None
         try:
-            # Lấy conditioning latents từ file giọng mẫu
-            gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
-                audio_path=voice_path,
-                gpt_cond_len=self.model.config.gpt_cond_len,
-                max_ref_length=self.model.config.max_ref_len,
-                sound_norm_refs=self.model.config.sound_norm_refs,
-            )
-            
-            # Chuẩn hóa văn bản nếu cần
-            if normalize_text and lang_code == "vi":
-                text = self._normalize_vietnamese_text(text)
-            
-            # Tách văn bản thành các câu
-            if lang_code in ["ja", "zh-cn"]:
-                text_segments = text.split("。")
-            else:
-                text_segments = sent_tokenize(text)
-            
-            # Sinh âm thanh cho từng đoạn văn bản
-            wav_chunks = []
-            for segment in tqdm(text_segments):
-                if segment.strip() == "":
-                    continue
-                
-                wav_chunk = self.model.inference(
-                    text=segment,
-                    language=lang_code,
-                    gpt_cond_latent=gpt_cond_latent,
-                    speaker_embedding=speaker_embedding,
-                    temperature=temperature,
-                    length_penalty=length_penalty,
-                    repetition_penalty=repetition_penalty,
-                    top_k=top_k,
-                    top_p=top_p,
-                )
+            for segment, wav in iter(audio_queue.get, None):
+                if isinstance(wav, torch.Tensor):
+                    wav = wav.detach().cpu().numpy()
+                wav = np.asarray(wav, dtype=np.float32).reshape(-1)
                 
-                # Chuyển đổi sang tensor và cắt âm thanh nếu cần
+                # Cắt âm thanh nếu cần
                 keep_len = self._calculate_keep_len(segment, lang_code)
-                if keep_len > 0 and len(wav_chunk["wav"]) > keep_len:
-                    wav = wav_chunk["wav"][:keep_len]
-                else:
-                    wav = wav_chunk["wav"]
-                
-                # Đảm bảo là tensor
-                if not isinstance(wav, torch.Tensor):
-                    wav = torch.tensor(wav)
+                if keep_len > 0 and len(wav) > keep_len:
+                    wav = wav[:keep_len]
                 
                 # Lưu từng đoạn nếu cần
                 if output_chunks:
                     chunk_dir = os.path.dirname(output_path)
                     chunk_name = f"{self._get_file_name(segment)}.wav"
-                    chunk_path = os.path.join(chunk_dir, chunk_name)
-                    torchaudio.save(chunk_path, wav.unsqueeze(0), 24000)
+                    sf.write(os.path.join(chunk_dir, chunk_name), wav, 24000, subtype="FLOAT")
                 
-                wav_chunks.append(wav)
+                if out is None:
+                    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                    out = sf.SoundFile(output_path, "w", samplerate=24000, channels=1, subtype="FLOAT")
+                out.write(wav)
+        except Exception as e:
+            errors.append(e)
+            # Tiếp tục lấy hết hàng đợi để luồng inference không bị chặn
+            for _ in iter(audio_queue.get, None):
+                pass
+        finally:
+            if out is not None:
+                out.close()
+    
+    def text_to_speech(self, text, language="vietnamese", voice_name=None, voice_path=None, 
+                       output_path=None, normalize_text=True, output_chunks=False,
+                       temperature=0.3, length_penalty=1.0, repetition_penalty=10.0,
+                       top_k=30, top_p=0.85, batch_max_chars=0):
+        """
+        Chuyển đổi văn bản thành giọng nói sử dụng model XTTS
+        
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            language (str): Ngôn ngữ của văn bản
+            voice_path (str): Đường dẫn đến file giọng mẫu
+            output_path (str): Đường dẫn lưu file audio
+            normalize_text (bool): Có chuẩn hóa văn bản hay không
+            output_chunks (bool): Có lưu từng đoạn âm thanh riêng lẻ không
+            temperature (float): Nhiệt độ cho quá trình sinh âm thanh
+            length_penalty (float): Hệ số điều chỉnh độ dài
+            repetition_penalty (float): Hệ số điều chỉnh sự lặp lại
+            top_k (int): Tham số top_k cho việc sinh âm thanh
+            top_p (float): Tham số top_p cho việc sinh âm thanh
+            batch_max_chars (int): Gộp các câu ngắn liền nhau thành một lần inference, tối đa số
+                ký tự này (mặc định 0 = mỗi câu một lần inference, giữ nguyên ngữ điệu từng câu)
             
-            # Đảm bảo tất cả các đoạn là tensors
-            tensor_chunks = []
-            for chunk in wav_chunks:
-                if not isinstance(chunk, torch.Tensor):
-                    chunk = torch.tensor(chunk)
-                tensor_chunks.append(chunk)
-                
-            # Ghép các đoạn âm thanh và lưu kết quả
-            if tensor_chunks:
-                out_wav = torch.cat(tensor_chunks, dim=0).unsqueeze(0)
-                # Đảm bảo thư mục đầu ra tồn tại
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                torchaudio.save(output_path, out_wav, 24000)
-            else:
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        
+        Chuẩn hóa/tách câu, inference và ghi file chạy song song theo dạng pipeline: luồng
+        front-end chuẩn bị câu tiếp theo và luồng ghi xử lý đoạn đã xong trong khi model
+        đang sinh âm thanh cho câu hiện tại.
+        """
+        if self.model is None:
+            raise ValueError("Model chưa được nạp")
+        
+        lang_code = self._resolve_language(language)
+        voice_path = self._resolve_voice_path(lang_code, language, voice_name, voice_path)
+        
+        # Xử lý output path
+        if output_path is None:
+            output_dir = "./output"
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{self._get_file_name(text)}.wav")
+        
+        try:
+            # Lấy conditioning latents từ cache (chỉ tính lại khi file giọng mẫu thay đổi)
+            gpt_cond_latent, speaker_embedding = self.voice_store.get_latents(voice_path)
+            
+            # Front-end: chuẩn hóa và tách câu trên luồng riêng, đưa dần vào hàng đợi
+            text_queue = queue.Queue()
+            audio_queue = queue.Queue()
+            errors = []
+            
+            def produce_text_units():
+                try:
+                    for unit in self._iter_text_units(text, lang_code, normalize_text, batch_max_chars):
+                        text_queue.put(unit)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    text_queue.put(None)
+            
+            frontend = threading.Thread(target=produce_text_units, daemon=True)
+            writer = threading.Thread(
+                target=self._write_chunks,
+                args=(audio_queue, output_path, lang_code, output_chunks, errors),
+                daemon=True,
+            )
+            frontend.start()
+            writer.start()
+            
+            # Inference trên luồng hiện tại (model không dùng chung an toàn giữa các luồng)
+            num_units = 0
+            try:
+                for segment in tqdm(iter(text_queue.get, None)):
+                    if errors:
+                        break
+                    wav_chunk = self.model.inference(
+                        text=segment,
+                        language=lang_code,
+                        gpt_cond_latent=gpt_cond_latent,
+                        speaker_embedding=speaker_embedding,
+                        temperature=temperature,
+                        length_penalty=length_penalty,
+                        repetition_penalty=repetition_penalty,
+                        top_k=top_k,
+                        top_p=top_p,
+                    )
+                    audio_queue.put((segment, wav_chunk["wav"]))
+                    num_units += 1
+            finally:
+                audio_queue.put(None)
+                writer.join()
+            
+            if errors:
+                raise errors[0]
+            if num_units == 0:
                 print("Không có đoạn âm thanh nào được tạo")
             
             return output_path
@@ -334,11 +508,103 @@ class TextToSpeech:
             print(f"Lỗi khi chuyển đổi text to speech: {str(e)}")
             return None
 
+    def text_to_speech_long(self, text, language="vietnamese", voice_name=None, voice_path=None,
+                            output_path=None, normalize_text=True, group_max_chars=200,
+                            gap_seconds=0.3, temperature=0.3, length_penalty=1.0, repetition_penalty=10.0,
+                            top_k=30, top_p=0.85):
+        """
+        Chuyển đổi văn bản dài (bài giảng, truyện) bằng nhiều tiến trình XTTS song song trên CPU
+        
+        Văn bản được chia thành các nhóm câu, phân phối cho các worker đã fork khi khởi tạo
+        (long_form_workers, dùng chung trọng số model). Kết quả được ghép lại đúng thứ tự vào một
+        file, khoảng lặng ở hai đầu mỗi đoạn được cắt bỏ và thay bằng khoảng nghỉ cố định
+        gap_seconds. Không có worker thì chạy tuần tự bằng text_to_speech.
+        
+        Args:
+            text (str): Văn bản cần chuyển đổi
+            language (str): Ngôn ngữ của văn bản
+            voice_name (str, optional): Tên giọng có sẵn
+            voice_path (str, optional): Đường dẫn đến file giọng mẫu
+            output_path (str, optional): Đường dẫn lưu file audio
+            normalize_text (bool): Có chuẩn hóa văn bản hay không
+            group_max_chars (int): Độ dài tối đa (ký tự) của một nhóm câu
+            gap_seconds (float): Khoảng nghỉ giữa các nhóm câu (giây)
+            temperature, length_penalty, repetition_penalty, top_k, top_p: Tham số sinh âm thanh
+            
+        Returns:
+            str: Đường dẫn đến file audio hoặc None nếu lỗi
+        """
+        if self.model is None:
+            raise ValueError("Model chưa được nạp")
+        
+        params = dict(temperature=temperature, length_penalty=length_penalty,
+                      repetition_penalty=repetition_penalty, top_k=top_k, top_p=top_p)
+        if self.long_form_pool is None:
+            # Fork lúc này (sau khi tiến trình đã chạy inference nhiều luồng) không an toàn
+            print("Không có worker văn bản dài (long_form_workers=0), chuyển sang text_to_speech")
+            return self.text_to_speech(text, language, voice_name, voice_path, output_path,
+                                       normalize_text, batch_max_chars=group_max_chars, **params)
+        
+        lang_code = self._resolve_language(language)
+        voice_path = self._resolve_voice_path(lang_code, language, voice_name, voice_path)
+        
+        if output_path is None:
+            output_dir = "./output"
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, f"{self._get_file_name(text)}.wav")
+        
+        try:
+            gpt_cond_latent, speaker_embedding = self.voice_store.get_latents(voice_path)
+            units = list(self._iter_text_units(text, lang_code, normalize_text, group_max_chars))
+            if not units:
+                print("Không có đoạn âm thanh nào được tạo")
+                return None
+            print(f"Tổng hợp {len(units)} nhóm câu với {self.long_form_workers} worker")
+            
+            # Latents đi kèm từng nhóm câu (vài trăm KB) nên worker dùng được mọi giọng
+            jobs = [(unit, gpt_cond_latent, speaker_embedding, lang_code, params) for unit in units]
+            gap = np.zeros(int(gap_seconds * 24000), dtype=np.float32)
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            
+            with sf.SoundFile(output_path, "w", samplerate=24000, channels=1, subtype="FLOAT") as out:
+                # imap trả kết quả đúng thứ tự nhóm câu, mỗi đoạn được ghi ngay khi các đoạn trước đã xong
+                results = self.long_form_pool.imap(_synthesize_long_form_unit, jobs)
+                for index, wav in enumerate(tqdm(results, total=len(units))):
+                    if index > 0:
+                        out.write(gap)
+                    out.write(wav)
+            
+            return output_path
+        
+        except Exception as e:
+            print(f"Lỗi khi chuyển đổi văn bản dài: {str(e)}")
+            return None
+
 # Ví dụ sử dụng:
 if __name__ == "__main__":
-    tts = TextToSpeech(model_path="model")
-    output_file = tts.text_to_speech(
-        text="1 + 1 có phải bằng 1000 không?, hãy trả lời câu hỏi này giúp tôi nhé",
-        language="vietnamese"
-    )
-    print(f"Đã tạo file âm thanh: {output_file}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chuyển văn bản tiếng Việt thành giọng nói với vixTTS")
+    parser.add_argument("--text", default="1 + 1 có phải bằng 1000 không?, hãy trả lời câu hỏi này giúp tôi nhé",
+                        help="Văn bản cần chuyển đổi")
+    parser.add_argument("--input", help="File văn bản (UTF-8) cần chuyển đổi, dùng thay cho --text")
+    parser.add_argument("--output", help="Đường dẫn file âm thanh đầu ra")
+    parser.add_argument("--voice", help="Tên giọng có sẵn")
+    parser.add_argument("--long", action="store_true",
+                        help="Chế độ văn bản dài: tổng hợp song song bằng nhiều tiến trình trên CPU")
+    parser.add_argument("--workers", type=int, help="Số tiến trình worker khi dùng --long")
+    args = parser.parse_args()
+    
+    text = args.text
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            text = f.read()
+    
+    long_form_workers = (args.workers or max(1, xtts_profile.available_cpus() // 2)) if args.long else 0
+    tts = TextToSpeech(model_path="model", long_form_workers=long_form_workers)
+    if args.long:
+        output_file = tts.text_to_speech_long(text=text, language="vietnamese", voice_name=args.voice,
+                                              output_path=args.output)
+    else:
+        output_file = tts.text_to_speech(text=text, language="vietnamese", voice_name=args.voice,
+                                         output_path=args.output)
+    tts.close()
+    print(f"Đã tạo file âm thanh: {output_file}")